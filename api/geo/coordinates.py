@@ -1,8 +1,19 @@
 from http.server import BaseHTTPRequestHandler
 import json
-import requests
+import os
+import sys
 from urllib.parse import urlparse, parse_qs
 
+# Общий пакет prayer_core лежит в корне проекта
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from prayer_core import gazetteer
+
+# Справочник городов: файл GeoNames и справочник стран (по умолчанию встроенные)
+GAZETTEER_PATH = os.environ.get('GAZETTEER_PATH', gazetteer.DEFAULT_CITIES_PATH)
+GAZETTEER_COUNTRIES_PATH = os.environ.get('GAZETTEER_COUNTRIES_PATH', gazetteer.DEFAULT_COUNTRIES_PATH)
+# Дальше этого (км) от ближайшего города место по координатам не называется городом
+GAZETTEER_MAX_DISTANCE_KM = float(os.environ.get('GAZETTEER_MAX_DISTANCE_KM', gazetteer.NEAREST_MAX_KM))
+
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
         try:
@@ -29,37 +40,14 @@ class handler(BaseHTTPRequestHandler):
                 if not (-90 <= lat_float <= 90 and -180 <= lng_float <= 180):
                     raise ValueError("Invalid coordinates")
                 
-                # Получаем информацию о местоположении по координатам
-                try:
-                    # Используем публичный API для получения обратного геокодирования
-                    reverse_geo_url = f"https://nominatim.openstreetmap.org/reverse?format=json&lat={latitude}&lon={longitude}&zoom=10"
-                    headers = {'User-Agent': 'PrayerTimesApp/1.0'}
-                    
-                    geo_response = requests.get(reverse_geo_url, headers=headers, timeout=3)
-                    geo_data = geo_response.json()
-                    
-                    if geo_response.status_code == 200 and 'address' in geo_data:
-                        address = geo_data['address']
-                        city = address.get('city', address.get('town', address.get('village', address.get('hamlet', 'Unknown'))))
-                        
-                        location = {
-                            "name": city,
-                            "country": address.get('country', 'Unknown'),
-                            "latitude": lat_float,
-                            "longitude": lng_float,
-                            "value": f"{city.lower()}-{address.get('country_code', '').lower()}"
-                        }
-                    else:
-                        # Если не удалось получить информацию о местоположении, создаем базовое
-                        location = {
-                            "name": "Unknown Location",
-                            "country": "Unknown",
-                            "latitude": lat_float,
-                            "longitude": lng_float,
-                            "value": f"unknown-{lat_float}-{lng_float}"
-                        }
-                except:
-                    # В случае ошибки при запросе API создаем базовую информацию
+                # Ближайший город из локального справочника (k-d дерево строится
+                # при первом запросе и остается в памяти экземпляра функции);
+                # дальше GAZETTEER_MAX_DISTANCE_KM от городов - неизвестное место
+                places = gazetteer.load(GAZETTEER_PATH, GAZETTEER_COUNTRIES_PATH)
+                location = places.nearest(lat_float, lng_float, GAZETTEER_MAX_DISTANCE_KM)
+                if location is not None:
+                    location = dict(location, latitude=lat_float, longitude=lng_float)
+                else:
                     location = {
                         "name": "Unknown Location",
                         "country": "Unknown",
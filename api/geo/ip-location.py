@@ -1,6 +1,24 @@
 from http.server import BaseHTTPRequestHandler
 import json
-import requests
+import os
+import sys
+
+# Общий пакет prayer_core лежит в корне проекта
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from prayer_core import gazetteer
+from prayer_core.ipdb import IPDatabase, TrustedProxies, client_ip
+
+# База IP-диапазонов (собирается python -m prayer_core.ipdb) и справочник стран
+IP_DB_PATH = os.environ.get('IP_DB_PATH', os.path.join(gazetteer.DATA_DIR, 'ip-location.bin'))
+GAZETTEER_COUNTRIES_PATH = os.environ.get('GAZETTEER_COUNTRIES_PATH', gazetteer.DEFAULT_COUNTRIES_PATH)
+# Прокси, которым доверяется X-Forwarded-For: до функции запрос доходит
+# только через прокси Vercel, а он перезаписывает заголовок сам
+TRUSTED_PROXIES = os.environ.get('TRUSTED_PROXIES', '*')
+
+# База отображается в память один раз на экземпляр функции
+ip_database = IPDatabase(IP_DB_PATH) if os.path.exists(IP_DB_PATH) else None
+countries = gazetteer.read_countries(GAZETTEER_COUNTRIES_PATH)
+trusted_proxies = TrustedProxies(TRUSTED_PROXIES)
 
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
@@ -14,24 +32,22 @@ class handler(BaseHTTPRequestHandler):
                 "value": "mecca-saudi-arabia"
             }
             
-            try:
-                # Пытаемся получить информацию о местоположении по IP через публичный API
-                ip_response = requests.get('https://ipapi.co/json/', timeout=3)
-                ip_data = ip_response.json()
-                
-                if ip_response.status_code == 200 and 'latitude' in ip_data and 'longitude' in ip_data:
-                    # Если удалось получить информацию о местоположении
-                    location = {
-                        "name": ip_data.get('city', 'Unknown'),
-                        "country": ip_data.get('country_name', 'Unknown'),
-                        "latitude": ip_data.get('latitude', 0),
-                        "longitude": ip_data.get('longitude', 0),
-                        "value": f"{ip_data.get('city', 'unknown').lower()}-{ip_data.get('country_code', 'unknown').lower()}"
-                    }
-                else:
-                    location = default_location
-            except:
-                # В случае ошибки при запросе к API, возвращаем значение по умолчанию
+            # Адрес клиента: Vercel передает его в X-Forwarded-For
+            address = client_ip(self.headers.get('X-Forwarded-For'), self.client_address[0], trusted_proxies)
+            found = ip_database.lookup(address) if ip_database is not None else None
+            
+            if found is not None:
+                country_code, city, latitude, longitude = found
+                country = countries.get(country_code, (country_code,))[0]
+                location = {
+                    "name": city or country,
+                    "country": country,
+                    "countryCode": country_code,
+                    "latitude": latitude,
+                    "longitude": longitude,
+                    "value": f"{gazetteer.slug(city or country)}-{gazetteer.slug(country)}"
+                }
+            else:
                 location = default_location
             
             # Отправляем ответ
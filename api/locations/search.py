@@ -1,88 +1,23 @@
 from http.server import BaseHTTPRequestHandler
 import json
+import os
+import sys
 from urllib.parse import parse_qs
 
-def get_popular_locations():
-    """Возвращает список популярных местоположений."""
-    return [
-        {
-            "name": "Mecca",
-            "country": "Saudi Arabia",
-            "latitude": 21.4225,
-            "longitude": 39.8262,
-            "value": "mecca-saudi-arabia"
-        },
-        {
-            "name": "Medina",
-            "country": "Saudi Arabia",
-            "latitude": 24.5247,
-            "longitude": 39.5692,
-            "value": "medina-saudi-arabia"
-        },
-        {
-            "name": "Jerusalem",
-            "country": "Palestine",
-            "latitude": 31.7683,
-            "longitude": 35.2137,
-            "value": "jerusalem-palestine"
-        },
-        {
-            "name": "Istanbul",
-            "country": "Turkey",
-            "latitude": 41.0082,
-            "longitude": 28.9784,
-            "value": "istanbul-turkey"
-        },
-        {
-            "name": "Cairo",
-            "country": "Egypt",
-            "latitude": 30.0444,
-            "longitude": 31.2357,
-            "value": "cairo-egypt"
-        },
-        {
-            "name": "Dubai",
-            "country": "UAE",
-            "latitude": 25.2048,
-            "longitude": 55.2708,
-            "value": "dubai-uae"
-        },
-        {
-            "name": "Kuala Lumpur",
-            "country": "Malaysia",
-            "latitude": 3.1390,
-            "longitude": 101.6869,
-            "value": "kuala-lumpur-malaysia"
-        },
-        {
-            "name": "New York",
-            "country": "USA",
-            "latitude": 40.7128,
-            "longitude": -74.0060,
-            "value": "new-york-usa"
-        },
-        {
-            "name": "London",
-            "country": "UK",
-            "latitude": 51.5074,
-            "longitude": -0.1278,
-            "value": "london-uk"
-        },
-        {
-            "name": "Moscow",
-            "country": "Russia",
-            "latitude": 55.7558,
-            "longitude": 37.6173,
-            "value": "moscow-russia"
-        }
-    ]
+# Общий пакет prayer_core лежит в корне проекта
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from prayer_core import gazetteer
+
+# Справочник городов: файл GeoNames и справочник стран (по умолчанию встроенные)
+GAZETTEER_PATH = os.environ.get('GAZETTEER_PATH', gazetteer.DEFAULT_CITIES_PATH)
+GAZETTEER_COUNTRIES_PATH = os.environ.get('GAZETTEER_COUNTRIES_PATH', gazetteer.DEFAULT_COUNTRIES_PATH)
 
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
         try:
             # Разбор параметров запроса
             query_components = parse_qs(self.path.split('?')[1]) if '?' in self.path else {}
-            query = query_components.get('q', [''])[0].lower()
+            query = query_components.get('q', [''])[0]
             
             if not query:
                 self.send_response(200)
@@ -92,20 +27,15 @@ class handler(BaseHTTPRequestHandler):
                 self.wfile.write(json.dumps([]).encode('utf-8'))
                 return
             
-            # Поиск по списку популярных мест
-            popular_locations = get_popular_locations()
-            results = []
-            
-            for location in popular_locations:
-                if query in location['name'].lower() or query in location['country'].lower():
-                    results.append(location)
+            # Справочник загружается при первом запросе и остается в памяти
+            # экземпляра функции на следующие вызовы
+            results = gazetteer.load(GAZETTEER_PATH, GAZETTEER_COUNTRIES_PATH).search(query, limit=10)
             
-            # Возвращаем первые 10 результатов или меньше
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
             self.end_headers()
-            self.wfile.write(json.dumps(results[:10]).encode('utf-8'))
+            self.wfile.write(json.dumps(results).encode('utf-8'))
             
         except Exception as e:
             self.send_response(500)
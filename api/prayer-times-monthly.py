@@ -1,73 +1,21 @@
 from http.server import BaseHTTPRequestHandler
 import json
-import requests
+import os
+import sys
 from urllib.parse import parse_qs
-from datetime import datetime
 import calendar
 
-def process_monthly_prayer_times_response(data, month, year):
-    """Обрабатывает ответ API месячных молитв и возвращает форматированные данные."""
-    if not data or 'data' not in data or not data['data']:
-        return None
-    
-    # Получаем месяц и год в нужном формате
-    month_name = datetime(int(year), int(month), 1).strftime('%B')
-    
-    # Формируем структуру ответа
-    result = {
-        "gregorianMonth": month_name,
-        "gregorianYear": year,
-        "days": []
-    }
-    
-    # Обрабатываем данные для каждого дня
-    for day_data in data['data']:
-        if 'date' not in day_data or 'timings' not in day_data:
-            continue
-        
-        date = day_data['date']
-        timings = day_data['timings']
-        
-        # Конвертируем время из 24-часового в 12-часовой формат
-        formatted_timings = {}
-        for prayer, time_str in timings.items():
-            if prayer in ['Fajr', 'Sunrise', 'Dhuhr', 'Asr', 'Sunset', 'Maghrib', 'Isha', 'Midnight', 'Imsak']:
-                formatted_timings[prayer] = convert_to_12_hour_format(time_str)
-        
-        # Добавляем информацию о дне
-        day_info = {
-            "date": f"{date['gregorian']['day']}-{date['gregorian']['month']}-{date['gregorian']['year']}",
-            "gregorianDate": f"{date['gregorian']['day']} {date['gregorian']['month']} {date['gregorian']['year']}",
-            "hijriDate": f"{date['hijri']['day']} {date['hijri']['month']['en']} {date['hijri']['year']}",
-            "weekday": date['gregorian']['weekday']['en'],
-            "timings": formatted_timings
-        }
-        
-        result["days"].append(day_info)
-    
-    return result
+# Общий пакет prayer_core лежит в корне проекта
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Легкий общий модуль: расчет и HTTP-клиент загружаются при первом вызове
+from prayer_core.serverless import (
+    PRAYER_API_BASE_URL, calendar_expires_at, cdn_cache_control, fetch_json, local_monthly_prayer_times,
+    local_today, process_monthly_prayer_times_response, response_cache,
+)
 
-def convert_to_12_hour_format(time_str):
-    """Конвертирует время из 24-часового в 12-часовой формат."""
-    try:
-        # Обрабатываем строку времени формата "HH:MM (GMT+X)"
-        time_parts = time_str.split(' ')
-        time_only = time_parts[0]
-        
-        h, m = map(int, time_only.split(':'))
-        
-        # Определяем AM/PM
-        period = "AM" if h < 12 else "PM"
-        
-        # Конвертируем час в 12-часовой формат
-        h = h % 12
-        if h == 0:
-            h = 12
-            
-        return f"{h:02d}:{m:02d} {period}"
-    except Exception as e:
-        # В случае ошибки возвращаем исходное значение
-        return time_str
+# Источник времен молитв: 'api' - aladhan, 'local' - локальный расчет,
+# 'fallback' - aladhan с локальным расчетом при ошибке запроса
+PRAYER_TIMES_SOURCE = os.environ.get('PRAYER_TIMES_SOURCE', 'api')
 
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
@@ -80,13 +28,13 @@ class handler(BaseHTTPRequestHandler):
             longitude = query_components.get('longitude', ['39.8262'])[0]
             method = query_components.get('method', ['2'])[0]  # Метод расчета по умолчанию ISNA
             
-            # Получаем текущий месяц и год
-            current_date = datetime.now()
-            current_month = current_date.month
-            current_year = current_date.year
-            
-            month = query_components.get('month', [str(current_month)])[0]
-            year = query_components.get('year', [str(current_year)])[0]
+            # По умолчанию - текущий месяц по местному времени места
+            month = query_components.get('month', [''])[0]
+            year = query_components.get('year', [''])[0]
+            if not month or not year:
+                today = local_today(latitude, longitude)
+                month = month or str(today.month)
+                year = year or str(today.year)
             
             # Проверяем корректность месяца и года
             try:
@@ -98,24 +46,41 @@ class handler(BaseHTTPRequestHandler):
                 # Получаем количество дней в месяце
                 days_in_month = calendar.monthrange(year_int, month_int)[1]
                 
+                # Повторный запрос на теплом экземпляре отвечается из памяти
+                cache = response_cache()
+                cache_key = ('calendar', latitude, longitude, method, month_int, year_int)
+                cached = cache.get_encoded(cache_key)
+                if cached is not None:
+                    self.send_json_body(cached.body, cache.expires_at(cache_key))
+                    return
+                
                 # Формируем URL для API месячных молитвенных времен
-                api_url = f"https://api.aladhan.com/v1/calendar/{year}/{month}?latitude={latitude}&longitude={longitude}&method={method}"
+                api_url = f"{PRAYER_API_BASE_URL}/calendar/{year}/{month}?latitude={latitude}&longitude={longitude}&method={method}"
                 
                 try:
-                    # Получаем данные от API
-                    response = requests.get(api_url, timeout=10)
-                    data = response.json()
+                    if PRAYER_TIMES_SOURCE == 'local':
+                        # Локальный расчет без обращения к внешнему API
+                        data = local_monthly_prayer_times(latitude, longitude, month_int, year_int, method)
+                        status_code = 200
+                    else:
+                        try:
+                            # Получаем данные от API через keep-alive соединение экземпляра функции
+                            status_code, data = fetch_json(api_url, timeout=10)
+                        except Exception:
+                            if PRAYER_TIMES_SOURCE != 'fallback':
+                                raise
+                            data = local_monthly_prayer_times(latitude, longitude, month_int, year_int, method)
+                            status_code = 200
                     
-                    if response.status_code == 200:
+                    if status_code == 200:
                         # Если успешно получили данные, обрабатываем их
                         result = process_monthly_prayer_times_response(data, month, year)
                         
                         if result:
-                            self.send_response(200)
-                            self.send_header('Content-type', 'application/json')
-                            self.send_header('Access-Control-Allow-Origin', '*')
-                            self.end_headers()
-                            self.wfile.write(json.dumps(result).encode('utf-8'))
+                            # Календарь не изменится до местной полуночи после конца месяца
+                            expires_at = calendar_expires_at(data, month_int, year_int)
+                            encoded = cache.set(cache_key, result, expires_at)
+                            self.send_json_body(encoded.body, expires_at)
                         else:
                             # Если не удалось обработать данные
                             self.send_response(500)
@@ -124,10 +89,10 @@ class handler(BaseHTTPRequestHandler):
                             self.wfile.write(json.dumps({'error': 'Failed to process monthly prayer times data'}).encode('utf-8'))
                     else:
                         # Если API вернул ошибку
-                        self.send_response(response.status_code)
+                        self.send_response(status_code)
                         self.send_header('Content-type', 'application/json')
                         self.end_headers()
-                        self.wfile.write(json.dumps({'error': f'API returned error: {response.status_code}'}).encode('utf-8'))
+                        self.wfile.write(json.dumps({'error': f'API returned error: {status_code}'}).encode('utf-8'))
                 
                 except Exception as api_error:
                     # Если произошла ошибка при запросе к API
@@ -150,4 +115,13 @@ class handler(BaseHTTPRequestHandler):
             self.send_response(500)
             self.send_header('Content-type', 'application/json')
             self.end_headers()
-            self.wfile.write(json.dumps({'error': str(e)}).encode('utf-8'))
\ No newline at end of file
+            self.wfile.write(json.dumps({'error': str(e)}).encode('utf-8'))
+    
+    def send_json_body(self, body, expires_at):
+        """Отправляет готовый JSON с заголовками кэширования для CDN."""
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Cache-Control', cdn_cache_control(expires_at))
+        self.end_headers()
+        self.wfile.write(body)
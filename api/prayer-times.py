@@ -1,66 +1,20 @@
 from http.server import BaseHTTPRequestHandler
 import json
-import requests
+import os
+import sys
 from urllib.parse import parse_qs
-from datetime import datetime, timedelta
 
-def process_prayer_times_response(data):
-    """Обрабатывает ответ API молитв и возвращает форматированные данные."""
-    if not data or 'data' not in data or not data['data'] or 'timings' not in data['data']:
-        return None
-    
-    api_data = data['data']
-    timings = api_data['timings']
-    date = api_data['date']
-    meta = api_data['meta']
-    
-    # Конвертируем время из 24-часового в 12-часовой формат
-    formatted_timings = {}
-    for prayer, time_str in timings.items():
-        if prayer in ['Fajr', 'Sunrise', 'Dhuhr', 'Asr', 'Sunset', 'Maghrib', 'Isha', 'Midnight', 'Imsak']:
-            formatted_timings[prayer] = convert_to_12_hour_format(time_str)
-    
-    # Формируем структуру ответа
-    result = {
-        "date": f"{date['gregorian']['day']}-{date['gregorian']['month']}-{date['gregorian']['year']}",
-        "gregorianDate": f"{date['gregorian']['day']} {date['gregorian']['month']} {date['gregorian']['year']}",
-        "hijriDate": f"{date['hijri']['day']} {date['hijri']['month']['en']} {date['hijri']['year']}",
-        "timings": formatted_timings,
-        "location": {
-            "latitude": meta['latitude'],
-            "longitude": meta['longitude'],
-            "timezone": meta['timezone']
-        },
-        "meta": {
-            "method": meta['method']['name'],
-            "school": meta['school']
-        },
-        "raw": timings  # Оригинальные данные в 24-часовом формате
-    }
-    
-    return result
+# Общий пакет prayer_core лежит в корне проекта
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Легкий общий модуль: расчет и HTTP-клиент загружаются при первом вызове
+from prayer_core.serverless import (
+    PRAYER_API_BASE_URL, cdn_cache_control, fetch_json, local_prayer_times, local_today,
+    process_prayer_times_response, response_cache, timings_expires_at,
+)
 
-def convert_to_12_hour_format(time_str):
-    """Конвертирует время из 24-часового в 12-часовой формат."""
-    try:
-        # Обрабатываем строку времени формата "HH:MM (GMT+X)"
-        time_parts = time_str.split(' ')
-        time_only = time_parts[0]
-        
-        h, m = map(int, time_only.split(':'))
-        
-        # Определяем AM/PM
-        period = "AM" if h < 12 else "PM"
-        
-        # Конвертируем час в 12-часовой формат
-        h = h % 12
-        if h == 0:
-            h = 12
-            
-        return f"{h:02d}:{m:02d} {period}"
-    except Exception as e:
-        # В случае ошибки возвращаем исходное значение
-        return time_str
+# Источник времен молитв: 'api' - aladhan, 'local' - локальный расчет,
+# 'fallback' - aladhan с локальным расчетом при ошибке запроса
+PRAYER_TIMES_SOURCE = os.environ.get('PRAYER_TIMES_SOURCE', 'api')
 
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
@@ -73,28 +27,46 @@ class handler(BaseHTTPRequestHandler):
             longitude = query_components.get('longitude', ['39.8262'])[0]
             method = query_components.get('method', ['2'])[0]  # Метод расчета по умолчанию ISNA
             
-            # Получаем текущую дату
-            today = datetime.now().strftime('%d-%m-%Y')
-            date = query_components.get('date', [today])[0]
+            # Дата по умолчанию - сегодня по местному времени места
+            date = query_components.get('date', [''])[0]
+            if not date:
+                date = local_today(latitude, longitude).strftime('%d-%m-%Y')
+            
+            # Повторный запрос на теплом экземпляре отвечается из памяти
+            cache = response_cache()
+            cache_key = ('timings', latitude, longitude, method, date)
+            cached = cache.get_encoded(cache_key)
+            if cached is not None:
+                self.send_json_body(cached.body, cache.expires_at(cache_key))
+                return
             
             # Формируем URL для API молитвенных времен
-            api_url = f"https://api.aladhan.com/v1/timings/{date}?latitude={latitude}&longitude={longitude}&method={method}"
+            api_url = f"{PRAYER_API_BASE_URL}/timings/{date}?latitude={latitude}&longitude={longitude}&method={method}"
             
             try:
-                # Получаем данные от API
-                response = requests.get(api_url, timeout=5)
-                data = response.json()
+                if PRAYER_TIMES_SOURCE == 'local':
+                    # Локальный расчет без обращения к внешнему API
+                    data = local_prayer_times(latitude, longitude, method, date)
+                    status_code = 200
+                else:
+                    try:
+                        # Получаем данные от API через keep-alive соединение экземпляра функции
+                        status_code, data = fetch_json(api_url, timeout=5)
+                    except Exception:
+                        if PRAYER_TIMES_SOURCE != 'fallback':
+                            raise
+                        data = local_prayer_times(latitude, longitude, method, date)
+                        status_code = 200
                 
-                if response.status_code == 200:
+                if status_code == 200:
                     # Если успешно получили данные, обрабатываем их
                     result = process_prayer_times_response(data)
                     
                     if result:
-                        self.send_response(200)
-                        self.send_header('Content-type', 'application/json')
-                        self.send_header('Access-Control-Allow-Origin', '*')
-                        self.end_headers()
-                        self.wfile.write(json.dumps(result).encode('utf-8'))
+                        # Ответ не изменится до местной полуночи после его даты
+                        expires_at = timings_expires_at(data)
+                        encoded = cache.set(cache_key, result, expires_at)
+                        self.send_json_body(encoded.body, expires_at)
                     else:
                         # Если не удалось обработать данные
                         self.send_response(500)
@@ -103,10 +75,10 @@ class handler(BaseHTTPRequestHandler):
                         self.wfile.write(json.dumps({'error': 'Failed to process prayer times data'}).encode('utf-8'))
                 else:
                     # Если API вернул ошибку
-                    self.send_response(response.status_code)
+                    self.send_response(status_code)
                     self.send_header('Content-type', 'application/json')
                     self.end_headers()
-                    self.wfile.write(json.dumps({'error': f'API returned error: {response.status_code}'}).encode('utf-8'))
+                    self.wfile.write(json.dumps({'error': f'API returned error: {status_code}'}).encode('utf-8'))
             
             except Exception as api_error:
                 # Если произошла ошибка при запросе к API
@@ -120,4 +92,13 @@ class handler(BaseHTTPRequestHandler):
             self.send_response(500)
             self.send_header('Content-type', 'application/json')
             self.end_headers()
-            self.wfile.write(json.dumps({'error': str(e)}).encode('utf-8'))
\ No newline at end of file
+            self.wfile.write(json.dumps({'error': str(e)}).encode('utf-8'))
+    
+    def send_json_body(self, body, expires_at):
+        """Отправляет готовый JSON с заголовками кэширования для CDN."""
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Cache-Control', cdn_cache_control(expires_at))
+        self.end_headers()
+        self.wfile.write(body)
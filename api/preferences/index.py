@@ -4,7 +4,9 @@ from urllib.parse import parse_qs
 import os
 
 # Для работы на Vercel, нам нужен файл или база данных для хранения настроек
-# Для простоты будем использовать значения по умолчанию
+# Для простоты будем использовать значения по умолчанию: /tmp у каждого
+# экземпляра функции свой, и SQLite в нем не давал бы общего хранилища
+# (клиент хранит свои настройки сам, в localStorage)
 DEFAULT_PREFERENCES = {
     "theme": "light",
     "language": "en",
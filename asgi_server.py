@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""
+ASGI-версия сервера Prayer Times на FastAPI и uvicorn.
+
+Обслуживает те же маршруты /api/*, что и PrayerTimesRequestHandler в
+server.py, с теми же JSON-ответами. Запросы к внешнему API идут через
+асинхронный httpx-клиент, поэтому тысячи ожидающих запросов обслуживает
+один цикл событий, а не поток на каждый запрос.
+
+Запускается рядом с server.py (по умолчанию на порту 8001):
+
+    python asgi_server.py
+    uvicorn asgi_server:app --port 8001
+"""
+
+import asyncio
+import os
+from collections import deque
+from contextlib import asynccontextmanager
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+
+import server
+from prayer_core import calculation, upstream
+from prayer_core.cache import ResponseCache, day_end_local_midnight, month_end_local_midnight
+from prayer_core.ipdb import client_ip
+from prayer_core.keys import normalize_method, normalize_school
+from prayer_core.responses import EncodedJSON, accepts_gzip
+from prayer_core.singleflight import AsyncSingleFlight
+
+# Константы
+ASGI_PORT = int(os.environ.get('ASGI_PORT', 8001))
+# Пул соединений асинхронного клиента внешнего API
+UPSTREAM_MAX_CONNECTIONS = int(os.environ.get('UPSTREAM_MAX_CONNECTIONS', 100))
+
+# Свой кэш: процесс ASGI не делит память с server.py. Настройки хранятся
+# в server.user_preferences этого же процесса (см. server.open_preferences_store)
+api_cache = ResponseCache(max_entries=server.CACHE_MAX_ENTRIES, max_bytes=server.CACHE_MAX_BYTES,
+                          view=server.public_response)
+# Объединение одновременных промахов кэша по одному ключу
+upstream_flights = AsyncSingleFlight()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Создает общий httpx-клиент и подключает постоянный кэш на время работы приложения."""
+    limits = httpx.Limits(
+        max_connections=UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections=UPSTREAM_MAX_CONNECTIONS,
+    )
+    # Те же таймауты и заголовки, что и у синхронного клиента из prayer_core.upstream
+    timeout = httpx.Timeout(upstream.UPSTREAM_READ_TIMEOUT, connect=upstream.UPSTREAM_CONNECT_TIMEOUT)
+    headers = {'User-Agent': upstream.USER_AGENT}
+    store = server.open_persistent_cache(api_cache)
+    preferences_store = server.open_preferences_store()
+    server.configure_timezones()
+    server.load_static_site()
+    try:
+        async with httpx.AsyncClient(timeout=timeout, limits=limits, headers=headers) as client:
+            app.state.http_client = client
+            yield
+    finally:
+        if store is not None:
+            store.close()
+        if preferences_store is not None:
+            preferences_store.close()
+
+
+app = FastAPI(title='Prayer Times', lifespan=lifespan)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=['*'],
+    allow_methods=['GET', 'POST', 'OPTIONS'],
+    allow_headers=['X-Requested-With', 'Content-Type'],
+)
+
+
+# === Блокирующие операции ===
+async def cache_read(read, key):
+    """
+    Чтение из api_cache (get, get_encoded или peek).
+
+    С постоянным хранилищем промах в памяти читает SQLite, поэтому чтение
+    идет в пуле потоков, а не в цикле событий.
+    """
+    if api_cache.store is None:
+        return read(key)
+    return await run_in_threadpool(read, key)
+
+async def preferences_call(method, *args):
+    """Вызов server.user_preferences: с базой SQLite - в пуле потоков."""
+    if server.user_preferences.path is None:
+        return method(*args)
+    return await run_in_threadpool(method, *args)
+
+
+# === Запросы к внешнему API ===
+async def fetch_json(client, url):
+    """GET-запрос к внешнему API с разбором JSON."""
+    response = await client.get(url)
+    return response.json()
+
+async def fetch_prayer_times_data(client, latitude, longitude, method, school, day=None):
+    """Асинхронный аналог server.fetch_prayer_times_data."""
+    if server.PRAYER_TIMES_SOURCE == 'local':
+        return calculation.timings_response(latitude, longitude, day=day, method=method, school=school)
+
+    try:
+        return await fetch_json(client, server.timings_url(latitude, longitude, method, school, day))
+    except Exception:
+        if server.PRAYER_TIMES_SOURCE == 'fallback':
+            return calculation.timings_response(latitude, longitude, day=day, method=method, school=school)
+        raise
+
+async def fetch_monthly_prayer_times_data(client, latitude, longitude, month, year, method, school):
+    """Асинхронный аналог server.fetch_monthly_prayer_times_data."""
+    if server.PRAYER_TIMES_SOURCE == 'local':
+        return calculation.calendar_response(latitude, longitude, month, year, method=method, school=school)
+
+    try:
+        return await fetch_json(client, server.calendar_url(latitude, longitude, month, year, method, school))
+    except Exception:
+        if server.PRAYER_TIMES_SOURCE == 'fallback':
+            return calculation.calendar_response(latitude, longitude, month, year, method=method, school=school)
+        raise
+
+
+async def load_prayer_times(client, cell, latitude, longitude, method, school, day):
+    """Асинхронный аналог server.load_prayer_times: день из месячного календаря."""
+    cache_key = server.daily_cache_key(cell, method, school, day)
+
+    async def load():
+        cached = await cache_read(api_cache.peek, cache_key)
+        if cached is not None:
+            return cached
+
+        monthly = await load_monthly_prayer_times(client, cell, latitude, longitude, day.month, day.year, method, school)
+        result = server.prayer_times_from_monthly(monthly, day) if 'error' not in monthly else None
+        if result is None:
+            data = await fetch_prayer_times_data(client, latitude, longitude, method, school, day)
+            if data['code'] != 200:
+                return {'error': 'Failed to fetch prayer times', 'api_response': data}
+            result = server.process_prayer_times_response(data)
+            server.remember_upstream_timezone(latitude, longitude, result['timezone'])
+
+        api_cache.set(cache_key, result, expires_at=day_end_local_midnight(result['timezone'], day))
+        return result
+
+    return await upstream_flights.do(cache_key, load)
+
+async def load_monthly_prayer_times(client, cell, latitude, longitude, month, year, method, school):
+    """Асинхронный аналог server.load_monthly_prayer_times."""
+    cache_key = server.monthly_cache_key(cell, month, year, method, school)
+
+    async def load():
+        cached = await cache_read(api_cache.peek, cache_key)
+        if cached is not None:
+            return cached
+
+        data = await fetch_monthly_prayer_times_data(client, latitude, longitude, month, year, method, school)
+
+        if data['code'] == 200:
+            result = server.process_monthly_prayer_times_response(data, month, year)
+            timezone = data['data'][0]['meta']['timezone'] if data['data'] else None
+            server.remember_upstream_timezone(latitude, longitude, timezone)
+            api_cache.set(cache_key, result, expires_at=month_end_local_midnight(timezone, month, year))
+            return result
+        else:
+            return {'error': 'Failed to fetch monthly prayer times', 'api_response': data}
+
+    return await upstream_flights.do(cache_key, load)
+
+
+def encoded_response(request, data, cache_control='no-cache'):
+    """Ответ из EncodedJSON с gzip по Accept-Encoding, ETag и 304 по If-None-Match."""
+    encoded = data if isinstance(data, EncodedJSON) else EncodedJSON(data)
+    body, content_encoding, etag = encoded.select(request.headers.get('accept-encoding'))
+    headers = {'ETag': etag, 'Cache-Control': cache_control, 'Vary': 'Accept-Encoding'}
+    if encoded.matches(request.headers.get('if-none-match')):
+        return Response(status_code=304, headers=headers)
+    if content_encoding:
+        headers['Content-Encoding'] = content_encoding
+    return Response(body, media_type='application/json', headers=headers)
+
+
+# === API ===
+@app.get('/api/prayer-times')
+async def prayer_times(request: Request):
+    """Обработчик запроса времен молитв."""
+    query_params = request.query_params
+    latitude = query_params.get('latitude')
+    longitude = query_params.get('longitude')
+    method = query_params.get('method', '2')
+    school = query_params.get('school', '1')
+
+    if not latitude or not longitude:
+        return {'error': 'Latitude and longitude are required'}
+
+    # Приводим параметры к каноническому виду: соседние точки попадают в одну ячейку
+    try:
+        cell, latitude, longitude = server.coordinate_canonicalizer.snap(latitude, longitude)
+        method = normalize_method(method)
+        school = normalize_school(school)
+    except ValueError as e:
+        return {'error': str(e)}
+
+    today = server.location_today(latitude, longitude)
+    cached = await cache_read(api_cache.get, server.daily_cache_key(cell, method, school, today))
+    if cached is not None:
+        return encoded_response(request, server.with_current_prayer(cached))
+
+    try:
+        result = await load_prayer_times(request.app.state.http_client, cell, latitude, longitude, method, school, today)
+        return encoded_response(request, server.with_current_prayer(result))
+    except Exception as e:
+        return {'error': str(e)}
+
+@app.get('/api/prayer-times/monthly')
+async def monthly_prayer_times(request: Request):
+    """Обработчик запроса месячных времен молитв."""
+    query_params = request.query_params
+    latitude = query_params.get('latitude')
+    longitude = query_params.get('longitude')
+    month = query_params.get('month')
+    year = query_params.get('year')
+    method = query_params.get('method', '2')
+    school = query_params.get('school', '1')
+
+    if not all([latitude, longitude, month, year]):
+        return {'error': 'Latitude, longitude, month, and year are required'}
+
+    try:
+        cell, latitude, longitude = server.coordinate_canonicalizer.snap(latitude, longitude)
+        method = normalize_method(method)
+        school = normalize_school(school)
+        month = int(month)
+        year = int(year)
+    except ValueError as e:
+        return {'error': str(e)}
+
+    cache_key = server.monthly_cache_key(cell, month, year, method, school)
+    cached = await cache_read(api_cache.get_encoded, cache_key)
+    if cached is not None:
+        return encoded_response(request, cached, server.shared_cache_control(api_cache.expires_at(cache_key)))
+
+    try:
+        result = await load_monthly_prayer_times(
+            request.app.state.http_client, cell, latitude, longitude, month, year, method, school
+        )
+    except Exception as e:
+        return {'error': str(e)}
+    if 'error' in result:
+        return result
+    return encoded_response(request, server.public_response(result), server.shared_cache_control(api_cache.expires_at(cache_key)))
+
+@app.get('/api/prayer-times/range')
+async def prayer_times_range(request: Request):
+    """Обработчик запроса за период: поток NDJSON (см. server.stream_prayer_times_range)."""
+    try:
+        cell, latitude, longitude, method, school, start, end = server.parse_range_request(request.query_params)
+    except ValueError as e:
+        return {'error': str(e)}
+
+    server.traffic.record((cell, latitude, longitude, method, school))
+    client = request.app.state.http_client
+
+    async def load(month, year):
+        try:
+            return await load_monthly_prayer_times(client, cell, latitude, longitude, month, year, method, school)
+        except Exception as e:
+            return {'error': str(e)}
+
+    async def chunks():
+        window = deque()
+        try:
+            for month, year in server.range_months(start, end):
+                window.append((month, year, asyncio.ensure_future(load(month, year))))
+                if len(window) < server.RANGE_CONCURRENCY:
+                    continue
+                month, year, task = window.popleft()
+                yield server.range_month_chunk(await task, month, year, start, end)
+            while window:
+                month, year, task = window.popleft()
+                yield server.range_month_chunk(await task, month, year, start, end)
+        except Exception as e:
+            # Статус уже отправлен: ошибка уходит последней строкой потока
+            yield server.ndjson_line({'error': str(e)})
+        finally:
+            for _, _, task in window:
+                task.cancel()
+
+    return StreamingResponse(chunks(), media_type='application/x-ndjson', headers={'Cache-Control': 'no-cache'})
+
+@app.post('/api/prayer-times/batch')
+async def batch_prayer_times(request: Request):
+    """Обработчик пакетного запроса времен молитв (см. server.batch_prayer_times)."""
+    try:
+        data = await request.json()
+    except (ValueError, UnicodeDecodeError):
+        return JSONResponse({'error': 'Request body must be valid JSON'}, status_code=400)
+    try:
+        items = server.batch_items(data)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+
+    client = request.app.state.http_client
+    semaphore = asyncio.Semaphore(server.BATCH_CONCURRENCY)
+
+    async def resolve(item):
+        try:
+            cell, latitude, longitude, method, school, day = server.parse_batch_item(item)
+        except ValueError as e:
+            return {'error': str(e)}
+        result = await cache_read(api_cache.get, server.daily_cache_key(cell, method, school, day))
+        if result is None:
+            try:
+                async with semaphore:
+                    result = await load_prayer_times(client, cell, latitude, longitude, method, school, day)
+            except Exception as e:
+                return {'error': str(e)}
+        if day == server.location_today(latitude, longitude) and 'error' not in result:
+            return server.with_current_prayer(result)
+        return result
+
+    return {'results': list(await asyncio.gather(*(resolve(item) for item in items)))}
+
+@app.get('/api/geo/ip-location')
+async def ip_location(request: Request):
+    """Обработчик запроса геолокации по IP."""
+    peer = request.client.host if request.client else ''
+    return server.ip_location(client_ip(request.headers.get('x-forwarded-for'), peer, server.trusted_proxies))
+
+@app.get('/api/geo/coordinates')
+async def coordinates(lat: str = '0', lng: str = '0'):
+    """Обработчик запроса информации о местоположении по координатам."""
+    try:
+        return server.coordinates_location(lat, lng)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+
+@app.get('/api/locations/search')
+async def location_search(q: str = ''):
+    """Обработчик запроса поиска местоположения."""
+    return server.search_locations(q)
+
+@app.get('/api/locations/popular')
+async def popular_locations(request: Request):
+    """Обработчик запроса популярных мест."""
+    return encoded_response(
+        request, server.encoded_popular_locations(), f"public, max-age={server.STATIC_DATA_MAX_AGE}"
+    )
+
+@app.get('/api/cache/stats')
+async def cache_stats():
+    """Счетчики кэша ответов и объединения запросов."""
+    stats = dict(api_cache.stats(), singleflight=upstream_flights.stats(),
+                 preferences=server.user_preferences.stats())
+    if api_cache.store is not None:
+        stats['store'] = api_cache.store.stats()
+    return stats
+
+@app.get('/api/preferences')
+async def get_preferences(request: Request):
+    """Обработчик запроса получения настроек пользователя."""
+    ip = request.client.host if request.client else ''
+    preferences = await preferences_call(server.user_preferences.get, ip)
+    if preferences is not None:
+        return preferences
+    return server.default_preferences()
+
+async def update_preference(request, name, default):
+    """Сохраняет одну настройку пользователя из тела POST-запроса."""
+    try:
+        data = await request.json()
+    except (ValueError, UnicodeDecodeError):
+        return JSONResponse({'error': 'Request body must be valid JSON'}, status_code=400)
+    if not isinstance(data, dict):
+        return JSONResponse({'error': 'Request body must be a JSON object'}, status_code=400)
+    ip = request.client.host if request.client else ''
+    value = data.get(name, default)
+    await preferences_call(server.user_preferences.update, ip, name, value)
+    return {"success": True, name: value}
+
+@app.post('/api/preferences/theme')
+async def theme_preference(request: Request):
+    """Обработчик запроса изменения темы."""
+    return await update_preference(request, 'theme', 'light')
+
+@app.post('/api/preferences/language')
+async def language_preference(request: Request):
+    """Обработчик запроса изменения языка."""
+    return await update_preference(request, 'language', 'ru')
+
+@app.post('/api/preferences/location')
+async def location_preference(request: Request):
+    """Обработчик запроса изменения местоположения."""
+    return await update_preference(request, 'location', {})
+
+@app.api_route('/api/{path:path}', methods=['GET', 'POST'])
+async def api_not_found(path: str):
+    """Неизвестный маршрут API."""
+    return JSONResponse({'error': 'API endpoint not found'}, status_code=404)
+
+
+@app.api_route('/{path:path}', methods=['GET', 'HEAD'])
+async def static_file(request: Request, path: str):
+    """
+    Статические файлы из той же таблицы, что и у server.py: публикуются
+    только STATIC_ASSETS, а не вся директория проекта.
+    """
+    # HEAD к API (GET-маршруты его не принимают) - не маршрут SPA
+    asset = server.static_site.lookup('/' + path) if not path.startswith('api/') else None
+    if asset is None:
+        return Response('File not found', status_code=404, media_type='text/plain')
+
+    use_gzip = asset.gzip_body is not None and accepts_gzip(request.headers.get('accept-encoding'))
+    headers = {
+        'ETag': asset.gzip_etag if use_gzip else asset.etag,
+        'Last-Modified': asset.last_modified,
+        'Cache-Control': asset.cache_control,
+    }
+    if asset.gzip_body is not None:
+        headers['Vary'] = 'Accept-Encoding'
+    if asset.not_modified(request.headers.get('if-none-match'), request.headers.get('if-modified-since')):
+        return Response(status_code=304, headers=headers)
+    if asset.body is None:
+        # Большой файл: отдается из файла, с поддержкой Range
+        return FileResponse(asset.path, media_type=asset.content_type, headers=headers)
+    if use_gzip:
+        headers['Content-Encoding'] = 'gzip'
+        return Response(asset.gzip_body, media_type=asset.content_type, headers=headers)
+    return Response(asset.body, media_type=asset.content_type, headers=headers)
+
+
+def run_server():
+    """Запуск ASGI-сервера."""
+    import uvicorn
+
+    print(f"Serving Prayer Times App (ASGI) at http://localhost:{ASGI_PORT}")
+    uvicorn.run(app, host='0.0.0.0', port=ASGI_PORT, log_level='info')
+
+if __name__ == "__main__":
+    run_server()
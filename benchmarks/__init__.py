@@ -0,0 +1 @@
+"""Нагрузочные тесты сервера времен молитв."""
@@ -0,0 +1,230 @@
+"""
+Локальная заглушка api.aladhan.com для нагрузочных тестов.
+
+Отвечает на GET /v1/timings/{дата или время} и /v1/calendar/{год}/{месяц}
+в формате aladhan. Ответы берутся из файла записей (JSON Lines: путь
+запроса и тело ответа); для запросов, которых нет в записях, ответ
+строится локальным расчетом (prayer_core.calculation) в том же формате,
+так что заглушка работает без сети на любых координатах. С --record-from
+промахи проксируются в настоящий API и дописываются в файл записей.
+
+Задержка и ошибки настраиваются: каждая выдача ждет latency плюс
+экспоненциальный хвост jitter, доля error_rate отвечает error_status, а
+доля timeout_rate висит hang секунд (проверка таймаутов сервера).
+
+GET /__stats возвращает счетчики запросов по эндпоинтам, ошибок и
+зависаний - по ним считается число обращений сервера к внешнему API.
+
+    python -m benchmarks.aladhan_stub --port 9000 --latency-ms 80 --error-rate 0.01
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prayer_core import calculation, upstream
+
+
+class StubState:
+    """Записи, параметры задержек и ошибок и счетчики заглушки."""
+
+    def __init__(self, recordings=None, record_from=None, latency=0.0, jitter=0.0,
+                 error_rate=0.0, error_status=500, timeout_rate=0.0, hang=30.0, seed=None):
+        self.recordings_path = recordings
+        self.record_from = record_from.rstrip('/') if record_from else None
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.timeout_rate = timeout_rate
+        self.hang = hang
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        # путь запроса -> тело ответа в байтах
+        self._responses = {}
+        self.counts = {}
+        self.errors = 0
+        self.timeouts = 0
+        if recordings and os.path.exists(recordings):
+            with open(recordings, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self._responses[record['path']] = json.dumps(record['body']).encode('utf-8')
+
+    def __len__(self):
+        return len(self._responses)
+
+    def stats(self):
+        """Счетчики запросов по эндпоинтам, ошибок и зависаний."""
+        with self._lock:
+            return {'requests': dict(self.counts), 'errors': self.errors, 'timeouts': self.timeouts}
+
+    def outcome(self, endpoint):
+        """Решает судьбу запроса: (задержка в секундах, 'ok' | 'error' | 'timeout')."""
+        with self._lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+            roll = self._random.random()
+            delay = self.latency + (self._random.expovariate(1 / self.jitter) if self.jitter > 0 else 0.0)
+            if roll < self.timeout_rate:
+                self.timeouts += 1
+                return self.hang, 'timeout'
+            if roll < self.timeout_rate + self.error_rate:
+                self.errors += 1
+                return delay, 'error'
+        return delay, 'ok'
+
+    def response(self, path):
+        """Тело ответа для пути запроса (с параметрами): из записей, из сети или расчетом."""
+        body = self._responses.get(path)
+        if body is not None:
+            return body
+        if self.record_from:
+            body = self._record(path)
+        else:
+            body = json.dumps(synthesize(path)).encode('utf-8')
+            # Запросы на момент времени (Unix-время в пути) не повторяются
+            if endpoint_name(path) == 'timings' and urlsplit(path).path.rsplit('/', 1)[-1].isdigit():
+                return body
+        # Гонка двух потоков за один путь безвредна: ответы одинаковые
+        self._responses[path] = body
+        return body
+
+    def _record(self, path):
+        status, data = upstream.get_json(self.record_from + path[len('/v1'):])
+        if status != 200:
+            raise ValueError(f"upstream returned {status} for {path}")
+        with self._lock:
+            with open(self.recordings_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'path': path, 'body': data}, ensure_ascii=False) + '\n')
+        return json.dumps(data).encode('utf-8')
+
+
+def endpoint_name(path):
+    """Эндпоинт aladhan для пути: 'timings', 'calendar' или None."""
+    parts = urlsplit(path).path.strip('/').split('/')
+    if len(parts) == 3 and parts[:2] == ['v1', 'timings']:
+        return 'timings'
+    if len(parts) == 4 and parts[:2] == ['v1', 'calendar']:
+        return 'calendar'
+    return None
+
+def synthesize(path):
+    """Ответ aladhan для пути запроса, построенный локальным расчетом."""
+    parsed = urlsplit(path)
+    parts = parsed.path.strip('/').split('/')
+    params = dict(parse_qsl(parsed.query))
+    latitude = float(params.get('latitude', 21.4225))
+    longitude = float(params.get('longitude', 39.8262))
+    method = params.get('method', calculation.DEFAULT_METHOD)
+    school = int(params.get('school', 0))
+    if parts[1] == 'calendar':
+        return calculation.calendar_response(latitude, longitude, int(parts[3]), int(parts[2]),
+                                             method=method, school=school)
+    when = parts[2]
+    if when.isdigit():
+        # Unix-время: aladhan считает день по поясу места
+        return calculation.timings_response(latitude, longitude, timestamp=int(when),
+                                            method=method, school=school)
+    day = datetime.strptime(when, '%d-%m-%Y').date()
+    return calculation.timings_response(latitude, longitude, day=day, method=method, school=school)
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """Обработчик запросов заглушки."""
+
+    protocol_version = 'HTTP/1.1'
+    # Иначе задержка ACK добавляет ~40 мс к каждому ответу постоянного соединения
+    disable_nagle_algorithm = True
+    state = None
+
+    def do_GET(self):
+        if self.path == '/__stats':
+            self.send_body(200, json.dumps(self.state.stats()).encode('utf-8'))
+            return
+        endpoint = endpoint_name(self.path)
+        if endpoint is None:
+            self.send_body(404, b'{"code":404,"status":"NOT FOUND","data":"Invalid endpoint"}')
+            return
+
+        delay, outcome = self.state.outcome(endpoint)
+        if delay > 0:
+            time.sleep(delay)
+        if outcome == 'timeout':
+            # Клиент к этому времени уже отвалился по таймауту
+            self.close_connection = True
+            return
+        if outcome == 'error':
+            status = self.state.error_status
+            self.send_body(status, json.dumps({'code': status, 'status': 'Injected error'}).encode('utf-8'))
+            return
+        try:
+            body = self.state.response(self.path)
+        except Exception as e:
+            self.send_body(400, json.dumps({'code': 400, 'status': 'BAD REQUEST', 'data': str(e)}).encode('utf-8'))
+            return
+        self.send_body(200, body)
+
+    def send_body(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(state, host='127.0.0.1', port=0):
+    """Создает сервер заглушки (не запуская его) с общим состоянием state."""
+    handler = type('BoundStubRequestHandler', (StubRequestHandler,), {'state': state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def main(argv=None):
+    """Точка входа командной строки."""
+    parser = argparse.ArgumentParser(description='Локальная заглушка api.aladhan.com для нагрузочных тестов.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0, help='0 - свободный порт (выводится при старте)')
+    parser.add_argument('--recordings', help='файл записей ответов (JSON Lines)')
+    parser.add_argument('--record-from', help='базовый URL настоящего API для записи промахов')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='базовая задержка ответа')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='среднее экспоненциального хвоста задержки')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов с ошибкой')
+    parser.add_argument('--error-status', type=int, default=500)
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='доля зависающих запросов')
+    parser.add_argument('--hang-s', type=float, default=30.0, help='сколько висит зависающий запрос')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+    if args.record_from and not args.recordings:
+        parser.error('--record-from requires --recordings')
+
+    state = StubState(
+        recordings=args.recordings, record_from=args.record_from,
+        latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+        error_rate=args.error_rate, error_status=args.error_status,
+        timeout_rate=args.timeout_rate, hang=args.hang_s, seed=args.seed,
+    )
+    server = serve(state, args.host, args.port)
+    # Первая строка вывода - адрес: по ней запускающий процесс узнает порт
+    print(f"Aladhan stub listening on http://{args.host}:{server.server_port}/v1 "
+          f"({len(state)} recorded responses)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,479 @@
+"""
+Сквозной нагрузочный тест server.py с локальной заглушкой aladhan.
+
+Запускает заглушку (benchmarks.aladhan_stub) и сервер, направленный на нее
+через PRAYER_API_BASE_URL, и в течение duration секунд воспроизводит трафик
+страницы (js/app.js) из concurrency параллельных клиентов:
+
+    page     - загрузка страницы: /, /api/preferences, /api/locations/popular
+               и времена молитв на сегодня;
+    search   - ввод названия города в поиск: запрос на каждое нажатие,
+               начиная со второй буквы;
+    monthly  - месячное расписание.
+
+Места выбираются из справочника городов с весами по закону Ципфа (большие
+города популярнее), часть - с координатами геолокации рядом с городом.
+
+Отчет: пропускная способность, p50/p95/p99 задержки и ошибки по каждому
+эндпоинту сервера, доля попаданий в кэш ответов и число обращений к
+внешнему API по эндпоинтам aladhan. Результаты пишутся в JSON (--output);
+с --baseline выводится сравнение с прошлым прогоном.
+
+    python -m benchmarks.load_test --duration 30 --concurrency 32 --latency-ms 80 \\
+        --output bench-results.json --baseline bench-results-main.json
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import re
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import date, datetime, timezone
+from urllib.parse import quote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from prayer_core import gazetteer
+
+# Версия формата файла результатов
+RESULTS_VERSION = 1
+# Сценарии и их доли в трафике по умолчанию
+DEFAULT_MIX = 'page=6,search=3,monthly=1'
+# Из скольких крупнейших городов выбираются места
+TOP_PLACES = 2000
+# Доля пользователей с геолокацией: координаты рядом с городом, а не его центр
+GEOLOCATION_SHARE = 0.3
+# Разброс координат геолокации (градусы)
+GEOLOCATION_SPREAD = 0.05
+# Метод расчета по умолчанию в js/app.js
+DEFAULT_METHOD = 2
+# Сколько ждать запуска сервера и заглушки (секунды)
+STARTUP_TIMEOUT = 60
+REQUEST_TIMEOUT = 30
+
+
+def parse_mix(text):
+    """'page=6,search=3' -> {'page': 6.0, 'search': 3.0}."""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"unknown scenario: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def percentile(values, fraction):
+    """Перцентиль по рангу из отсортированного списка."""
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values) + 0.5)) - 1))
+    return values[index]
+
+def free_port():
+    """Свободный TCP-порт на localhost."""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def get_json(port, path, timeout=5):
+    """GET к серверу на localhost: разобранный JSON-ответ."""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        conn.request('GET', path)
+        return json.loads(conn.getresponse().read())
+    finally:
+        conn.close()
+
+def git_revision():
+    """(коммит, есть ли незакоммиченные изменения) или (None, None) вне git."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout
+        return commit, bool(status.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+# === Процессы заглушки и сервера ===
+def start_stub(args):
+    """Запускает заглушку aladhan: (процесс, базовый URL)."""
+    command = [
+        sys.executable, '-m', 'benchmarks.aladhan_stub', '--port', '0',
+        '--latency-ms', str(args.latency_ms), '--jitter-ms', str(args.jitter_ms),
+        '--error-rate', str(args.error_rate), '--error-status', str(args.error_status),
+        '--timeout-rate', str(args.timeout_rate), '--hang-s', str(args.hang_s),
+        '--seed', str(args.seed),
+    ]
+    if args.recordings:
+        command += ['--recordings', args.recordings]
+    if args.record_from:
+        command += ['--record-from', args.record_from]
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    match = re.search(r'(http://\S+/v1)', line)
+    if not match:
+        process.kill()
+        raise RuntimeError(f"stub failed to start: {line!r}")
+    return process, match.group(1)
+
+def start_server(stub_url, port, extra_env, log_path):
+    """Запускает server.py, направленный на заглушку, и ждет его готовности."""
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        PRAYER_API_BASE_URL=stub_url,
+        PRAYER_TIMES_SOURCE='api',
+        # Фоновый прогрев исказил бы счетчики обращений к внешнему API
+        PREWARM_INTERVAL='0',
+        SERVER_PROCESSES='1',
+    )
+    env.update(extra_env)
+    log = open(log_path, 'w') if log_path else subprocess.DEVNULL
+    process = subprocess.Popen([sys.executable, 'server.py'], cwd=ROOT, env=env,
+                               stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + STARTUP_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        try:
+            get_json(port, '/api/cache/stats', timeout=1)
+            return process
+        except (OSError, ValueError, http.client.HTTPException):
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('server did not start in time')
+
+def stop_process(process, timeout=10):
+    """Останавливает процесс по SIGTERM, а если он не успел - убивает."""
+    if process.poll() is None:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+# === Трафик ===
+class Traffic:
+    """Места пользователей и шаги сценариев страницы."""
+
+    def __init__(self, places, today=None):
+        self.places = places
+        # Закон Ципфа: вес места обратно пропорционален его рангу по населению
+        self.cum_weights = []
+        total = 0.0
+        for rank in range(len(places)):
+            total += 1.0 / (rank + 1)
+            self.cum_weights.append(total)
+        self.today = today or date.today()
+
+    def place(self, rng):
+        return rng.choices(self.places, cum_weights=self.cum_weights)[0]
+
+    def coordinates(self, rng, place):
+        if rng.random() < GEOLOCATION_SHARE:
+            return (round(place.latitude + rng.uniform(-GEOLOCATION_SPREAD, GEOLOCATION_SPREAD), 4),
+                    round(place.longitude + rng.uniform(-GEOLOCATION_SPREAD, GEOLOCATION_SPREAD), 4))
+        return place.latitude, place.longitude
+
+    def page(self, rng):
+        latitude, longitude = self.coordinates(rng, self.place(rng))
+        return [
+            '/',
+            '/api/preferences',
+            '/api/locations/popular',
+            f"/api/prayer-times?latitude={latitude}&longitude={longitude}&method={DEFAULT_METHOD}",
+        ]
+
+    def search(self, rng):
+        name = self.place(rng).name
+        # js/app.js ищет начиная со второго символа
+        return [f"/api/locations/search?q={quote(name[:length])}" for length in range(2, len(name) + 1)]
+
+    def monthly(self, rng):
+        latitude, longitude = self.coordinates(rng, self.place(rng))
+        # Текущий месяц, иногда - соседний (кнопки «назад» и «вперед»)
+        shift = rng.choice((0, 0, 0, -1, 1))
+        month_index = self.today.year * 12 + self.today.month - 1 + shift
+        year, month = divmod(month_index, 12)
+        return [f"/api/prayer-times/monthly?latitude={latitude}&longitude={longitude}"
+                f"&month={month + 1}&year={year}&method={DEFAULT_METHOD}"]
+
+SCENARIOS = ('page', 'search', 'monthly')
+
+
+class Worker(threading.Thread):
+    """Клиент страницы: свое соединение keep-alive и свои замеры."""
+
+    def __init__(self, index, port, traffic, mix, deadline, seed):
+        super().__init__(name=f'load-worker-{index}', daemon=True)
+        self.port = port
+        self.traffic = traffic
+        self.scenarios = list(mix)
+        self.weights = [mix[name] for name in self.scenarios]
+        self.deadline = deadline
+        self.rng = random.Random(seed * 1000003 + index)
+        self.conn = None
+        # эндпоинт -> [задержки в секундах], [число ошибок]
+        self.latencies = {}
+        self.errors = {}
+
+    def run(self):
+        while time.time() < self.deadline:
+            scenario = self.rng.choices(self.scenarios, weights=self.weights)[0]
+            for path in getattr(self.traffic, scenario)(self.rng):
+                if time.time() >= self.deadline:
+                    break
+                self.request(path)
+        if self.conn is not None:
+            self.conn.close()
+
+    def request(self, path):
+        endpoint = path.split('?', 1)[0]
+        failed = False
+        start = time.perf_counter()
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=REQUEST_TIMEOUT)
+            self.conn.request('GET', path)
+            response = self.conn.getresponse()
+            body = response.read()
+            # Ошибки server.py отдает с кодом 200 и полем error
+            failed = response.status >= 400 or body.startswith(b'{"error"')
+        except (OSError, http.client.HTTPException):
+            failed = True
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+        elapsed = time.perf_counter() - start
+        self.latencies.setdefault(endpoint, []).append(elapsed)
+        if failed:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+
+# === Отчет ===
+def endpoint_report(latencies, errors, duration):
+    """Сводка по эндпоинту: число запросов, ошибки, пропускная способность, перцентили (мс)."""
+    latencies = sorted(latencies)
+    result = {
+        'requests': len(latencies),
+        'errors': errors,
+        'errorRate': errors / len(latencies) if latencies else 0.0,
+        'throughput': len(latencies) / duration,
+    }
+    for name, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99)):
+        value = percentile(latencies, fraction)
+        result[name + 'Ms'] = round(value * 1000, 3) if value is not None else None
+    return result
+
+def cache_report(before, after):
+    """Попадания и промахи кэша ответов сервера за прогон."""
+    hits = after['hits'] - before['hits']
+    misses = after['misses'] - before['misses']
+    report = {
+        'hits': hits,
+        'misses': misses,
+        'hitRatio': hits / (hits + misses) if hits + misses else None,
+        'evictions': after['evictions'] - before['evictions'],
+    }
+    flights_before = before.get('singleflight') or {}
+    flights_after = after.get('singleflight') or {}
+    if flights_after:
+        report['singleflight'] = {
+            name: value - flights_before.get(name, 0)
+            # inFlight - мгновенное значение, а не счетчик
+            for name, value in flights_after.items() if name != 'inFlight'
+        }
+    return report
+
+def upstream_report(before, after):
+    """Обращения сервера к внешнему API за прогон по эндпоинтам aladhan."""
+    requests_before = before['requests']
+    return {
+        'requests': {
+            name: count - requests_before.get(name, 0)
+            for name, count in sorted(after['requests'].items())
+        },
+        'errors': after['errors'] - before['errors'],
+        'timeouts': after['timeouts'] - before['timeouts'],
+    }
+
+def collect(workers, duration):
+    """Сводит замеры клиентов в отчет по эндпоинтам и общий итог."""
+    latencies = {}
+    errors = {}
+    for worker in workers:
+        for endpoint, values in worker.latencies.items():
+            latencies.setdefault(endpoint, []).extend(values)
+        for endpoint, count in worker.errors.items():
+            errors[endpoint] = errors.get(endpoint, 0) + count
+    endpoints = {
+        endpoint: endpoint_report(values, errors.get(endpoint, 0), duration)
+        for endpoint, values in sorted(latencies.items())
+    }
+    total = endpoint_report([v for values in latencies.values() for v in values], sum(errors.values()), duration)
+    return endpoints, total
+
+def print_report(results, baseline=None):
+    """Таблица результатов; с baseline - изменение относительно него."""
+    rows = list(results['endpoints'].items()) + [('TOTAL', results['total'])]
+    base_rows = {}
+    if baseline:
+        base_rows = dict(baseline.get('endpoints', {}), TOTAL=baseline.get('total'))
+    print(f"{'endpoint':<32} {'req':>8} {'err':>6} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for endpoint, row in rows:
+        print(f"{endpoint:<32} {row['requests']:>8} {row['errors']:>6} {row['throughput']:>9.1f} "
+              f"{_ms(row['p50Ms'])} {_ms(row['p95Ms'])} {_ms(row['p99Ms'])}")
+        base = base_rows.get(endpoint)
+        if base:
+            print(f"{'  vs baseline':<32} {'':>8} {'':>6} {_delta(row['throughput'], base['throughput'])} "
+                  f"{_delta(row['p50Ms'], base['p50Ms'])} {_delta(row['p95Ms'], base['p95Ms'])} "
+                  f"{_delta(row['p99Ms'], base['p99Ms'])}")
+
+    cache = results['cache']
+    ratio = cache['hitRatio']
+    print(f"\ncache: {cache['hits']} hits, {cache['misses']} misses, hit ratio "
+          f"{'-' if ratio is None else f'{ratio:.1%}'}")
+    if baseline and baseline.get('cache', {}).get('hitRatio') is not None and ratio is not None:
+        print(f"  vs baseline: {baseline['cache']['hitRatio']:.1%}")
+    upstream = results['upstream']
+    calls = ', '.join(f"{name} {count}" for name, count in upstream['requests'].items()) or 'none'
+    print(f"upstream calls: {calls}; injected errors {upstream['errors']}, timeouts {upstream['timeouts']}")
+    if baseline and 'upstream' in baseline:
+        base_calls = ', '.join(f"{name} {count}" for name, count in baseline['upstream']['requests'].items())
+        print(f"  vs baseline: {base_calls or 'none'}")
+
+def _ms(value):
+    return f"{'-':>9}" if value is None else f"{value:>9.1f}"
+
+def _delta(value, base):
+    if value is None or not base:
+        return f"{'-':>9}"
+    return f"{(value - base) / base:>+9.1%}"
+
+
+def run(args):
+    """Прогон нагрузки: словарь результатов для файла."""
+    mix = parse_mix(args.mix)
+    places = gazetteer.load().places[:TOP_PLACES]
+    traffic = Traffic(places)
+    extra_env = dict(item.split('=', 1) for item in args.server_env)
+
+    stub, stub_url = start_stub(args)
+    server = None
+    try:
+        port = args.port or free_port()
+        server = start_server(stub_url, port, extra_env, args.server_log)
+        stub_port = int(re.search(r':(\d+)/', stub_url).group(1))
+        if args.warmup > 0:
+            warmup = [Worker(i, port, traffic, mix, time.time() + args.warmup, args.seed + 1)
+                      for i in range(args.concurrency)]
+            for worker in warmup:
+                worker.start()
+            for worker in warmup:
+                worker.join()
+
+        cache_before = get_json(port, '/api/cache/stats')
+        upstream_before = get_json(stub_port, '/__stats')
+        started = time.time()
+        workers = [Worker(i, port, traffic, mix, started + args.duration, args.seed)
+                   for i in range(args.concurrency)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        duration = time.time() - started
+        cache_after = get_json(port, '/api/cache/stats')
+        upstream_after = get_json(stub_port, '/__stats')
+    finally:
+        if server is not None:
+            stop_process(server)
+        stop_process(stub)
+
+    endpoints, total = collect(workers, duration)
+    commit, dirty = git_revision()
+    return {
+        'version': RESULTS_VERSION,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git': {'commit': commit, 'dirty': dirty},
+        'python': platform.python_version(),
+        'config': {
+            'duration': args.duration,
+            'warmup': args.warmup,
+            'concurrency': args.concurrency,
+            'mix': mix,
+            'seed': args.seed,
+            'stub': {
+                'latencyMs': args.latency_ms,
+                'jitterMs': args.jitter_ms,
+                'errorRate': args.error_rate,
+                'errorStatus': args.error_status,
+                'timeoutRate': args.timeout_rate,
+                'recordings': bool(args.recordings),
+            },
+            'serverEnv': extra_env,
+        },
+        'elapsed': round(duration, 3),
+        'total': total,
+        'endpoints': endpoints,
+        'cache': cache_report(cache_before, cache_after),
+        'upstream': upstream_report(upstream_before, upstream_after),
+    }
+
+def main(argv=None):
+    """Точка входа командной строки."""
+    parser = argparse.ArgumentParser(description='Сквозной нагрузочный тест server.py с заглушкой aladhan.')
+    parser.add_argument('--duration', type=float, default=30.0, help='длительность замера (секунды)')
+    parser.add_argument('--warmup', type=float, default=0.0, help='прогрев перед замером (секунды)')
+    parser.add_argument('--concurrency', type=int, default=16, help='число параллельных клиентов')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'доли сценариев (по умолчанию {DEFAULT_MIX})')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--port', type=int, default=0, help='порт сервера (0 - свободный)')
+    parser.add_argument('--server-env', action='append', default=[], metavar='KEY=VALUE',
+                        help='переменная окружения сервера (можно повторять)')
+    parser.add_argument('--server-log', help='файл для вывода сервера')
+    parser.add_argument('--recordings', help='файл записей ответов aladhan для заглушки')
+    parser.add_argument('--record-from', help='базовый URL настоящего API для записи промахов')
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='задержка заглушки')
+    parser.add_argument('--jitter-ms', type=float, default=20.0, help='средний хвост задержки заглушки')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов заглушки с ошибкой')
+    parser.add_argument('--error-status', type=int, default=500)
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='доля зависающих запросов заглушки')
+    parser.add_argument('--hang-s', type=float, default=30.0, help='сколько висит зависающий запрос')
+    parser.add_argument('--output', help='файл результатов (JSON)')
+    parser.add_argument('--baseline', help='файл результатов прошлого прогона для сравнения')
+    args = parser.parse_args(argv)
+    try:
+        parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    if any('=' not in item for item in args.server_env):
+        parser.error('--server-env expects KEY=VALUE')
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    results = run(args)
+    print_report(results, baseline)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        print(f"\nresults written to {args.output}")
+
+if __name__ == '__main__':
+    main()
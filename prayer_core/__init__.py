@@ -0,0 +1,6 @@
+"""
+Общие компоненты сервера Prayer Times и serverless-функций из api/.
+
+Пакет намеренно не импортирует подмодули при загрузке: каждый потребитель
+подключает только то, что ему нужно.
+"""
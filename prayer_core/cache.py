@@ -0,0 +1,241 @@
+"""
+Ограниченный кэш ответов API с вытеснением LRU и истечением по времени.
+
+Записи хранятся в OrderedDict в порядке последнего обращения. Сроки жизни
+лежат в куче, поэтому истекшие записи удаляются без полного просмотра кэша.
+Все публичные методы потокобезопасны. Вместе со значением запись хранит его
+JSON в байтах (EncodedJSON), который отдается клиентам без повторной
+сериализации. Функция view задает, что из значения попадает в этот JSON:
+служебные поля остаются в кэше, но не уходят клиентам.
+
+К кэшу можно подключить постоянное хранилище (prayer_core.persistence):
+новые записи отложенно сохраняются в него, а промахи в памяти сначала
+проверяются по хранилищу и только потом идут во внешний API.
+"""
+
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, time as time_cls, timedelta
+from zoneinfo import ZoneInfo
+
+from .responses import EncodedJSON
+
+
+def next_local_midnight(tz_name, now=None):
+    """Unix-время ближайшей полуночи в часовом поясе tz_name."""
+    try:
+        zone = ZoneInfo(tz_name) if tz_name else ZoneInfo('UTC')
+    except (KeyError, ValueError):
+        zone = ZoneInfo('UTC')
+    local_now = datetime.fromtimestamp(time.time() if now is None else now, zone)
+    tomorrow = local_now.date() + timedelta(days=1)
+    return datetime.combine(tomorrow, time_cls(0), zone).timestamp()
+
+def day_end_local_midnight(tz_name, day, now=None):
+    """
+    Unix-время полуночи после дня day (datetime.date) в поясе tz_name.
+
+    Как и month_end_local_midnight, не раньше ближайшей полуночи.
+    """
+    try:
+        zone = ZoneInfo(tz_name) if tz_name else ZoneInfo('UTC')
+    except (KeyError, ValueError):
+        zone = ZoneInfo('UTC')
+    next_day = datetime.combine(day + timedelta(days=1), time_cls(0), zone)
+    return max(next_day.timestamp(), next_local_midnight(tz_name, now))
+
+def month_end_local_midnight(tz_name, month, year, now=None):
+    """
+    Unix-время полуночи после последнего дня месяца в поясе tz_name.
+
+    Для прошедших месяцев возвращает ближайшую полночь, чтобы запись
+    все равно прожила хотя бы до конца текущих суток.
+    """
+    try:
+        zone = ZoneInfo(tz_name) if tz_name else ZoneInfo('UTC')
+    except (KeyError, ValueError):
+        zone = ZoneInfo('UTC')
+    next_month = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=zone)
+    return max(next_month.timestamp(), next_local_midnight(tz_name, now))
+
+
+class ResponseCache:
+    """Кэш с лимитом по числу записей и по объему, LRU-вытеснением и сроками жизни."""
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024, clock=time.time, view=None):
+        """view - значение -> то, что отдается клиенту (по умолчанию само значение)."""
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.view = view
+        self._clock = clock
+        self._lock = threading.RLock()
+        # key -> (value, size, expires_at, seq, encoded)
+        self._entries = OrderedDict()
+        # (expires_at, seq, key); устаревшие элементы удаляются лениво
+        self._expiry_heap = []
+        self._seq = 0
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.store = None
+        self.store_hits = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key):
+        """Возвращает значение по ключу или None, если его нет или оно истекло."""
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        # Чтение с диска - вне блокировки, чтобы не задерживать другие потоки
+        stored = self.store.get(key) if self.store is not None else None
+        with self._lock:
+            if stored is None:
+                self.misses += 1
+                return None
+            self.store_hits += 1
+        self._put(key, stored[0], stored[1])
+        return stored[0]
+
+    def peek(self, key):
+        """Как get, но не меняет счетчики и порядок LRU."""
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is not None:
+                return entry[0]
+        # Запись мог сохранить другой процесс с тем же хранилищем
+        stored = self.store.get(key) if self.store is not None else None
+        if stored is None:
+            return None
+        self._put(key, stored[0], stored[1])
+        return stored[0]
+
+    def get_encoded(self, key):
+        """Как get, но возвращает закодированный ответ EncodedJSON."""
+        value = self.get(key)
+        if value is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is value:
+                return entry[4]
+        # Запись вытеснена между вызовами - кодируем заново
+        return self.encode(value)
+
+    def expires_at(self, key):
+        """Unix-время истечения записи или None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return None if entry is None else entry[2]
+
+    def set(self, key, value, expires_at=None):
+        """Сохраняет значение; expires_at - Unix-время истечения или None."""
+        encoded = self._put(key, value, expires_at)
+        if self.store is not None:
+            # Хранилищу нужно значение целиком, а не то, что видит клиент
+            body = encoded.body if self.view is None else None
+            self.store.put(key, value, expires_at, encoded=body)
+        return encoded
+
+    def encode(self, value):
+        """EncodedJSON того, что из значения отдается клиенту."""
+        return EncodedJSON(value if self.view is None else self.view(value))
+
+    def attach_store(self, store, warm_entries=0):
+        """Подключает постоянное хранилище и загружает из него до warm_entries записей."""
+        self.store = store
+        loaded = 0
+        if warm_entries > 0:
+            # Самые свежие записи идут первыми: загружаем в обратном порядке,
+            # чтобы они оказались в конце LRU и вытеснялись последними
+            for key, value, expires_at in reversed(store.load_hot(warm_entries)):
+                self._put(key, value, expires_at)
+                loaded += 1
+        return loaded
+
+    def delete(self, key):
+        """Удаляет запись, если она есть."""
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        """Очищает кэш, сохраняя счетчики."""
+        with self._lock:
+            self._entries.clear()
+            self._expiry_heap = []
+            self._bytes = 0
+
+    def stats(self):
+        """Счетчики и текущий размер кэша."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'maxEntries': self.max_entries,
+                'maxBytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'storeHits': self.store_hits,
+            }
+
+    # === Внутренние методы ===
+    def _put(self, key, value, expires_at):
+        # Кодируем вне блокировки: сериализация - самая дорогая часть
+        encoded = self.encode(value)
+        size = len(encoded)
+        if size > self.max_bytes:
+            return encoded
+        with self._lock:
+            self._remove(key)
+            self._seq += 1
+            self._entries[key] = (value, size, expires_at, self._seq, encoded)
+            self._bytes += size
+            if expires_at is not None:
+                heapq.heappush(self._expiry_heap, (expires_at, self._seq, key))
+            self._expire()
+            self._evict()
+        return encoded
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+        return entry
+
+    def _expire(self):
+        now = self._clock()
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            _, seq, key = heapq.heappop(heap)
+            entry = self._entries.get(key)
+            # Запись могла быть перезаписана или вытеснена раньше
+            if entry is not None and entry[3] == seq:
+                self._remove(key)
+                self.expirations += 1
+        # Куча может разрастись из-за перезаписей - периодически пересобираем
+        if len(heap) > 2 * len(self._entries) + 64:
+            self._expiry_heap = [
+                (entry[2], entry[3], key)
+                for key, entry in self._entries.items()
+                if entry[2] is not None
+            ]
+            heapq.heapify(self._expiry_heap)
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            key, entry = self._entries.popitem(last=False)
+            self._bytes -= entry[1]
+            self.evictions += 1
@@ -0,0 +1,438 @@
+"""
+Локальный астрономический расчет времен молитв.
+
+Реализует тот же алгоритм, что и api.aladhan.com (PrayTimes): положение
+Солнца по упрощенным формулам USNO, углы Фаджра и Иши по методу расчета,
+длина тени для Асра по мазхабу и коррекция для высоких широт.
+
+Функции timings_response и calendar_response возвращают JSON той же
+структуры, что и эндпоинты /timings и /calendar, поэтому результат можно
+передавать в существующие обработчики ответа без изменений.
+"""
+
+import calendar
+import math
+from datetime import date as date_cls, datetime, time as time_cls
+from zoneinfo import ZoneInfo
+
+# Методы расчета с теми же идентификаторами, что и у aladhan.
+# Числовое значение - угол Солнца под горизонтом, строка 'N min' - интервал
+# в минутах (для Иши - после Магриба, для Магриба - после заката).
+METHODS = {
+    0: {'name': 'Shia Ithna-Ansari', 'fajr': 16, 'isha': 14, 'maghrib': 4, 'midnight': 'JAFARI'},
+    1: {'name': 'University of Islamic Sciences, Karachi', 'fajr': 18, 'isha': 18},
+    2: {'name': 'Islamic Society of North America (ISNA)', 'fajr': 15, 'isha': 15},
+    3: {'name': 'Muslim World League', 'fajr': 18, 'isha': 17},
+    4: {'name': 'Umm Al-Qura University, Makkah', 'fajr': 18.5, 'isha': '90 min'},
+    5: {'name': 'Egyptian General Authority of Survey', 'fajr': 19.5, 'isha': 17.5},
+    7: {'name': 'Institute of Geophysics, University of Tehran', 'fajr': 17.7, 'isha': 14, 'maghrib': 4.5, 'midnight': 'JAFARI'},
+    8: {'name': 'Gulf Region', 'fajr': 19.5, 'isha': '90 min'},
+    9: {'name': 'Kuwait', 'fajr': 18, 'isha': 17.5},
+    10: {'name': 'Qatar', 'fajr': 18, 'isha': '90 min'},
+    11: {'name': 'Majlis Ugama Islam Singapura, Singapore', 'fajr': 20, 'isha': 18},
+    12: {'name': 'Union Organization islamic de France', 'fajr': 12, 'isha': 12},
+    13: {'name': 'Diyanet İşleri Başkanlığı, Turkey', 'fajr': 18, 'isha': 17},
+    14: {'name': 'Spiritual Administration of Muslims of Russia', 'fajr': 16, 'isha': 15},
+    15: {'name': 'Moonsighting Committee Worldwide', 'fajr': 18, 'isha': 18},
+    16: {'name': 'Dubai (experimental)', 'fajr': 18.2, 'isha': 18.2},
+    17: {'name': 'Jabatan Kemajuan Islam Malaysia (JAKIM)', 'fajr': 20, 'isha': 18},
+    18: {'name': 'Tunisia', 'fajr': 18, 'isha': 18},
+    19: {'name': 'Algeria', 'fajr': 18, 'isha': 17},
+    20: {'name': 'KEMENAG - Kementerian Agama Republik Indonesia', 'fajr': 20, 'isha': 18},
+    21: {'name': 'Morocco', 'fajr': 19, 'isha': 17},
+    22: {'name': 'Comunidade Islamica de Lisboa', 'fajr': 18, 'isha': '77 min'},
+    23: {'name': 'Ministry of Awqaf, Islamic Affairs and Holy Places, Jordan', 'fajr': 18, 'isha': 18},
+}
+DEFAULT_METHOD = 2
+
+# Мазхаб для Асра: 0 - шафиитский (тень равна предмету), 1 - ханафитский
+SCHOOLS = {0: 'STANDARD', 1: 'HANAFI'}
+
+# Коррекция для высоких широт, как latitudeAdjustmentMethod у aladhan
+LATITUDE_ADJUSTMENTS = ('NONE', 'MIDDLE_OF_THE_NIGHT', 'ONE_SEVENTH', 'ANGLE_BASED')
+DEFAULT_LATITUDE_ADJUSTMENT = 'ANGLE_BASED'
+# В полярный день или ночь (с коррекцией) времена, кроме Зухра, считаются
+# для этой широты того же полушария: на ней Солнце восходит и заходит всегда
+NEAREST_LATITUDE = 65.0
+
+# Порядок полей в timings совпадает с ответом aladhan
+TIMING_NAMES = (
+    'Fajr', 'Sunrise', 'Dhuhr', 'Asr', 'Sunset', 'Maghrib',
+    'Isha', 'Imsak', 'Midnight', 'Firstthird', 'Lastthird'
+)
+
+IMSAK_MINUTES = 10
+
+HIJRI_MONTHS = [
+    ('Muḥarram', 'مُحَرَّم'),
+    ('Ṣafar', 'صَفَر'),
+    ('Rabīʿ al-awwal', 'رَبيع الأوَّل'),
+    ('Rabīʿ al-thānī', 'رَبيع الثاني'),
+    ('Jumādá al-ūlá', 'جُمادى الأولى'),
+    ('Jumādá al-ākhirah', 'جُمادى الآخرة'),
+    ('Rajab', 'رَجَب'),
+    ('Shaʿbān', 'شَعْبان'),
+    ('Ramaḍān', 'رَمَضان'),
+    ('Shawwāl', 'شَوّال'),
+    ('Dhū al-Qaʿdah', 'ذوالقعدة'),
+    ('Dhū al-Ḥijjah', 'ذوالحجة'),
+]
+
+# Дни недели по datetime.weekday(): понедельник = 0
+WEEKDAYS_EN = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+HIJRI_WEEKDAYS = [
+    ('Al Athnayn', 'الاثنين'),
+    ('Al Thalaata', 'الثلاثاء'),
+    ('Al Arba\'a', 'الاربعاء'),
+    ('Al Khamees', 'الخميس'),
+    ('Al Juma\'a', 'الجمعة'),
+    ('Al Sabt', 'السبت'),
+    ('Al Ahad', 'الاحد'),
+]
+MONTHS_EN = [
+    'January', 'February', 'March', 'April', 'May', 'June',
+    'July', 'August', 'September', 'October', 'November', 'December'
+]
+
+
+# === Тригонометрия в градусах ===
+def _dsin(d):
+    return math.sin(math.radians(d))
+
+def _dcos(d):
+    return math.cos(math.radians(d))
+
+def _dtan(d):
+    return math.tan(math.radians(d))
+
+def _darcsin(x):
+    return math.degrees(math.asin(x))
+
+def _darccos(x):
+    return math.degrees(math.acos(x))
+
+def _darctan2(y, x):
+    return math.degrees(math.atan2(y, x))
+
+def _darccot(x):
+    return math.degrees(math.atan(1.0 / x))
+
+def _fix(a, b):
+    if math.isnan(a):
+        return a
+    a = a - b * math.floor(a / b)
+    return a + b if a < 0 else a
+
+def _fixangle(a):
+    return _fix(a, 360.0)
+
+def _fixhour(a):
+    return _fix(a, 24.0)
+
+
+# === Астрономия ===
+def julian_day(year, month, day):
+    """Юлианская дата полудня по Гринвичу для григорианской даты."""
+    if month <= 2:
+        year -= 1
+        month += 12
+    a = year // 100
+    b = 2 - a + a // 4
+    return math.floor(365.25 * (year + 4716)) + math.floor(30.6001 * (month + 1)) + day + b - 1524.5
+
+def sun_position(jd):
+    """Склонение Солнца и уравнение времени для юлианской даты."""
+    d = jd - 2451545.0
+    g = _fixangle(357.529 + 0.98560028 * d)
+    q = _fixangle(280.459 + 0.98564736 * d)
+    l = _fixangle(q + 1.915 * _dsin(g) + 0.020 * _dsin(2 * g))
+    e = 23.439 - 0.00000036 * d
+
+    ra = _darctan2(_dcos(e) * _dsin(l), _dcos(l)) / 15.0
+    equation_of_time = q / 15.0 - _fixhour(ra)
+    declination = _darcsin(_dsin(e) * _dsin(l))
+    return declination, equation_of_time
+
+def _parse_minutes(value):
+    """Возвращает число минут для значения вида '90 min' или None для угла."""
+    if isinstance(value, str) and value.endswith('min'):
+        return float(value.split()[0])
+    return None
+
+def get_method(method):
+    """Возвращает параметры метода расчета по идентификатору aladhan."""
+    try:
+        return METHODS[int(method)]
+    except (KeyError, ValueError, TypeError):
+        raise ValueError(f"Unsupported calculation method: {method}")
+
+def get_school(school):
+    """Проверяет идентификатор мазхаба и возвращает его как int."""
+    try:
+        school = int(school)
+    except (ValueError, TypeError):
+        raise ValueError(f"Unsupported school: {school}")
+    if school not in SCHOOLS:
+        raise ValueError(f"Unsupported school: {school}")
+    return school
+
+def compute_times(year, month, day, latitude, longitude, tz_offset,
+                  method=DEFAULT_METHOD, school=0, elevation=0.0,
+                  latitude_adjustment=DEFAULT_LATITUDE_ADJUSTMENT):
+    """
+    Рассчитывает времена молитв на дату в часах местного времени.
+
+    tz_offset - смещение часового пояса от UTC в часах на эту дату.
+    Если в этот день Солнце не восходит или не заходит, времена считаются
+    для широты NEAREST_LATITUDE. Для недостижимых углов без коррекции
+    (latitude_adjustment='NONE') значение NaN.
+    """
+    params = get_method(method)
+    asr_factor = get_school(school) + 1
+    jdate = julian_day(year, month, day) - longitude / (15 * 24.0)
+
+    def mid_day(t):
+        _, eqt = sun_position(jdate + t)
+        return _fixhour(12 - eqt)
+
+    def sun_angle_time(angle, t, ccw=False, latitude=latitude):
+        decl, _ = sun_position(jdate + t)
+        noon = mid_day(t)
+        cos_t = (-_dsin(angle) - _dsin(decl) * _dsin(latitude)) / (_dcos(decl) * _dcos(latitude))
+        if cos_t < -1 or cos_t > 1:
+            return math.nan
+        delta = _darccos(cos_t) / 15.0
+        return noon - delta if ccw else noon + delta
+
+    rise_set_angle = 0.833 + 0.0347 * math.sqrt(max(elevation, 0.0))
+
+    solar_latitude = latitude
+    if latitude_adjustment != 'NONE' and abs(latitude) > NEAREST_LATITUDE:
+        if (math.isnan(sun_angle_time(rise_set_angle, 6 / 24.0, ccw=True))
+                or math.isnan(sun_angle_time(rise_set_angle, 18 / 24.0))):
+            solar_latitude = math.copysign(NEAREST_LATITUDE, latitude)
+
+    def angle_time(angle, t, ccw=False):
+        return sun_angle_time(angle, t, ccw, solar_latitude)
+
+    def asr_time(t):
+        decl, _ = sun_position(jdate + t)
+        angle = -_darccot(asr_factor + _dtan(abs(solar_latitude - decl)))
+        return angle_time(angle, t)
+
+    isha_minutes = _parse_minutes(params['isha'])
+    maghrib_minutes = _parse_minutes(params.get('maghrib', '0 min'))
+    if isha_minutes is not None and int(method) == 4 and hijri_date(year, month, day)[1] == 9:
+        # Умм аль-Кура: в Рамадан Иша через 120 минут после Магриба
+        isha_minutes = 120.0
+
+    # Начальные приближения в долях суток, как в PrayTimes
+    times = {
+        'fajr': angle_time(params['fajr'], 5 / 24.0, ccw=True),
+        'sunrise': angle_time(rise_set_angle, 6 / 24.0, ccw=True),
+        'dhuhr': mid_day(12 / 24.0),
+        'asr': asr_time(13 / 24.0),
+        'sunset': angle_time(rise_set_angle, 18 / 24.0),
+        'maghrib': math.nan,
+        'isha': math.nan,
+    }
+    if maghrib_minutes is None:
+        times['maghrib'] = angle_time(params['maghrib'], 18 / 24.0)
+    if isha_minutes is None:
+        times['isha'] = angle_time(params['isha'], 18 / 24.0)
+
+    # Переход от солнечного времени к поясному
+    shift = tz_offset - longitude / 15.0
+    for key in times:
+        times[key] += shift
+
+    # Коррекция для высоких широт
+    if latitude_adjustment != 'NONE':
+        night = _fixhour(times['sunrise'] - times['sunset'])
+
+        def portion(angle):
+            if latitude_adjustment == 'MIDDLE_OF_THE_NIGHT':
+                return night / 2.0
+            if latitude_adjustment == 'ONE_SEVENTH':
+                return night / 7.0
+            return night * angle / 60.0
+
+        def adjust(value, base, angle, ccw):
+            limit = portion(angle)
+            diff = _fixhour(base - value) if ccw else _fixhour(value - base)
+            if math.isnan(value) or diff > limit:
+                return base - limit if ccw else base + limit
+            return value
+
+        times['fajr'] = adjust(times['fajr'], times['sunrise'], params['fajr'], ccw=True)
+        if isha_minutes is None:
+            times['isha'] = adjust(times['isha'], times['sunset'], params['isha'], ccw=False)
+        if maghrib_minutes is None:
+            times['maghrib'] = adjust(times['maghrib'], times['sunset'], params['maghrib'], ccw=False)
+
+    if maghrib_minutes is not None:
+        times['maghrib'] = times['sunset'] + maghrib_minutes / 60.0
+    if isha_minutes is not None:
+        times['isha'] = times['maghrib'] + isha_minutes / 60.0
+    times['imsak'] = times['fajr'] - IMSAK_MINUTES / 60.0
+
+    # Полночь и трети ночи считаются от заката
+    night_end = times['fajr'] if params.get('midnight') == 'JAFARI' else times['sunrise']
+    night = _fixhour(night_end - times['sunset'])
+    times['midnight'] = times['sunset'] + night / 2.0
+    times['firstthird'] = times['sunset'] + night / 3.0
+    times['lastthird'] = times['sunset'] + 2 * night / 3.0
+
+    return times
+
+def format_time(hours):
+    """Форматирует время в часах как 'HH:MM' с округлением до минуты."""
+    if math.isnan(hours):
+        return '-----'
+    hours = _fixhour(hours + 0.5 / 60.0)
+    h = int(hours)
+    m = int((hours - h) * 60.0)
+    return f"{h:02d}:{m:02d}"
+
+
+# === Календарь ===
+def hijri_date(year, month, day):
+    """
+    Переводит григорианскую дату в хиджру по табличному календарю.
+
+    Табличный календарь может расходиться с лунным наблюдением на день.
+    """
+    jd = date_cls(year, month, day).toordinal() + 1721425
+    l = jd - 1948440 + 10632
+    n = (l - 1) // 10631
+    l = l - 10631 * n + 354
+    j = ((10985 - l) // 5316) * ((50 * l) // 17719) + (l // 5670) * ((43 * l) // 15238)
+    l = l - ((30 - j) // 15) * ((17719 * j) // 50) - (j // 16) * ((15238 * j) // 43) + 29
+    h_month = (24 * l) // 709
+    h_day = l - (709 * h_month) // 24
+    h_year = 30 * n + j - 30
+    return h_year, h_month, h_day
+
+def resolve_timezone(latitude, longitude, timezone=None):
+    """
+    Возвращает имя и объект часового пояса для координат.
+
+    Если пояс не передан явно, он определяется локально по координатам
+    (prayer_core.timezones), а если это не удалось - берется морской пояс
+    по долготе (Etc/GMT±N).
+    """
+    if not timezone:
+        # Импорт здесь: справочник и таблицы поясов нужны не всем вызывающим
+        from . import timezones
+        timezone = timezones.timezone_at(latitude, longitude)
+    if timezone:
+        try:
+            return timezone, ZoneInfo(timezone)
+        except (KeyError, ValueError):
+            pass
+    offset = int(round(longitude / 15.0))
+    name = 'UTC' if offset == 0 else f"Etc/GMT{-offset:+d}"
+    return name, ZoneInfo(name)
+
+def utc_offset_hours(day, zone):
+    """Смещение пояса от UTC в часах на полдень указанной даты."""
+    return datetime.combine(day, time_cls(12), zone).utcoffset().total_seconds() / 3600.0
+
+def _date_block(day, zone):
+    """Блок date в формате aladhan для григорианской даты."""
+    h_year, h_month, h_day = hijri_date(day.year, day.month, day.day)
+    weekday = day.weekday()
+    timestamp = int(datetime.combine(day, time_cls(0, 1), zone).timestamp())
+    return {
+        'readable': f"{day.day:02d} {MONTHS_EN[day.month - 1][:3]} {day.year}",
+        'timestamp': str(timestamp),
+        'gregorian': {
+            'date': day.strftime('%d-%m-%Y'),
+            'format': 'DD-MM-YYYY',
+            'day': f"{day.day:02d}",
+            'weekday': {'en': WEEKDAYS_EN[weekday]},
+            'month': {'number': day.month, 'en': MONTHS_EN[day.month - 1]},
+            'year': str(day.year),
+            'designation': {'abbreviated': 'AD', 'expanded': 'Anno Domini'},
+        },
+        'hijri': {
+            'date': f"{h_day:02d}-{h_month:02d}-{h_year}",
+            'format': 'DD-MM-YYYY',
+            'day': f"{h_day:02d}",
+            'weekday': {'en': HIJRI_WEEKDAYS[weekday][0], 'ar': HIJRI_WEEKDAYS[weekday][1]},
+            'month': {
+                'number': h_month,
+                'en': HIJRI_MONTHS[h_month - 1][0],
+                'ar': HIJRI_MONTHS[h_month - 1][1],
+            },
+            'year': str(h_year),
+            'designation': {'abbreviated': 'AH', 'expanded': 'Anno Hegirae'},
+            'holidays': [],
+        },
+    }
+
+def _meta_block(latitude, longitude, tz_name, method, school, latitude_adjustment):
+    """Блок meta в формате aladhan."""
+    params = get_method(method)
+    method_params = {'Fajr': params['fajr'], 'Isha': params['isha']}
+    return {
+        'latitude': latitude,
+        'longitude': longitude,
+        'timezone': tz_name,
+        'method': {'id': int(method), 'name': params['name'], 'params': method_params},
+        'latitudeAdjustmentMethod': latitude_adjustment,
+        'midnightMode': params.get('midnight', 'STANDARD'),
+        'school': SCHOOLS[get_school(school)],
+        'offset': {name: 0 for name in TIMING_NAMES},
+    }
+
+def day_payload(day, latitude, longitude, tz_name, zone, method=DEFAULT_METHOD, school=0,
+                latitude_adjustment=DEFAULT_LATITUDE_ADJUSTMENT):
+    """Элемент data ответа aladhan (timings, date, meta) для одной даты."""
+    times = compute_times(
+        day.year, day.month, day.day, latitude, longitude,
+        utc_offset_hours(day, zone), method, school,
+        latitude_adjustment=latitude_adjustment,
+    )
+    return {
+        'timings': {name: format_time(times[name.lower()]) for name in TIMING_NAMES},
+        'date': _date_block(day, zone),
+        'meta': _meta_block(latitude, longitude, tz_name, method, school, latitude_adjustment),
+    }
+
+def timings_response(latitude, longitude, day=None, method=DEFAULT_METHOD, school=0,
+                     timezone=None, timestamp=None):
+    """
+    Аналог GET /timings/{timestamp}: времена молитв на один день.
+
+    Дата берется из day, иначе из timestamp, иначе текущая дата в поясе места.
+    """
+    latitude = float(latitude)
+    longitude = float(longitude)
+    tz_name, zone = resolve_timezone(latitude, longitude, timezone)
+    if day is None:
+        moment = datetime.fromtimestamp(timestamp, zone) if timestamp is not None else datetime.now(zone)
+        day = moment.date()
+    return {
+        'code': 200,
+        'status': 'OK',
+        'data': day_payload(day, latitude, longitude, tz_name, zone, method, school),
+    }
+
+def calendar_response(latitude, longitude, month, year, method=DEFAULT_METHOD, school=0,
+                      timezone=None):
+    """Аналог GET /calendar/{year}/{month}: времена молитв на каждый день месяца."""
+    latitude = float(latitude)
+    longitude = float(longitude)
+    month = int(month)
+    year = int(year)
+    tz_name, zone = resolve_timezone(latitude, longitude, timezone)
+    days_in_month = calendar.monthrange(year, month)[1]
+    return {
+        'code': 200,
+        'status': 'OK',
+        'data': [
+            day_payload(date_cls(year, month, d), latitude, longitude, tz_name, zone, method, school)
+            for d in range(1, days_in_month + 1)
+        ],
+    }
@@ -0,0 +1,330 @@
+"""
+Локальный справочник населенных пунктов (газеттир) и поиск по нему.
+
+Данные читаются из файла в формате GeoNames (cities500.txt, cities1000.txt
+и т.п., в том числе .gz/.zip) и справочника стран. В пакете лежит GeoNames
+cities15000 (data/cities15000.tsv.gz, города от 15 000 жителей) в том же
+формате; полный файл GeoNames подключается через путь к нему.
+
+Все названия (основное, ASCII и альтернативные) приводятся к одной форме:
+нижний регистр, без диакритики, кириллица в латинской транслитерации.
+Поэтому "Москва", "moskva" и "Moscow" ищутся одинаково. Ключи лежат в
+отсортированном списке, и поиск по префиксу - это два bisect. Места
+пронумерованы по убыванию населения, так что ранжирование - выбор
+наименьших номеров; для коротких префиксов с большим числом совпадений
+лучшие номера вычислены заранее, поэтому время ответа не зависит от
+размера справочника.
+
+Обратное геокодирование (ближайший город к координатам) использует k-d
+дерево из prayer_core.spatial по тем же местам.
+"""
+
+import bisect
+import os
+import re
+import threading
+import unicodedata
+from functools import lru_cache
+
+from .spatial import KDTree, chord_to_km, to_unit_vector
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+DEFAULT_CITIES_PATH = os.path.join(DATA_DIR, 'cities15000.tsv.gz')
+DEFAULT_COUNTRIES_PATH = os.path.join(DATA_DIR, 'countries.tsv')
+
+# Префиксы с большим числом ключей получают заранее ранжированный список
+SCAN_LIMIT = 256
+TOP_SIZE = 20
+# Опечатки (одна правка) учитываются для запросов не короче этого
+TYPO_MIN_LENGTH = 4
+TYPO_ALPHABET = 'abcdefghijklmnopqrstuvwxyz'
+# Дальше этого от ближайшего города точка считается вне населенных мест:
+# посреди океана "ближайший город" в сотнях километров только путает
+NEAREST_MAX_KM = 50
+NON_ALNUM = re.compile(r'[\W_]+')
+
+TRANSLIT = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e',
+    'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch',
+    'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+    # Украинские, белорусские и тюркские буквы
+    'і': 'i', 'ї': 'yi', 'є': 'ye', 'ґ': 'g', 'ў': 'u', 'ә': 'a', 'ғ': 'g',
+    'қ': 'q', 'ң': 'n', 'ө': 'o', 'ұ': 'u', 'ү': 'u', 'һ': 'h', 'ӏ': '',
+    # Апострофы внутри названий (Sana'a, Oʻzbekiston) просто убираются
+    "'": '', '’': '', 'ʻ': '', 'ʼ': '', '`': '',
+})
+
+
+def fold(text):
+    """
+    Приводит название к форме для поиска.
+
+    Нижний регистр, кириллица транслитерирована, без диакритики, все кроме
+    букв и цифр - одиночные пробелы.
+    """
+    if text.isascii():
+        # Быстрый путь для латиницы: транслитерация и диакритика не нужны
+        return NON_ALNUM.sub(' ', text.lower().replace("'", '').replace('`', '')).strip()
+    text = unicodedata.normalize('NFC', text.casefold()).translate(TRANSLIT)
+    if not text.isascii():
+        text = ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+    return NON_ALNUM.sub(' ', text).strip()
+
+def slug(text):
+    """Идентификатор из названия: "Kuala Lumpur" -> "kuala-lumpur"."""
+    return fold(text).replace(' ', '-')
+
+def _indexable(key):
+    # Индексируем латиницу (в том числе транслитерированную кириллицу) и
+    # арабскую письменность; остальные алфавиты только раздувают индекс
+    return key and (key.isascii() or all(c < '\x80' or '\u0600' <= c <= '\u06ff' for c in key))
+
+def _open_text(path):
+    # Архивы нужны только для полного GeoNames: модули подключаются по требованию
+    if path.endswith('.gz'):
+        import gzip
+
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.zip'):
+        import io
+        import zipfile
+
+        archive = zipfile.ZipFile(path)
+        member = next(n for n in archive.namelist() if n.endswith(('.txt', '.tsv')))
+        return io.TextIOWrapper(archive.open(member), encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+class Place:
+    """Населенный пункт из справочника."""
+
+    __slots__ = ('name', 'names', 'country_code', 'latitude', 'longitude', 'population', 'timezone')
+
+    def __init__(self, name, names, country_code, latitude, longitude, population, timezone):
+        self.name = name
+        self.names = names
+        self.country_code = country_code
+        self.latitude = latitude
+        self.longitude = longitude
+        self.population = population
+        self.timezone = timezone
+
+
+class Gazetteer:
+    """Справочник мест с префиксным индексом по всем названиям."""
+
+    def __init__(self, places, countries=None):
+        # Номер места - его ранг: места упорядочены по убыванию населения
+        self.places = sorted(places, key=lambda p: -p.population)
+        # код страны -> (название, альтернативные названия)
+        self.countries = countries or {}
+
+        pairs = set()
+        by_country = {}
+        for place_id, place in enumerate(self.places):
+            for name in place.names:
+                key = fold(name)
+                if not _indexable(key):
+                    continue
+                pairs.add((key, place_id))
+                # Составные названия ищутся и с любого слова: "york" -> New York
+                start = key.find(' ')
+                while start != -1:
+                    pairs.add((key[start + 1:], place_id))
+                    start = key.find(' ', start + 1)
+            top = by_country.setdefault(place.country_code, [])
+            if len(top) < TOP_SIZE:
+                top.append(place_id)
+        pairs = sorted(pairs)
+        self._keys = [key for key, _ in pairs]
+        self._ids = [place_id for _, place_id in pairs]
+
+        # Страны ищутся отдельно: запрос "турция" дает крупные города Турции
+        country_pairs = set()
+        for code, (name, alternate_names) in self.countries.items():
+            for country_name in (name, *alternate_names):
+                key = fold(country_name)
+                if key and code in by_country:
+                    country_pairs.add((key, code))
+        country_pairs = sorted(country_pairs)
+        self._country_keys = [key for key, _ in country_pairs]
+        self._country_codes = [code for _, code in country_pairs]
+        self._country_top = by_country
+
+        self._top = {}
+        self._build_top()
+
+        # k-d дерево для обратного геокодирования строится при первом запросе
+        self._tree = None
+        self._tree_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.places)
+
+    def search(self, query, limit=10):
+        """
+        Места, одно из названий которых начинается с query (или со слова
+        query), крупные первыми; затем крупные города подходящих стран.
+        Если точных совпадений нет, допускается одна опечатка.
+        """
+        key = fold(query)
+        if not key:
+            return []
+        ids = self._prefix_ids(key, limit)
+        if len(ids) < limit:
+            for place_id in self._country_ids(key, limit):
+                if place_id not in ids:
+                    ids.append(place_id)
+        if not ids and len(key) >= TYPO_MIN_LENGTH:
+            ids = self._typo_ids(key, limit)
+        return [self.location(place_id) for place_id in ids[:limit]]
+
+    def nearest(self, latitude, longitude, max_km=NEAREST_MAX_KM):
+        """
+        Ближайший к точке город в формате ответов API с расстоянием до него
+        (distanceKm) или None, если ближе max_km городов нет (max_km=None -
+        без ограничения).
+        """
+        found = self.spatial_index().nearest(to_unit_vector(latitude, longitude))
+        if found is None:
+            return None
+        place_id, dist = found
+        distance = chord_to_km(dist ** 0.5)
+        if max_km is not None and distance > max_km:
+            return None
+        location = self.location(place_id)
+        location['distanceKm'] = round(distance, 1)
+        return location
+
+    def spatial_index(self):
+        """k-d дерево мест по координатам (строится при первом обращении)."""
+        if self._tree is None:
+            with self._tree_lock:
+                if self._tree is None:
+                    self._tree = KDTree(to_unit_vector(p.latitude, p.longitude) for p in self.places)
+        return self._tree
+
+    def country_name(self, code):
+        """Название страны по коду (сам код, если страны нет в справочнике)."""
+        return self.countries.get(code, (code, ()))[0]
+
+    def location(self, place_id):
+        """Место в формате ответов API."""
+        place = self.places[place_id]
+        country = self.country_name(place.country_code)
+        return {
+            "name": place.name,
+            "country": country,
+            "countryCode": place.country_code,
+            "latitude": place.latitude,
+            "longitude": place.longitude,
+            "population": place.population,
+            "timezone": place.timezone,
+            "value": f"{slug(place.name)}-{slug(country)}",
+        }
+
+    # === Внутренние методы ===
+    def _range(self, key):
+        lo = bisect.bisect_left(self._keys, key)
+        hi = bisect.bisect_left(self._keys, key + '\uffff', lo)
+        return lo, hi
+
+    def _rank(self, lo, hi, limit):
+        return sorted(set(self._ids[lo:hi]))[:limit]
+
+    def _prefix_ids(self, key, limit):
+        top = self._top.get(key)
+        if top is not None and limit <= TOP_SIZE:
+            return top[:limit]
+        lo, hi = self._range(key)
+        return self._rank(lo, hi, limit)
+
+    def _country_ids(self, key, limit):
+        lo = bisect.bisect_left(self._country_keys, key)
+        hi = bisect.bisect_left(self._country_keys, key + '\uffff', lo)
+        ids = []
+        for code in dict.fromkeys(self._country_codes[lo:hi]):
+            ids.extend(self._country_top[code])
+        return sorted(ids)[:limit]
+
+    def _typo_ids(self, key, limit):
+        variants = set()
+        for i in range(len(key) + 1):
+            head, tail = key[:i], key[i:]
+            if tail:
+                variants.add(head + tail[1:])
+                if len(tail) > 1:
+                    variants.add(head + tail[1] + tail[0] + tail[2:])
+            for c in TYPO_ALPHABET:
+                variants.add(head + c + tail)
+                if tail:
+                    variants.add(head + c + tail[1:])
+        variants.discard(key)
+        ids = set()
+        for variant in variants:
+            ids.update(self._prefix_ids(variant, limit))
+        return sorted(ids)[:limit]
+
+    def _build_top(self):
+        # Идем по дереву префиксов, спускаясь только в группы больше
+        # SCAN_LIMIT: остальные дешевле ранжировать при запросе
+        keys = self._keys
+        pending = [('', 0, len(keys))]
+        while pending:
+            parent, lo, hi = pending.pop()
+            depth = len(parent) + 1
+            i = lo
+            while i < hi:
+                if len(keys[i]) < depth:
+                    i += 1
+                    continue
+                prefix = keys[i][:depth]
+                j = bisect.bisect_left(keys, prefix + '\uffff', i, hi)
+                if j - i > SCAN_LIMIT:
+                    self._top[prefix] = self._rank(i, j, TOP_SIZE)
+                    pending.append((prefix, i, j))
+                i = j
+
+
+def read_places(path):
+    """Читает места из файла в формате GeoNames (табуляция, 19 колонок)."""
+    places = []
+    with _open_text(path) as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            row = line.rstrip('\n').split('\t')
+            if len(row) < 18 or row[6] not in ('P', ''):
+                continue
+            names = [row[1]]
+            if row[2] and row[2] != row[1]:
+                names.append(row[2])
+            if row[3]:
+                names.extend(n for n in row[3].split(',') if n)
+            places.append(Place(
+                row[1], names, row[8],
+                float(row[4]), float(row[5]),
+                int(row[14] or 0), row[17],
+            ))
+    return places
+
+def read_countries(path):
+    """Читает справочник стран: код, название и альтернативные названия через запятую."""
+    countries = {}
+    if not path or not os.path.exists(path):
+        return countries
+    with _open_text(path) as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            row = line.rstrip('\n').split('\t')
+            alternate_names = tuple(n for n in row[2].split(',') if n) if len(row) > 2 else ()
+            countries[row[0]] = (row[1], alternate_names)
+    return countries
+
+@lru_cache(maxsize=None)
+def load(cities_path=DEFAULT_CITIES_PATH, countries_path=DEFAULT_COUNTRIES_PATH):
+    """Загружает справочник один раз на процесс."""
+    return Gazetteer(read_places(cities_path), read_countries(countries_path))
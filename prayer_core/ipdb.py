@@ -0,0 +1,296 @@
+"""
+Локальная база IP-диапазонов для определения местоположения по адресу.
+
+Исходные CSV (DB-IP IP to City Lite, IP2Location LITE DB5 и подобные:
+начало и конец диапазона, страна, город, координаты) один раз собираются
+в двоичный файл:
+
+    python -m prayer_core.ipdb dbip-city-lite.csv.gz prayer_core/data/ip-location.bin
+
+Файл содержит отсортированные массивы начал и концов диапазонов и номера
+мест для IPv4 (uint32) и IPv6 (старшие 64 бита адреса, uint64), а за ними
+JSON-список мест. При загрузке файл отображается в память (mmap), массивы
+читаются через memoryview без копирования, поэтому рабочие процессы
+разделяют одни и те же страницы. Поиск - один bisect по массиву начал.
+
+IPv6-диапазоны хранятся с точностью до /64: провайдеры не выделяют
+сети мельче, и геобазы их тоже не различают.
+
+Модули, нужные только для сборки (csv, gzip, argparse), импортируются в
+функциях сборки: поиск по готовой базе их не загружает.
+"""
+
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from socket import AF_INET, AF_INET6, inet_pton
+
+MAGIC = b'PTIPDB\x01\x00'
+# magic, число диапазонов IPv4, число диапазонов IPv6, длина JSON мест
+HEADER = struct.Struct('<8sQQQ')
+IPV4_MAPPED_PREFIX = 0xFFFF << 32
+
+# Колонки исходного CSV: страна (код), город, широта, долгота
+CSV_FORMATS = {
+    # start,end,continent,country,stateprov,city,latitude,longitude
+    'dbip': (3, 5, 6, 7),
+    # ip_from,ip_to,country_code,country_name,region,city,latitude,longitude
+    'ip2location': (2, 5, 6, 7),
+}
+
+
+def parse_ip(address):
+    """(версия, целое значение) адреса или None для некорректной строки."""
+    try:
+        if ':' not in address:
+            return 4, int.from_bytes(inet_pton(AF_INET, address), 'big')
+        value = int.from_bytes(inet_pton(AF_INET6, address.strip('[]')), 'big')
+    except (OSError, ValueError):
+        return None
+    # IPv4, записанный как IPv6 (::ffff:1.2.3.4)
+    if value >> 32 == 0xFFFF:
+        return 4, value & 0xFFFFFFFF
+    return 6, value
+
+
+class TrustedProxies:
+    """
+    Доверенные прокси: адреса и сети CIDR через запятую ('127.0.0.1,
+    10.0.0.0/8, ::1'); '*' - любой адрес (платформа, которая сама
+    перезаписывает X-Forwarded-For, как Vercel).
+    """
+
+    def __init__(self, spec=''):
+        self.any = False
+        # (версия, адрес сети, маска)
+        self._networks = []
+        for item in spec.split(','):
+            item = item.strip()
+            if not item:
+                continue
+            if item == '*':
+                self.any = True
+                continue
+            address, slash, prefix = item.partition('/')
+            parsed = parse_ip(address)
+            version, value = parsed if parsed else (None, 0)
+            bits = 32 if version == 4 else 128
+            length = int(prefix) if prefix.isdigit() else bits
+            if parsed is None or (slash and not prefix.isdigit()) or length > bits:
+                raise ValueError(f"Invalid proxy address: {item}")
+            mask = ((1 << bits) - 1) ^ ((1 << (bits - length)) - 1)
+            self._networks.append((version, value & mask, mask))
+
+    def __contains__(self, address):
+        if self.any:
+            return True
+        parsed = parse_ip(address)
+        if parsed is None:
+            return False
+        version, value = parsed
+        return any(version == v and value & mask == network for v, network, mask in self._networks)
+
+
+def client_ip(forwarded_for, peer, trusted=None):
+    """
+    Адрес клиента для геолокации.
+
+    X-Forwarded-For учитывается, только если соединение пришло от
+    доверенного прокси (trusted - TrustedProxies): иначе заголовок мог
+    прислать сам клиент. Цепочка читается справа налево, и адресом клиента
+    считается первый недоверенный адрес - левее него записи мог подделать
+    клиент. Без trusted или от недоверенного соединения - адрес соединения.
+    """
+    if not forwarded_for or trusted is None or peer not in trusted:
+        return peer
+    client = peer
+    for address in reversed(forwarded_for.split(',')):
+        address = address.strip()
+        if parse_ip(address) is None:
+            break
+        client = address
+        if address not in trusted:
+            break
+    return client
+
+
+class IPDatabase:
+    """Собранная база IP-диапазонов, отображенная в память."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count4, count6, locations_size = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an IP location database")
+        view = memoryview(self._mmap)
+        offset = HEADER.size
+        self._starts4, offset = self._array(view, offset, 'I', count4)
+        self._ends4, offset = self._array(view, offset, 'I', count4)
+        self._places4, offset = self._array(view, offset, 'I', count4)
+        offset = _align(offset)
+        self._starts6, offset = self._array(view, offset, 'Q', count6)
+        self._ends6, offset = self._array(view, offset, 'Q', count6)
+        self._places6, offset = self._array(view, offset, 'I', count6)
+        offset = _align(offset)
+        self.locations = json.loads(bytes(view[offset:offset + locations_size]))
+
+    def __len__(self):
+        return len(self._starts4) + len(self._starts6)
+
+    def lookup(self, address):
+        """
+        Место для адреса: (код страны, город, широта, долгота) или None,
+        если адрес не разобран или не входит ни в один диапазон.
+        """
+        parsed = parse_ip(address)
+        if parsed is None:
+            return None
+        version, value = parsed
+        if version == 4:
+            starts, ends, places = self._starts4, self._ends4, self._places4
+        else:
+            starts, ends, places = self._starts6, self._ends6, self._places6
+            value >>= 64
+        i = bisect.bisect_right(starts, value) - 1
+        if i < 0 or value > ends[i]:
+            return None
+        return self.locations[places[i]]
+
+    def close(self):
+        """Освобождает отображение файла."""
+        for name in ('_starts4', '_ends4', '_places4', '_starts6', '_ends6', '_places6'):
+            view = getattr(self, name)
+            if isinstance(view, memoryview):
+                view.release()
+        self._mmap.close()
+
+    @staticmethod
+    def _array(view, offset, typecode, count):
+        size = struct.calcsize(typecode) * count
+        data = view[offset:offset + size]
+        if sys.byteorder == 'little':
+            return data.cast(typecode), offset + size
+        # Файл записан в little-endian: на другой архитектуре массив копируется
+        result = array(typecode, data)
+        result.byteswap()
+        return result, offset + size
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+def _open_text(path):
+    import gzip
+    import io
+    import zipfile
+
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    if path.endswith('.zip'):
+        archive = zipfile.ZipFile(path)
+        member = next(n for n in archive.namelist() if n.lower().endswith('.csv'))
+        return io.TextIOWrapper(archive.open(member), encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+def _range_value(text):
+    # IP2Location записывает адреса числами, DB-IP - строками
+    text = text.strip()
+    if text.isdigit():
+        value = int(text)
+        if IPV4_MAPPED_PREFIX <= value <= IPV4_MAPPED_PREFIX | 0xFFFFFFFF:
+            return 4, value & 0xFFFFFFFF
+        return (4 if value <= 0xFFFFFFFF else 6), value
+    return parse_ip(text)
+
+def read_ranges(paths, csv_format='dbip'):
+    """
+    Читает диапазоны из CSV-файлов.
+
+    Возвращает (диапазоны IPv4, диапазоны IPv6, места); диапазон - кортеж
+    (начало, конец, номер места), места - список [код страны, город,
+    широта, долгота].
+    """
+    import csv
+
+    country_col, city_col, lat_col, lng_col = CSV_FORMATS[csv_format]
+    ranges = {4: [], 6: []}
+    locations = []
+    location_ids = {}
+    for path in paths:
+        with _open_text(path) as f:
+            for row in csv.reader(f):
+                if len(row) <= lng_col or row[0].startswith('#'):
+                    continue
+                start, end = _range_value(row[0]), _range_value(row[1])
+                if start is None or end is None or start[0] != end[0]:
+                    continue
+                try:
+                    location = (row[country_col], row[city_col], float(row[lat_col]), float(row[lng_col]))
+                except ValueError:
+                    continue
+                if location[0] in ('', '-', 'ZZ'):
+                    continue
+                location_id = location_ids.get(location)
+                if location_id is None:
+                    location_id = location_ids[location] = len(locations)
+                    locations.append(list(location))
+                version = start[0]
+                if version == 6:
+                    ranges[6].append((start[1] >> 64, end[1] >> 64, location_id))
+                else:
+                    ranges[4].append((start[1], end[1], location_id))
+    return _merge(ranges[4]), _merge(ranges[6]), locations
+
+def _merge(ranges):
+    # Сортируем, убираем пересечения (после усечения IPv6 до /64 диапазоны
+    # могут совпасть) и склеиваем соседние диапазоны одного места
+    merged = []
+    for start, end, location_id in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            if end <= merged[-1][1]:
+                continue
+            start = merged[-1][1] + 1
+        if merged and start == merged[-1][1] + 1 and location_id == merged[-1][2]:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end, location_id])
+    return merged
+
+def write_database(path, ranges4, ranges6, locations):
+    """Записывает собранную базу в двоичный файл."""
+    locations_json = json.dumps(locations, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(ranges4), len(ranges6), len(locations_json)))
+        for typecode, ranges in (('I', ranges4), ('Q', ranges6)):
+            for column, column_type in ((0, typecode), (1, typecode), (2, 'I')):
+                data = array(column_type, [r[column] for r in ranges])
+                if sys.byteorder != 'little':
+                    data.byteswap()
+                f.write(data.tobytes())
+            f.write(b'\0' * (_align(f.tell()) - f.tell()))
+        f.write(locations_json)
+    os.replace(tmp_path, path)
+
+def main(argv=None):
+    """Точка входа командной строки для сборки базы."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Сборка локальной базы IP-диапазонов из CSV.')
+    parser.add_argument('sources', nargs='+', help='CSV-файлы (можно .gz/.zip), IPv4 и IPv6')
+    parser.add_argument('output', help='путь к двоичному файлу базы')
+    parser.add_argument('--format', choices=sorted(CSV_FORMATS), default='dbip')
+    args = parser.parse_args(argv)
+
+    ranges4, ranges6, locations = read_ranges(args.sources, args.format)
+    write_database(args.output, ranges4, ranges6, locations)
+    print(f"Built {args.output}: {len(ranges4)} IPv4 and {len(ranges6)} IPv6 ranges, {len(locations)} places")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Канонизация параметров запроса для ключей кэша.
+
+Координаты привязываются к ячейке сетки (или геохэша), метод и мазхаб
+приводятся к числам. Так соседние пользователи и разные записи одних и
+тех же чисел ('55.7558', '55.75580') попадают в одну запись кэша. Во
+внешний API уходят координаты центра ячейки, поэтому закэшированный ответ
+одинаково верен для всех запросов из ячейки.
+"""
+
+import math
+from decimal import Decimal
+
+_GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash_encode(latitude, longitude, length):
+    """Геохэш точки заданной длины."""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < length:
+        rng, value = (lng_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+def geohash_center(geohash):
+    """Координаты центра ячейки геохэша."""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        index = _GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            rng = lng_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if (index >> shift) & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return (lat_range[0] + lat_range[1]) / 2, (lng_range[0] + lng_range[1]) / 2
+
+def parse_coordinates(latitude, longitude):
+    """Преобразует координаты в float с проверкой диапазона и нормализацией долготы."""
+    lat = float(latitude)
+    lng = float(longitude)
+    # Бесконечная долгота после приведения дала бы NaN в ключе кэша
+    if not math.isfinite(lat) or not math.isfinite(lng) or not -90 <= lat <= 90:
+        raise ValueError(f"Invalid coordinates: {latitude}, {longitude}")
+    # Долгота приводится к диапазону [-180, 180)
+    lng = (lng + 180.0) % 360.0 - 180.0
+    return lat, lng
+
+def normalize_method(method, default=2):
+    """Метод расчета как целое число ('02', ' 2 ' и 2 - один и тот же метод)."""
+    if method is None or str(method).strip() == '':
+        return default
+    try:
+        value = int(str(method).strip())
+    except ValueError:
+        raise ValueError(f"Invalid calculation method: {method}")
+    if value < 0:
+        raise ValueError(f"Invalid calculation method: {method}")
+    return value
+
+def normalize_school(school, default=0):
+    """Мазхаб для Асра: 0 (шафиитский) или 1 (ханафитский)."""
+    if school is None or str(school).strip() == '':
+        return default
+    try:
+        value = int(str(school).strip())
+    except ValueError:
+        raise ValueError(f"Invalid school: {school}")
+    if value not in (0, 1):
+        raise ValueError(f"Invalid school: {school}")
+    return value
+
+
+class CoordinateCanonicalizer:
+    """
+    Привязка координат к ячейкам.
+
+    mode='grid' - квадратная сетка с шагом precision градусов
+    (0.01° ≈ 1.1 км по широте); mode='geohash' - ячейки геохэша длины
+    geohash_length (6 символов ≈ 1.2 × 0.6 км). Крупнее ячейка - выше
+    доля попаданий в кэш и ниже точность времени.
+    """
+
+    def __init__(self, mode='grid', precision=0.01, geohash_length=6):
+        if mode not in ('grid', 'geohash'):
+            raise ValueError(f"Unknown coordinate key mode: {mode}")
+        self.mode = mode
+        self.precision = float(precision)
+        self.geohash_length = int(geohash_length)
+        self._decimals = max(0, -Decimal(str(precision)).normalize().as_tuple().exponent)
+
+    def snap(self, latitude, longitude):
+        """Возвращает (идентификатор ячейки, широта центра, долгота центра)."""
+        lat, lng = parse_coordinates(latitude, longitude)
+        if self.mode == 'geohash':
+            cell = geohash_encode(lat, lng, self.geohash_length)
+            lat, lng = geohash_center(cell)
+            return cell, round(lat, 6), round(lng, 6)
+
+        step = self.precision
+        lat = max(-90.0, min(90.0, round(lat / step) * step))
+        lng = round(lng / step) * step
+        if lng >= 180.0:
+            lng -= 360.0
+        lat = round(lat, self._decimals)
+        lng = round(lng, self._decimals)
+        # -0.0 и 0.0 должны давать один ключ
+        lat = lat + 0.0
+        lng = lng + 0.0
+        cell = f"{lat:.{self._decimals}f},{lng:.{self._decimals}f}"
+        return cell, lat, lng
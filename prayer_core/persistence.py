@@ -0,0 +1,151 @@
+"""
+Постоянное хранилище кэша ответов в SQLite.
+
+Записи попадают в базу отложенно: отдельный поток собирает их из очереди
+и пишет пачками в одной транзакции, поэтому обработчики запросов не ждут
+диска. После перезапуска сервер загружает из базы «горячие» записи и
+отвечает из кэша, даже если внешний API в этот момент недоступен.
+"""
+
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+class PersistentStore:
+    """SQLite-хранилище с пакетной отложенной записью."""
+
+    def __init__(self, path, flush_interval=1.0, batch_size=500, clock=time.time):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._clock = clock
+        self._queue = queue.Queue()
+        self._closed = threading.Event()
+        # Соединение для чтения из потоков обработчиков
+        self._read_lock = threading.Lock()
+        self._reader = self._connect()
+        self._reader.execute(_SCHEMA)
+        self._reader.commit()
+        self.writes = 0
+        self.batches = 0
+        self._writer = threading.Thread(target=self._write_loop, name='cache-writer', daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        # WAL: чтение не блокируется записью, несколько процессов делят файл
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def put(self, key, value, expires_at=None, encoded=None):
+        """Ставит запись в очередь на запись; encoded - уже готовый JSON в байтах."""
+        if not self._closed.is_set():
+            text = encoded.decode('utf-8') if encoded is not None else json.dumps(value)
+            self._queue.put((key, text, expires_at, self._clock()))
+
+    def get(self, key):
+        """Возвращает (значение, expires_at) неистекшей записи или None."""
+        with self._read_lock:
+            row = self._reader.execute(
+                'SELECT value, expires_at FROM cache_entries WHERE key = ?', (key,)
+            ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= self._clock()):
+            return None
+        return json.loads(row[0]), row[1]
+
+    def load_hot(self, limit):
+        """Последние обновленные неистекшие записи: список (ключ, значение, expires_at)."""
+        with self._read_lock:
+            rows = self._reader.execute(
+                'SELECT key, value, expires_at FROM cache_entries '
+                'WHERE expires_at IS NULL OR expires_at > ? '
+                'ORDER BY updated_at DESC LIMIT ?',
+                (self._clock(), limit),
+            ).fetchall()
+        return [(key, json.loads(value), expires_at) for key, value, expires_at in rows]
+
+    def purge_expired(self):
+        """Удаляет истекшие записи из базы."""
+        with self._read_lock:
+            self._reader.execute(
+                'DELETE FROM cache_entries WHERE expires_at IS NOT NULL AND expires_at <= ?',
+                (self._clock(),),
+            )
+            self._reader.commit()
+
+    def flush(self):
+        """Дожидается записи всего, что уже стоит в очереди."""
+        self._queue.join()
+
+    def close(self):
+        """Записывает очередь на диск и останавливает поток записи."""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._queue.put(None)
+        self._writer.join()
+        with self._read_lock:
+            self._reader.close()
+
+    def stats(self):
+        """Счетчики записи."""
+        return {'writes': self.writes, 'batches': self.batches, 'pending': self._queue.qsize()}
+
+    def _write_loop(self):
+        conn = self._connect()
+        try:
+            while True:
+                batch = []
+                stop = False
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    continue
+                # Собираем пачку из всего, что накопилось в очереди
+                while True:
+                    if item is None:
+                        stop = True
+                        self._queue.task_done()
+                    else:
+                        batch.append(item)
+                    if stop or len(batch) >= self.batch_size:
+                        break
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                if batch:
+                    self._write_batch(conn, batch)
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def _write_batch(self, conn, batch):
+        try:
+            with conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO cache_entries (key, value, expires_at, updated_at) '
+                    'VALUES (?, ?, ?, ?)',
+                    batch,
+                )
+            self.writes += len(batch)
+            self.batches += 1
+        except sqlite3.Error as e:
+            print(f"Failed to persist {len(batch)} cache entries: {e}")
+        finally:
+            for _ in batch:
+                self._queue.task_done()
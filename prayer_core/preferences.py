@@ -0,0 +1,268 @@
+"""
+Хранилище настроек пользователей.
+
+Горячий уровень - словари в памяти, разбитые на сегменты по хэшу ключа;
+у каждого сегмента своя блокировка и свой порядок LRU, поэтому запросы
+разных пользователей не ждут друг друга, а неактивные пользователи
+вытесняются, когда сегмент заполнен. Чтение настроек - поиск в словаре.
+
+Изменения пишутся в SQLite отложенно: поток записи раз в flush_interval
+забирает накопившиеся ключи и пишет их одной транзакцией. Повторные
+изменения одного пользователя между записями схлопываются в одну строку.
+Вытесненный из памяти пользователь при следующем обращении читается из
+базы (или из еще не записанных изменений).
+
+Горячий уровень свой у каждого процесса. Если процессов несколько, задается
+max_age: запись старше этого перечитывается из базы, так что изменение,
+сделанное в другом процессе, становится видно не позже чем через max_age
+плюс flush_interval.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS preferences (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+# Отметка «пользователя нет в базе»: повторные чтения не идут на диск
+_MISSING = object()
+
+
+class _Shard:
+    """
+    Сегмент горячего уровня: словарь в порядке LRU под своей блокировкой.
+
+    Счетчики тоже свои у сегмента и меняются под его блокировкой: общий
+    счетчик на все сегменты терял бы увеличения из разных потоков.
+    """
+
+    __slots__ = ('lock', 'entries', 'hits', 'misses', 'evictions')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+class PreferencesStore:
+    """Настройки пользователей: сегментированный LRU в памяти и отложенная запись в SQLite."""
+
+    def __init__(self, path=None, max_entries=100000, shards=64, flush_interval=1.0,
+                 max_age=None, batch_size=1000, clock=time.time):
+        """
+        path - файл SQLite; без него настройки живут только в памяти.
+        max_entries - сколько пользователей держать в памяти (на все сегменты).
+        max_age - через сколько секунд запись в памяти перечитывается из базы
+        (None - не перечитывается).
+        """
+        self.path = path
+        self.max_age = max_age if path else None
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._clock = clock
+        self._shards = [_Shard() for _ in range(shards)]
+        self._shard_size = max(1, max_entries // shards)
+        # Пишет только поток записи
+        self.writes = 0
+        self.batches = 0
+
+        # Изменения, еще не записанные в базу: ключ -> настройки; и пачка,
+        # которую поток записи пишет прямо сейчас
+        self._dirty = {}
+        self._writing = {}
+        self._dirty_lock = threading.Lock()
+        self._wakeup = threading.Condition(self._dirty_lock)
+        self._closed = False
+        self._flush_requested = False
+        self._reader = None
+        self._writer = None
+        if path:
+            self._read_lock = threading.Lock()
+            self._reader = self._connect()
+            self._reader.execute(_SCHEMA)
+            self._reader.commit()
+            self._writer = threading.Thread(target=self._write_loop, name='preferences-writer', daemon=True)
+            self._writer.start()
+
+    def __len__(self):
+        return sum(len(shard.entries) for shard in self._shards)
+
+    def get(self, key):
+        """Копия настроек пользователя или None, если он ничего не сохранял."""
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.entries.get(key)
+            if entry is not None and self._fresh(entry):
+                shard.entries.move_to_end(key)
+                shard.hits += 1
+                value = entry[0]
+                return None if value is _MISSING else dict(value)
+            shard.misses += 1
+        loaded = self._load(key)
+        with shard.lock:
+            # Пока читали базу, значение могло обновиться в памяти
+            current = shard.entries.get(key)
+            if current is not None and current is not entry:
+                value = current[0]
+            else:
+                value = _MISSING if loaded is None else loaded
+                self._insert(shard, key, value)
+        return None if value is _MISSING else dict(value)
+
+    def update(self, key, name, value):
+        """Сохраняет одну настройку пользователя."""
+        shard = self._shard(key)
+        # Вытесненного пользователя сначала поднимаем из базы, чтобы не
+        # потерять остальные его настройки
+        with shard.lock:
+            entry = shard.entries.get(key)
+            known = entry is not None and self._fresh(entry)
+        stored = None if known else self._load(key)
+        with shard.lock:
+            # Запись, появившаяся в памяти после чтения базы, новее прочитанной
+            latest = shard.entries.get(key)
+            current = latest[0] if latest is not None and (known or latest is not entry) else stored
+            if current is None or current is _MISSING:
+                current = {}
+            # Словарь в памяти не меняется на месте: читатели получают копии,
+            # а поток записи - неизменяемый снимок
+            preferences = dict(current, **{name: value})
+            self._insert(shard, key, preferences)
+        if self._writer is not None:
+            with self._dirty_lock:
+                self._dirty[key] = preferences
+
+    @property
+    def hits(self):
+        return self._total('hits')
+
+    @property
+    def misses(self):
+        return self._total('misses')
+
+    @property
+    def evictions(self):
+        return self._total('evictions')
+
+    def flush(self):
+        """Дожидается записи всех накопившихся изменений."""
+        if self._writer is None:
+            return
+        with self._wakeup:
+            self._flush_requested = True
+            self._wakeup.notify_all()
+            while self._dirty or self._writing:
+                self._wakeup.wait(0.1)
+
+    def close(self):
+        """Записывает изменения на диск и останавливает поток записи."""
+        if self._writer is None or self._closed:
+            return
+        with self._wakeup:
+            self._closed = True
+            self._wakeup.notify_all()
+        self._writer.join()
+        with self._read_lock:
+            self._reader.close()
+
+    def stats(self):
+        """Счетчики хранилища."""
+        with self._dirty_lock:
+            pending = len(self._dirty)
+        return {
+            'entries': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'writes': self.writes,
+            'batches': self.batches,
+            'pending': pending,
+        }
+
+    # === Внутренние методы ===
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def _total(self, name):
+        total = 0
+        for shard in self._shards:
+            with shard.lock:
+                total += getattr(shard, name)
+        return total
+
+    def _fresh(self, entry):
+        return entry[1] is None or self._clock() - entry[1] < self.max_age
+
+    def _insert(self, shard, key, value):
+        # Запись - (настройки, время чтения из базы); без max_age время не нужно
+        shard.entries[key] = (value, self._clock() if self.max_age is not None else None)
+        shard.entries.move_to_end(key)
+        while len(shard.entries) > self._shard_size:
+            shard.entries.popitem(last=False)
+            shard.evictions += 1
+
+    def _load(self, key):
+        if self._reader is None:
+            return None
+        # Еще не записанное изменение новее того, что лежит в базе
+        with self._dirty_lock:
+            pending = self._dirty.get(key) or self._writing.get(key)
+        if pending is not None:
+            return pending
+        with self._read_lock:
+            row = self._reader.execute('SELECT value FROM preferences WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        # WAL: чтение не блокируется записью, несколько процессов делят файл
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _write_loop(self):
+        conn = self._connect()
+        try:
+            while True:
+                with self._wakeup:
+                    if not self._closed and not self._flush_requested:
+                        self._wakeup.wait(self.flush_interval)
+                    self._flush_requested = False
+                    batch = self._writing = self._dirty
+                    self._dirty = {}
+                    closed = self._closed
+                if batch:
+                    self._write_batch(conn, list(batch.items()))
+                    with self._wakeup:
+                        self._writing = {}
+                        self._wakeup.notify_all()
+                if closed:
+                    return
+        finally:
+            conn.close()
+
+    def _write_batch(self, conn, items):
+        now = self._clock()
+        for start in range(0, len(items), self.batch_size):
+            rows = [(key, json.dumps(value, ensure_ascii=False), now)
+                    for key, value in items[start:start + self.batch_size]]
+            try:
+                with conn:
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO preferences (key, value, updated_at) VALUES (?, ?, ?)',
+                        rows,
+                    )
+                self.writes += len(rows)
+                self.batches += 1
+            except sqlite3.Error as e:
+                print(f"Failed to persist {len(rows)} preferences: {e}")
@@ -0,0 +1,111 @@
+"""
+Фоновый прогрев кэша ответов.
+
+Дневные ключи кэша содержат дату, поэтому записи популярных мест истекают
+одновременно, и первые запросы новых суток ждут внешний API. Планировщик
+периодически заранее загружает записи на завтра и календари на следующий
+месяц для заданного списка мест и самых частых мест из трафика.
+"""
+
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TrafficCounter:
+    """Счетчик обращений по ключам с ограниченным числом хранимых ключей."""
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def record(self, key):
+        """Учитывает одно обращение."""
+        with self._lock:
+            self._counts[key] += 1
+            # Редкие ключи отбрасываем пачкой, а не на каждом обращении
+            if len(self._counts) > 2 * self.max_keys:
+                self._counts = Counter(dict(self._counts.most_common(self.max_keys)))
+
+    def top(self, n):
+        """n самых частых ключей, начиная с самого частого."""
+        with self._lock:
+            return [key for key, _ in self._counts.most_common(n)]
+
+
+class PrewarmScheduler:
+    """
+    Периодически выполняет задачи прогрева в ограниченном пуле потоков.
+
+    jobs_fn() возвращает список функций без аргументов; каждая загружает одну
+    запись кэша. Размер пула ограничивает число одновременных запросов к
+    внешнему API.
+    """
+
+    def __init__(self, jobs_fn, interval=900, concurrency=4):
+        self.jobs_fn = jobs_fn
+        self.interval = interval
+        self.concurrency = concurrency
+        self._stop = threading.Event()
+        self._thread = None
+        self.runs = 0
+        self.warmed = 0
+        self.failed = 0
+        self.last_run = None
+
+    def start(self):
+        """Запускает фоновый поток; первый прогрев выполняется сразу."""
+        self._thread = threading.Thread(target=self._loop, name='cache-prewarm', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Останавливает поток после текущего прогрева."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def run_once(self):
+        """Выполняет все задачи прогрева один раз."""
+        jobs = self.jobs_fn()
+        warmed = failed = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='prewarm') as executor:
+            for ok in executor.map(self._run_job, jobs):
+                if ok:
+                    warmed += 1
+                else:
+                    failed += 1
+        self.runs += 1
+        self.warmed += warmed
+        self.failed += failed
+        self.last_run = time.time()
+        return warmed, failed
+
+    def stats(self):
+        """Счетчики прогрева."""
+        return {
+            'runs': self.runs,
+            'warmed': self.warmed,
+            'failed': self.failed,
+            'lastRun': self.last_run,
+        }
+
+    def _run_job(self, job):
+        if self._stop.is_set():
+            return False
+        try:
+            job()
+            return True
+        except Exception:
+            return False
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                warmed, failed = self.run_once()
+                if failed:
+                    print(f"Cache prewarm: {warmed} loaded, {failed} failed")
+            except Exception as e:
+                print(f"Cache prewarm failed: {e}")
+            self._stop.wait(self.interval)
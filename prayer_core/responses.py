@@ -0,0 +1,93 @@
+"""
+Заранее закодированные JSON-ответы.
+
+EncodedJSON хранит тело ответа в байтах, его сжатый gzip-вариант и строгий
+ETag. Записи кэша ответов хранят EncodedJSON рядом со значением, поэтому
+попадание в кэш не сериализует JSON заново, а повторный запрос с тем же
+If-None-Match получает 304 без тела.
+"""
+
+import gzip
+import hashlib
+import json
+
+# Ответы меньше этого размера не сжимаются: выигрыш меньше заголовков
+GZIP_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+
+
+class EncodedJSON:
+    """Тело JSON-ответа в байтах с gzip-вариантом и ETag."""
+
+    __slots__ = ('body', 'etag', '_gzip_body')
+
+    def __init__(self, data=None, body=None):
+        self.body = body if body is not None else json.dumps(data).encode('utf-8')
+        self.etag = '"' + hashlib.blake2b(self.body, digest_size=16).hexdigest() + '"'
+        self._gzip_body = None
+
+    def __len__(self):
+        return len(self.body)
+
+    @property
+    def gzip_etag(self):
+        """ETag сжатого варианта: у разных представлений разные строгие ETag."""
+        return self.etag[:-1] + '-gzip"'
+
+    @property
+    def gzip_body(self):
+        """Сжатое тело; создается при первом обращении и сохраняется."""
+        if self._gzip_body is None:
+            self._gzip_body = gzip.compress(self.body, GZIP_LEVEL)
+        return self._gzip_body
+
+    def select(self, accept_encoding):
+        """Возвращает (тело, Content-Encoding или None, ETag) под заголовок Accept-Encoding."""
+        if len(self.body) >= GZIP_MIN_SIZE and accepts_gzip(accept_encoding):
+            return self.gzip_body, 'gzip', self.gzip_etag
+        return self.body, None, self.etag
+
+    def matches(self, if_none_match):
+        """Совпадает ли If-None-Match с одним из представлений ответа."""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            # If-None-Match сравнивается слабо: префикс W/ не учитывается
+            if tag.startswith('W/'):
+                tag = tag[2:]
+            if tag == self.etag or tag == self.gzip_etag:
+                return True
+        return False
+
+
+def accepts_gzip(accept_encoding):
+    """
+    Разрешает ли заголовок Accept-Encoding ответ в gzip.
+
+    Явная запись gzip важнее '*': "*;q=0, gzip" разрешает сжатие, а
+    "gzip;q=0, *" запрещает.
+    """
+    if not accept_encoding:
+        return False
+    wildcard = None
+    for item in accept_encoding.split(','):
+        coding, *params = item.split(';')
+        coding = coding.strip().lower()
+        if coding not in ('gzip', 'x-gzip', '*'):
+            continue
+        allowed = True
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                # gzip;q=0 явно запрещает сжатие
+                try:
+                    allowed = float(value.strip()) > 0
+                except ValueError:
+                    allowed = False
+        if coding != '*':
+            return allowed
+        wildcard = allowed
+    return bool(wildcard)
@@ -0,0 +1,220 @@
+"""
+Общий код serverless-функций из api/.
+
+Модуль легкий при импорте: только стандартная библиотека, которую и так
+загружает http.server. Локальный расчет (prayer_core.calculation)
+подключается при первом вызове, которому он нужен, поэтому холодный старт
+функции не платит за то, что в этом запросе не понадобится. Статические
+ответы лежат в prayer_core/data уже в виде JSON и отдаются как есть.
+
+Экземпляр функции, оставшийся теплым, отвечает на повторные запросы из
+ограниченного кэша в памяти модуля (prayer_core.cache.ResponseCache), а
+заголовки s-maxage/stale-while-revalidate позволяют CDN Vercel отвечать
+без запуска функции до местной полуночи (для календаря - до конца месяца).
+
+Запросы к внешнему API идут через http.client, а не urllib3 из
+prayer_core.upstream: экземпляр функции обрабатывает один запрос за раз,
+и одного соединения keep-alive на хост достаточно, а импорт urllib3 был
+самой дорогой частью холодного старта.
+"""
+
+import http.client
+import json
+import os
+import socket
+import time
+import zlib
+from datetime import datetime
+from urllib.parse import urlsplit
+
+# Молитвы и отметки, которые попадают в ответы функций
+TIMING_NAMES = ('Fajr', 'Sunrise', 'Dhuhr', 'Asr', 'Sunset', 'Maghrib', 'Isha', 'Midnight', 'Imsak')
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+USER_AGENT = 'PrayerTimesApp/1.0'
+# Базовый URL внешнего API (aladhan), как в server.py
+PRAYER_API_BASE_URL = os.environ.get('PRAYER_API_BASE_URL', 'https://api.aladhan.com/v1').rstrip('/')
+
+# Кэш ответов экземпляра функции: число записей и объем (байты)
+SERVERLESS_CACHE_MAX_ENTRIES = int(os.environ.get('SERVERLESS_CACHE_MAX_ENTRIES', 1000))
+SERVERLESS_CACHE_MAX_BYTES = int(os.environ.get('SERVERLESS_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+# Сколько секунд после истечения CDN может отдавать старый ответ, пока
+# обновляет его в фоне
+CDN_STALE_WHILE_REVALIDATE = int(os.environ.get('CDN_STALE_WHILE_REVALIDATE', 300))
+
+# Открытые соединения экземпляра функции: (схема, хост) -> соединение
+_connections = {}
+_response_cache = None
+
+
+def read_static_json(name):
+    """Готовый JSON-ответ из prayer_core/data в байтах."""
+    with open(os.path.join(DATA_DIR, name), 'rb') as f:
+        return f.read()
+
+def response_cache():
+    """Кэш ответов, общий для вызовов одного экземпляра (создается при первом запросе)."""
+    global _response_cache
+    if _response_cache is None:
+        from prayer_core.cache import ResponseCache
+
+        _response_cache = ResponseCache(
+            max_entries=SERVERLESS_CACHE_MAX_ENTRIES,
+            max_bytes=SERVERLESS_CACHE_MAX_BYTES,
+        )
+    return _response_cache
+
+def cdn_cache_control(expires_at, now=None):
+    """
+    Cache-Control для CDN: ответ свеж до expires_at, после этого еще
+    CDN_STALE_WHILE_REVALIDATE секунд отдается старый, пока CDN его обновляет.
+    """
+    if expires_at is None:
+        return 'no-cache'
+    max_age = max(0, int(expires_at - (time.time() if now is None else now)))
+    return f"public, max-age=0, s-maxage={max_age}, stale-while-revalidate={CDN_STALE_WHILE_REVALIDATE}"
+
+def local_today(latitude, longitude):
+    """Сегодняшняя дата в часовом поясе координат (пояс определяется локально)."""
+    from prayer_core import calculation
+
+    _, zone = calculation.resolve_timezone(float(latitude), float(longitude))
+    return datetime.now(zone).date()
+
+def timings_expires_at(data):
+    """Unix-время, до которого дневной ответ aladhan не изменится: полночь после его даты."""
+    from prayer_core.cache import day_end_local_midnight
+
+    day = datetime.strptime(data['data']['date']['gregorian']['date'], '%d-%m-%Y').date()
+    return day_end_local_midnight(data['data']['meta']['timezone'], day)
+
+def calendar_expires_at(data, month, year):
+    """Unix-время, до которого месячный ответ aladhan не изменится."""
+    from prayer_core.cache import month_end_local_midnight
+
+    return month_end_local_midnight(data['data'][0]['meta']['timezone'], month, year)
+
+def convert_to_12_hour_format(time_str):
+    """Конвертирует время из 24-часового в 12-часовой формат."""
+    try:
+        # Обрабатываем строку времени формата "HH:MM (GMT+X)"
+        time_only = time_str.split(' ')[0]
+        h, m = map(int, time_only.split(':'))
+
+        # Определяем AM/PM и конвертируем час в 12-часовой формат
+        period = "AM" if h < 12 else "PM"
+        h = h % 12
+        if h == 0:
+            h = 12
+
+        return f"{h:02d}:{m:02d} {period}"
+    except Exception:
+        # В случае ошибки возвращаем исходное значение
+        return time_str
+
+def format_timings(timings):
+    """Времена молитв в 12-часовом формате."""
+    return {
+        prayer: convert_to_12_hour_format(time_str)
+        for prayer, time_str in timings.items()
+        if prayer in TIMING_NAMES
+    }
+
+def process_prayer_times_response(data):
+    """Обрабатывает ответ API молитв и возвращает форматированные данные."""
+    if not data or 'data' not in data or not data['data'] or 'timings' not in data['data']:
+        return None
+
+    api_data = data['data']
+    timings = api_data['timings']
+    date = api_data['date']
+    meta = api_data['meta']
+
+    return {
+        "date": f"{date['gregorian']['day']}-{date['gregorian']['month']}-{date['gregorian']['year']}",
+        "gregorianDate": f"{date['gregorian']['day']} {date['gregorian']['month']} {date['gregorian']['year']}",
+        "hijriDate": f"{date['hijri']['day']} {date['hijri']['month']['en']} {date['hijri']['year']}",
+        "timings": format_timings(timings),
+        "location": {
+            "latitude": meta['latitude'],
+            "longitude": meta['longitude'],
+            "timezone": meta['timezone']
+        },
+        "meta": {
+            "method": meta['method']['name'],
+            "school": meta['school']
+        },
+        "raw": timings  # Оригинальные данные в 24-часовом формате
+    }
+
+def process_monthly_prayer_times_response(data, month, year):
+    """Обрабатывает ответ API месячных молитв и возвращает форматированные данные."""
+    if not data or 'data' not in data or not data['data']:
+        return None
+
+    result = {
+        "gregorianMonth": datetime(int(year), int(month), 1).strftime('%B'),
+        "gregorianYear": year,
+        "days": []
+    }
+
+    for day_data in data['data']:
+        if 'date' not in day_data or 'timings' not in day_data:
+            continue
+
+        date = day_data['date']
+        result["days"].append({
+            "date": f"{date['gregorian']['day']}-{date['gregorian']['month']}-{date['gregorian']['year']}",
+            "gregorianDate": f"{date['gregorian']['day']} {date['gregorian']['month']} {date['gregorian']['year']}",
+            "hijriDate": f"{date['hijri']['day']} {date['hijri']['month']['en']} {date['hijri']['year']}",
+            "weekday": date['gregorian']['weekday']['en'],
+            "timings": format_timings(day_data['timings'])
+        })
+
+    return result
+
+def local_prayer_times(latitude, longitude, method, date):
+    """Рассчитывает времена молитв локально на дату формата DD-MM-YYYY."""
+    from prayer_core import calculation
+
+    day = datetime.strptime(date, '%d-%m-%Y').date()
+    return calculation.timings_response(latitude, longitude, day=day, method=method)
+
+def local_monthly_prayer_times(latitude, longitude, month, year, method):
+    """Рассчитывает времена молитв локально на месяц."""
+    from prayer_core import calculation
+
+    return calculation.calendar_response(latitude, longitude, month, year, method=method)
+
+def fetch_json(url, timeout):
+    """GET-запрос к внешнему API с переиспользованием соединения: (код ответа, данные)."""
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.netloc)
+    path = f"{parts.path}?{parts.query}" if parts.query else parts.path
+    headers = {'User-Agent': USER_AGENT, 'Accept-Encoding': 'gzip'}
+    while True:
+        conn = _connections.get(key)
+        reused = conn is not None
+        if conn is None:
+            connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+            conn = _connections[key] = connection_class(parts.netloc, timeout=timeout)
+        try:
+            if reused:
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            body = response.read()
+        except (http.client.HTTPException, OSError) as e:
+            conn.close()
+            del _connections[key]
+            # Сервер мог закрыть соединение, пока экземпляр простаивал:
+            # повторяем один раз на новом соединении (но не после таймаута)
+            if reused and not isinstance(e, socket.timeout):
+                continue
+            raise
+        if response.getheader('Content-Encoding') == 'gzip':
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        return response.status, json.loads(body.decode('utf-8'))
@@ -0,0 +1,105 @@
+"""
+Объединение одновременных запросов с одинаковым ключом (single-flight).
+
+Первый запрос по ключу («лидер») выполняет загрузку, остальные ждут его
+результат или ошибку. Так истечение популярной записи кэша порождает один
+запрос к внешнему API, а не по одному на каждого клиента.
+"""
+
+import asyncio
+import threading
+
+
+class _Call:
+    """Выполняющаяся загрузка, которую ждут остальные потоки."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Single-flight для потоков."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Выполняет fn() один раз на все одновременные вызовы с ключом key."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+                is_leader = True
+            else:
+                self.coalesced += 1
+                is_leader = False
+
+        if not is_leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            # Ожидающие получают и исключения вне Exception, а не None
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def stats(self):
+        """Счетчики лидеров и присоединившихся запросов."""
+        with self._lock:
+            return {'leaders': self.leaders, 'coalesced': self.coalesced, 'inFlight': len(self._calls)}
+
+
+class AsyncSingleFlight:
+    """Single-flight для корутин одного цикла событий."""
+
+    def __init__(self):
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key, coro_fn):
+        """
+        Выполняет await coro_fn() один раз на все одновременные вызовы с ключом key.
+
+        Загрузка идет отдельной задачей, и каждый вызывающий (включая лидера)
+        ждет ее через shield: отмена любого из них - например, клиента,
+        отключившегося от потокового ответа, - не отменяет загрузку для
+        остальных.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coro_fn())
+            self._calls[key] = task
+            self.leaders += 1
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self):
+        """Счетчики лидеров и присоединившихся запросов."""
+        return {'leaders': self.leaders, 'coalesced': self.coalesced, 'inFlight': len(self._calls)}
+
+    # === Внутренние методы ===
+    def _finish(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Помечаем исключение прочитанным, даже если все ожидающие отменены
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,91 @@
+"""
+Поиск ближайшей точки на сфере.
+
+Координаты переводятся в точки на единичной сфере (x, y, z): расстояние
+по хорде монотонно связано с расстоянием по поверхности, поэтому обычное
+k-d дерево в трехмерном пространстве находит ближайший город без
+особых случаев у полюсов и линии перемены дат.
+"""
+
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_unit_vector(latitude, longitude):
+    """Точка единичной сферы для широты и долготы в градусах."""
+    lat = math.radians(latitude)
+    lng = math.radians(longitude)
+    cos_lat = math.cos(lat)
+    return (cos_lat * math.cos(lng), cos_lat * math.sin(lng), math.sin(lat))
+
+def chord_to_km(chord):
+    """Расстояние по поверхности Земли для длины хорды единичной сферы."""
+    return 2 * math.asin(min(1.0, chord / 2)) * EARTH_RADIUS_KM
+
+
+class KDTree:
+    """
+    Трехмерное k-d дерево, хранящееся в массивах.
+
+    Узел поддерева [lo, hi) - элемент в середине диапазона, ось разбиения -
+    глубина по модулю 3; отдельных объектов узлов нет.
+    """
+
+    def __init__(self, points):
+        self._points = list(points)
+        self._order = list(range(len(self._points)))
+        self._build(0, len(self._order), 0)
+
+    def __len__(self):
+        return len(self._order)
+
+    def nearest(self, point):
+        """(номер ближайшей точки, квадрат расстояния) или None для пустого дерева."""
+        if not self._order:
+            return None
+        points = self._points
+        order = self._order
+        best = None
+        best_dist = math.inf
+        # (начало, конец, ось, квадрат расстояния до плоскости разбиения)
+        stack = [(0, len(order), 0, 0.0)]
+        while stack:
+            lo, hi, axis, plane_dist = stack.pop()
+            # Поддерево за плоскостью дальше лучшего найденного - пропускаем
+            if lo >= hi or plane_dist >= best_dist:
+                continue
+            mid = (lo + hi) // 2
+            index = order[mid]
+            candidate = points[index]
+            dx = candidate[0] - point[0]
+            dy = candidate[1] - point[1]
+            dz = candidate[2] - point[2]
+            dist = dx * dx + dy * dy + dz * dz
+            if dist < best_dist:
+                best, best_dist = index, dist
+            diff = point[axis] - candidate[axis]
+            next_axis = (axis + 1) % 3
+            if diff < 0:
+                stack.append((mid + 1, hi, next_axis, diff * diff))
+                stack.append((lo, mid, next_axis, 0.0))
+            else:
+                stack.append((lo, mid, next_axis, diff * diff))
+                stack.append((mid + 1, hi, next_axis, 0.0))
+        return best, best_dist
+
+    def _build(self, lo, hi, axis):
+        # Сортировка на каждом уровне проще медианы за O(n) и для сотен
+        # тысяч точек строит дерево за секунды
+        stack = [(lo, hi, axis)]
+        points = self._points
+        order = self._order
+        while stack:
+            lo, hi, axis = stack.pop()
+            if hi - lo <= 1:
+                continue
+            order[lo:hi] = sorted(order[lo:hi], key=lambda i: points[i][axis])
+            mid = (lo + hi) // 2
+            next_axis = (axis + 1) % 3
+            stack.append((lo, mid, next_axis))
+            stack.append((mid + 1, hi, next_axis))
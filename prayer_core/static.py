@@ -0,0 +1,164 @@
+"""
+Статические файлы сайта, загруженные при старте.
+
+StaticSite один раз обходит разрешенные файлы и строит таблицу маршрутов
+путь -> StaticAsset. Небольшие файлы держатся в памяти вместе со сжатым
+вариантом, большие отдаются через sendfile прямо из файла. Для каждого
+файла заранее вычислены Content-Type, ETag, Last-Modified и Cache-Control,
+поэтому обработка запроса - это поиск в словаре и запись готовых байтов.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+
+# Типы, которые имеет смысл сжимать
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/javascript', 'application/json', 'image/svg+xml',
+    'application/xml', 'application/manifest+json',
+)
+# Файлы с хэшем содержимого в имени (index-CfF1guBF.css) не меняются никогда
+HASHED_NAME = re.compile(r'[.-](?=[0-9A-Za-z_]*[0-9])[0-9A-Za-z_]{8,}\.[0-9a-z]+$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+
+class StaticAsset:
+    """Один статический файл с заранее подготовленными заголовками."""
+
+    def __init__(self, path, memory_limit):
+        self.path = path
+        stat = os.stat(path)
+        self.size = stat.st_size
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        self.mtime = int(stat.st_mtime)
+
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type == 'application/javascript':
+            content_type += '; charset=utf-8'
+        self.content_type = content_type
+        self.cache_control = IMMUTABLE_CACHE_CONTROL if HASHED_NAME.search(path) else REVALIDATE_CACHE_CONTROL
+
+        self.body = None
+        self.gzip_body = None
+        if self.size <= memory_limit:
+            with open(path, 'rb') as f:
+                self.body = f.read()
+            self.etag = '"' + hashlib.blake2b(self.body, digest_size=16).hexdigest() + '"'
+            if content_type.startswith(COMPRESSIBLE_TYPES):
+                compressed = gzip.compress(self.body, 9)
+                # Сжатый вариант храним, только если он заметно меньше
+                if len(compressed) < self.size * 0.9:
+                    self.gzip_body = compressed
+        else:
+            # Большие файлы не читаем целиком: ETag по размеру и времени изменения
+            self.etag = f'"{self.size:x}-{self.mtime:x}"'
+
+    @property
+    def gzip_etag(self):
+        return self.etag[:-1] + '-gzip"'
+
+    def not_modified(self, if_none_match, if_modified_since):
+        """Можно ли ответить 304 на условный запрос."""
+        if if_none_match:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            tags = [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+            return '*' in tags or self.etag in tags or self.gzip_etag in tags
+        if if_modified_since:
+            try:
+                return int(parsedate_to_datetime(if_modified_since).timestamp()) >= self.mtime
+            except (TypeError, ValueError, IndexError, OverflowError):
+                return False
+        return False
+
+
+class StaticSite:
+    """Таблица маршрутов статических файлов с откатом на index.html для SPA."""
+
+    def __init__(self, root, entries, index='index.html', memory_limit=256 * 1024):
+        self.root = os.path.realpath(root)
+        self.memory_limit = memory_limit
+        self.routes = {}
+        for entry in entries:
+            self._add(os.path.join(self.root, entry))
+        self.index = self.routes.get('/' + index)
+        if self.index is not None:
+            self.routes['/'] = self.index
+
+    def lookup(self, path):
+        """
+        Файл для пути запроса.
+
+        Неизвестный путь без расширения - маршрут SPA, для него возвращается
+        index.html. Неизвестный путь с расширением или со скрытым сегментом
+        (/.git/HEAD) - отсутствующий файл (None).
+        """
+        asset = self.routes.get(path)
+        if asset is not None:
+            return asset
+        if '.' in path.rsplit('/', 1)[-1] or '/.' in path:
+            return None
+        return self.index
+
+    def stats(self):
+        """Число файлов и объем данных в памяти."""
+        assets = set(self.routes.values())
+        return {
+            'files': len(assets),
+            'memoryBytes': sum(len(a.body) + len(a.gzip_body or b'') for a in assets if a.body is not None),
+        }
+
+    def _add(self, path):
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames[:] = [d for d in dirnames if not d.startswith(('.', '__'))]
+                for filename in filenames:
+                    if not filename.startswith('.'):
+                        self._add_file(os.path.join(dirpath, filename))
+        elif os.path.isfile(path):
+            self._add_file(path)
+
+    def _add_file(self, path):
+        path = os.path.realpath(path)
+        # Символические ссылки за пределы корня не публикуем
+        if not path.startswith(self.root + os.sep):
+            return
+        route = '/' + os.path.relpath(path, self.root).replace(os.sep, '/')
+        self.routes[route] = StaticAsset(path, self.memory_limit)
+
+
+def parse_range(header, size):
+    """
+    Разбирает заголовок Range для одного диапазона байтов.
+
+    Возвращает (начало, длина), None, если заголовок нужно проигнорировать
+    (нет заголовка, другие единицы, несколько диапазонов), или 'invalid'
+    для недостижимого диапазона (ответ 416).
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+    spec = header[6:].strip()
+    if ',' in spec:
+        return None
+    start, sep, end = spec.partition('-')
+    if not sep:
+        return None
+    try:
+        if not start:
+            # bytes=-N: последние N байтов
+            length = int(end)
+            if length <= 0:
+                return 'invalid'
+            length = min(length, size)
+            return size - length, length
+        start = int(start)
+        end = int(end) if end else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return 'invalid'
+    end = min(end, size - 1)
+    return start, end - start + 1
@@ -0,0 +1,315 @@
+"""
+Пакетный расчет расписаний молитв на NumPy.
+
+Тот же алгоритм, что и в calculation.py, но сразу для массива мест и дат:
+результат - массив (места × дни × молитвы) в минутах от местной полуночи.
+Строки форматируются только при сериализации, через готовые таблицы.
+
+Запуск для ночной сборки календарей:
+
+    python -m prayer_core.timetable locations.json --year 2027 --output calendars/
+"""
+
+import argparse
+import json
+import os
+from datetime import date as date_cls, datetime, time as time_cls
+
+import numpy as np
+
+from prayer_core.calculation import (
+    DEFAULT_LATITUDE_ADJUSTMENT, DEFAULT_METHOD, IMSAK_MINUTES, NEAREST_LATITUDE,
+    get_method, get_school, resolve_timezone, _parse_minutes,
+)
+
+# Столбцы результирующего массива
+PRAYERS = ('Fajr', 'Sunrise', 'Dhuhr', 'Asr', 'Maghrib', 'Isha')
+
+_EPOCH_JD = 2440587.5  # юлианская дата 1970-01-01 00:00 UTC
+
+# Таблицы строк для всех минут суток
+_LUT_24 = np.array([f"{m // 60:02d}:{m % 60:02d}" for m in range(1440)] + ['-----'])
+_LUT_12 = np.array(
+    [f"{(m // 60) % 12 or 12}:{m % 60:02d} {'AM' if m < 720 else 'PM'}" for m in range(1440)] + ['-----']
+)
+
+
+# === Тригонометрия в градусах ===
+def _dsin(d):
+    return np.sin(np.radians(d))
+
+def _dcos(d):
+    return np.cos(np.radians(d))
+
+def _fix(a, b):
+    return a - b * np.floor(a / b)
+
+def _sun_position(jd):
+    """Склонение Солнца и уравнение времени для массива юлианских дат."""
+    d = jd - 2451545.0
+    g = _fix(357.529 + 0.98560028 * d, 360.0)
+    q = _fix(280.459 + 0.98564736 * d, 360.0)
+    l = _fix(q + 1.915 * _dsin(g) + 0.020 * _dsin(2 * g), 360.0)
+    e = 23.439 - 0.00000036 * d
+
+    ra = np.degrees(np.arctan2(_dcos(e) * _dsin(l), _dcos(l))) / 15.0
+    equation_of_time = q / 15.0 - _fix(ra, 24.0)
+    declination = np.degrees(np.arcsin(_dsin(e) * _dsin(l)))
+    return declination, equation_of_time
+
+
+def date_range(start, end):
+    """Массив datetime64[D] от start до end включительно."""
+    return np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1)
+
+def year_dates(year):
+    """Все даты года как datetime64[D]."""
+    return date_range(date_cls(year, 1, 1), date_cls(year, 12, 31))
+
+def hijri_dates(dates):
+    """Табличная хиджра для массива дат: (годы, месяцы, дни)."""
+    jd = dates.astype('datetime64[D]').astype(np.int64) + 2440588
+    l = jd - 1948440 + 10632
+    n = (l - 1) // 10631
+    l = l - 10631 * n + 354
+    j = ((10985 - l) // 5316) * ((50 * l) // 17719) + (l // 5670) * ((43 * l) // 15238)
+    l = l - ((30 - j) // 15) * ((17719 * j) // 50) - (j // 16) * ((15238 * j) // 43) + 29
+    month = (24 * l) // 709
+    day = l - (709 * month) // 24
+    year = 30 * n + j - 30
+    return year, month, day
+
+_offsets_cache = {}
+
+def timezone_offsets(zone_name, zone, dates):
+    """
+    Смещения пояса от UTC (в часах) на полдень каждой даты.
+
+    Результат кэшируется по имени пояса и диапазону дат: у тысяч мест
+    обычно лишь несколько десятков различных поясов.
+    """
+    key = (zone_name, str(dates[0]), len(dates))
+    offsets = _offsets_cache.get(key)
+    if offsets is None:
+        offsets = np.array([
+            datetime.combine(day, time_cls(12), zone).utcoffset().total_seconds() / 3600.0
+            for day in dates.astype(object)
+        ])
+        _offsets_cache[key] = offsets
+    return offsets
+
+def compute_minutes(latitudes, longitudes, dates, tz_offsets, method=DEFAULT_METHOD, school=0,
+                    latitude_adjustment=DEFAULT_LATITUDE_ADJUSTMENT):
+    """
+    Рассчитывает времена молитв для мест × дат.
+
+    latitudes, longitudes - массивы формы (L,), dates - datetime64[D] формы (D,),
+    tz_offsets - смещения в часах формы (L, D) или совместимой.
+    Возвращает float-массив (L, D, len(PRAYERS)) с минутами от местной
+    полуночи, округленными до минуты; NaN там, где время не определено
+    (только без коррекции для высоких широт).
+    """
+    params = get_method(method)
+    asr_factor = get_school(school) + 1
+
+    lat = np.asarray(latitudes, dtype=np.float64)[:, None]
+    lng = np.asarray(longitudes, dtype=np.float64)[:, None]
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    tz = np.broadcast_to(np.asarray(tz_offsets, dtype=np.float64), (lat.shape[0], dates.shape[0]))
+    jdate = dates.astype(np.int64)[None, :] + _EPOCH_JD - lng / (15 * 24.0)
+
+    # Положение Солнца зависит только от начального приближения t,
+    # а их всего пять: считаем каждое один раз
+    positions = {}
+
+    def sun_position(t):
+        if t not in positions:
+            positions[t] = _sun_position(jdate + t)
+        return positions[t]
+
+    def mid_day(t):
+        _, eqt = sun_position(t)
+        return _fix(12 - eqt, 24.0)
+
+    def sun_angle_time(angle, t, ccw=False, lat=lat):
+        decl, _ = sun_position(t)
+        noon = mid_day(t)
+        cos_t = (-_dsin(angle) - _dsin(decl) * _dsin(lat)) / (_dcos(decl) * _dcos(lat))
+        with np.errstate(invalid='ignore'):
+            delta = np.degrees(np.arccos(np.where(np.abs(cos_t) <= 1, cos_t, np.nan))) / 15.0
+        return noon - delta if ccw else noon + delta
+
+    rise_set_angle = 0.833
+    isha_minutes = _parse_minutes(params['isha'])
+    maghrib_minutes = _parse_minutes(params.get('maghrib', '0 min'))
+
+    sunrise = sun_angle_time(rise_set_angle, 6 / 24.0, ccw=True)
+    sunset = sun_angle_time(rise_set_angle, 18 / 24.0)
+    # Полярный день или ночь: времена, кроме Зухра, - для широты NEAREST_LATITUDE
+    solar_lat = lat
+    if latitude_adjustment != 'NONE':
+        polar = np.isnan(sunrise) | np.isnan(sunset)
+        if polar.any():
+            solar_lat = np.where(polar, np.copysign(NEAREST_LATITUDE, lat), lat)
+            sunrise = sun_angle_time(rise_set_angle, 6 / 24.0, ccw=True, lat=solar_lat)
+            sunset = sun_angle_time(rise_set_angle, 18 / 24.0, lat=solar_lat)
+
+    def angle_time(angle, t, ccw=False):
+        return sun_angle_time(angle, t, ccw, solar_lat)
+
+    def asr_time(t):
+        decl, _ = sun_position(t)
+        angle = -np.degrees(np.arctan(1.0 / (asr_factor + np.tan(np.radians(np.abs(solar_lat - decl))))))
+        return angle_time(angle, t)
+
+    fajr = angle_time(params['fajr'], 5 / 24.0, ccw=True)
+    dhuhr = mid_day(12 / 24.0)
+    asr = asr_time(13 / 24.0)
+    maghrib = angle_time(params['maghrib'], 18 / 24.0) if maghrib_minutes is None else None
+    isha = angle_time(params['isha'], 18 / 24.0) if isha_minutes is None else None
+
+    # Переход от солнечного времени к поясному
+    shift = tz - lng / 15.0
+    fajr, sunrise, dhuhr, asr, sunset = fajr + shift, sunrise + shift, dhuhr + shift, asr + shift, sunset + shift
+    if maghrib is not None:
+        maghrib = maghrib + shift
+    if isha is not None:
+        isha = isha + shift
+
+    # Коррекция для высоких широт
+    if latitude_adjustment != 'NONE':
+        night = _fix(sunrise - sunset, 24.0)
+
+        def portion(angle):
+            if latitude_adjustment == 'MIDDLE_OF_THE_NIGHT':
+                return night / 2.0
+            if latitude_adjustment == 'ONE_SEVENTH':
+                return night / 7.0
+            return night * angle / 60.0
+
+        def adjust(value, base, angle, ccw):
+            limit = portion(angle)
+            diff = _fix(base - value, 24.0) if ccw else _fix(value - base, 24.0)
+            with np.errstate(invalid='ignore'):
+                replace = np.isnan(value) | (diff > limit)
+            return np.where(replace, base - limit if ccw else base + limit, value)
+
+        fajr = adjust(fajr, sunrise, params['fajr'], ccw=True)
+        if isha is not None:
+            isha = adjust(isha, sunset, params['isha'], ccw=False)
+        if maghrib is not None:
+            maghrib = adjust(maghrib, sunset, params['maghrib'], ccw=False)
+
+    if maghrib is None:
+        maghrib = sunset + maghrib_minutes / 60.0
+    if isha is None:
+        minutes = np.full(dates.shape, isha_minutes)
+        if int(method) == 4:
+            # Умм аль-Кура: в Рамадан Иша через 120 минут после Магриба
+            minutes = np.where(hijri_dates(dates)[1] == 9, 120.0, minutes)
+        isha = maghrib + minutes[None, :] / 60.0
+
+    hours = np.stack([fajr, sunrise, dhuhr, asr, maghrib, isha], axis=-1)
+    return np.floor(_fix(hours * 60.0 + 0.5, 1440.0))
+
+def imsak_minutes(minutes):
+    """Имсак (за IMSAK_MINUTES до Фаджра) из результата compute_minutes."""
+    return _fix(minutes[..., PRAYERS.index('Fajr')] - IMSAK_MINUTES, 1440.0)
+
+def year_timetable(latitude, longitude, year, method=DEFAULT_METHOD, school=0, timezone=None):
+    """Расписание одного места на год: (даты, массив дни × молитвы)."""
+    dates = year_dates(year)
+    zone_name, zone = resolve_timezone(float(latitude), float(longitude), timezone)
+    offsets = timezone_offsets(zone_name, zone, dates)
+    minutes = compute_minutes([latitude], [longitude], dates, offsets[None, :], method, school)
+    return dates, minutes[0]
+
+def locations_timetable(locations, dates, method=DEFAULT_METHOD, school=0):
+    """
+    Расписание для множества мест на одни и те же даты.
+
+    locations - последовательность словарей с latitude, longitude и
+    необязательным timezone. Возвращает массив места × дни × молитвы.
+    """
+    latitudes = np.array([float(loc['latitude']) for loc in locations])
+    longitudes = np.array([float(loc['longitude']) for loc in locations])
+    offsets = np.empty((len(locations), len(dates)))
+    for i, loc in enumerate(locations):
+        zone_name, zone = resolve_timezone(latitudes[i], longitudes[i], loc.get('timezone'))
+        offsets[i] = timezone_offsets(zone_name, zone, dates)
+    return compute_minutes(latitudes, longitudes, dates, offsets, method, school)
+
+
+# === Сериализация ===
+def format_minutes(minutes, twelve_hour=False):
+    """Массив минут -> массив строк 'HH:MM' (или 'h:MM AM/PM')."""
+    index = np.where(np.isnan(minutes), 1440, np.nan_to_num(minutes)).astype(np.int64)
+    return (_LUT_12 if twelve_hour else _LUT_24)[index]
+
+def date_fields(dates):
+    """Поля дат (григорианская и хиджра) для serialize_days, общие для всех мест."""
+    h_year, h_month, h_day = hijri_dates(dates)
+    return [
+        {
+            'gregorianDate': day.strftime('%d-%m-%Y'),
+            'islamicDate': f"{h_day[i]:02d}-{h_month[i]:02d}-{h_year[i]}",
+            'gregorianDay': day.day,
+            'islamicDay': int(h_day[i]),
+            'gregorianMonth': day.month,
+            'islamicMonth': int(h_month[i]),
+        }
+        for i, day in enumerate(dates.astype(object))
+    ]
+
+def serialize_days(dates, minutes, fields=None):
+    """
+    Дни одного места в формате days ответа /api/prayer-times/monthly.
+
+    dates - datetime64[D] формы (D,), minutes - массив (D, len(PRAYERS)).
+    fields - готовый результат date_fields(dates), чтобы не считать его
+    заново для каждого места.
+    """
+    if fields is None:
+        fields = date_fields(dates)
+    formatted = format_minutes(minutes, twelve_hour=True).tolist()
+    return [
+        dict(fields[i], fajr=t[0], sunrise=t[1], dhuhr=t[2], asr=t[3], maghrib=t[4], isha=t[5])
+        for i, t in enumerate(formatted)
+    ]
+
+def build_calendars(locations, year, output_dir, method=DEFAULT_METHOD, school=0):
+    """Записывает годовой календарь каждого места в output_dir/<value>.json."""
+    dates = year_dates(year)
+    minutes = locations_timetable(locations, dates, method, school)
+    fields = date_fields(dates)
+    os.makedirs(output_dir, exist_ok=True)
+    for i, loc in enumerate(locations):
+        name = loc.get('value') or f"{loc['latitude']}_{loc['longitude']}"
+        calendar_data = {
+            'location': loc,
+            'year': year,
+            'method': int(method),
+            'school': int(school),
+            'days': serialize_days(dates, minutes[i], fields),
+        }
+        with open(os.path.join(output_dir, f"{name}.json"), 'w', encoding='utf-8') as f:
+            f.write(json.dumps(calendar_data, ensure_ascii=False))
+    return len(locations)
+
+def main(argv=None):
+    """Точка входа командной строки для сборки календарей."""
+    parser = argparse.ArgumentParser(description='Сборка годовых календарей молитв для списка мест.')
+    parser.add_argument('locations', help='JSON-файл со списком мест (latitude, longitude, value, timezone)')
+    parser.add_argument('--year', type=int, default=date_cls.today().year)
+    parser.add_argument('--method', type=int, default=DEFAULT_METHOD)
+    parser.add_argument('--school', type=int, default=0)
+    parser.add_argument('--output', default='calendars')
+    args = parser.parse_args(argv)
+
+    with open(args.locations, encoding='utf-8') as f:
+        locations = json.load(f)
+    count = build_calendars(locations, args.year, args.output, args.method, args.school)
+    print(f"Built {count} calendars for {args.year} in {args.output}")
+
+if __name__ == '__main__':
+    main()
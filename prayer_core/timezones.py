@@ -0,0 +1,444 @@
+"""
+Определение часового пояса по координатам без внешнего API и быстрый
+перевод времени в местное.
+
+TimezoneResolver строит сетку ячеек (по умолчанию 1°) поверх границ
+поясов из GeoJSON timezone-boundary-builder. Ячейка целиком внутри одного
+пояса хранит его имя, и ответ - поиск в словаре. Для ячеек на границе
+хранятся только отрезки границ, попадающие в ячейку, и принадлежность ее
+центра каждому поясу: точка внутри пояса, если путь от центра до нее
+пересекает границу четное число раз.
+
+Полный GeoJSON занимает десятки мегабайт, поэтому в пакете лежит собранная
+из него сетка ZoneGrid (data/timezones.grid): те же ячейки 1°, а
+пограничные поделены на четверти до 1/64° (~1.7 км), и в каждой - готовый
+пояс. Вне поясов суши (в море) используется пояс города из справочника
+(prayer_core.gazetteer), если точка в его окрестностях, а иначе - морской
+пояс по долготе.
+
+ZoneTable заранее вычисляет смещения пояса от UTC на каждый день
+диапазона лет и моменты переходов на летнее время, так что местные дата и
+минуты суток - это индекс в массиве, одна проверка и целочисленная
+арифметика.
+"""
+
+import json
+import math
+import os
+import struct
+import sys
+import threading
+import time
+import zipfile
+import zlib
+from array import array
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+from . import gazetteer
+from .spatial import chord_to_km, to_unit_vector
+
+# Дальше этого от ближайшего города справочника пояс определяется по
+# долготе: в пределах агломерации пояс города почти всегда верен, а за
+# сотни километров - уже нет (Индианаполис и Чикаго, Львов и Варшава)
+NEAREST_PLACE_MAX_KM = 50
+# Годы, для которых переходы вычисляются заранее (относительно текущего)
+TABLE_YEARS_BEFORE = 1
+TABLE_YEARS_AFTER = 10
+
+# Встроенная сетка поясов (собирается python -m prayer_core.timezones)
+DEFAULT_GRID_PATH = os.path.join(gazetteer.DATA_DIR, 'timezones.grid')
+GRID_MAGIC = b'PTTZGR\x01\x00'
+# magic, глубина деления ячеек, длина списка имен, число узлов
+GRID_HEADER = struct.Struct('<8sIII')
+# Значение ячейки с этим битом - номер узла с четырьмя подъячейками
+GRID_NODE = 0x80000000
+# Ячейки сетки 1° делятся пополам до 1/64° (~1.7 км) у границ поясов
+GRID_DEPTH = 6
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+class TimezoneResolver:
+    """Пояс по координатам: сетка ячеек, границы поясов и ближайший город."""
+
+    def __init__(self, zones=(), places=None, cell_size=1.0, grid=None):
+        """
+        zones - пары (имя пояса, кольца), где кольцо - список точек
+        (долгота, широта); внешние контуры и дыры не различаются.
+        grid - готовая сетка ZoneGrid для точек вне zones.
+        places - справочник gazetteer.Gazetteer для точек вне границ и сетки.
+        """
+        self.cell_size = cell_size
+        self.grid = grid
+        self.places = places
+        self._names = []
+        # ячейка -> имя пояса или [(номер пояса, центр внутри, отрезки)]
+        self._cells = {}
+        border = {}
+        interior = {}
+        for name, rings in zones:
+            index = len(self._names)
+            self._names.append(name)
+            self._add_zone(index, rings, border, interior)
+        for cell in set(border) | set(interior):
+            inside = interior.get(cell, ())
+            edges = border.get(cell)
+            if not edges and len(inside) == 1:
+                self._cells[cell] = self._names[inside[0]]
+                continue
+            edges = edges or {}
+            self._cells[cell] = [
+                (index, index in inside, array('d', edges.get(index, ())))
+                for index in sorted(set(edges) | set(inside))
+            ]
+
+    def __len__(self):
+        return len(self._names)
+
+    def timezone_at(self, latitude, longitude):
+        """Имя пояса IANA для точки или None, если его не определить."""
+        cell = self._cell(latitude, longitude)
+        entry = self._cells.get(cell)
+        if isinstance(entry, str):
+            return entry
+        if entry:
+            center_x, center_y = self._center(cell)
+            for index, center_inside, edges in entry:
+                if center_inside != _crosses_odd(edges, center_x, center_y, longitude, latitude):
+                    return self._names[index]
+        if self.grid is not None:
+            name = self.grid.timezone_at(latitude, longitude)
+            if name is not None:
+                return name
+        return self._nearest_place_timezone(latitude, longitude)
+
+    # === Внутренние методы ===
+    def _cell(self, latitude, longitude):
+        return (int(math.floor(latitude / self.cell_size)), int(math.floor(longitude / self.cell_size)))
+
+    def _center(self, cell):
+        return ((cell[1] + 0.5) * self.cell_size, (cell[0] + 0.5) * self.cell_size)
+
+    def _nearest_place_timezone(self, latitude, longitude):
+        if self.places is None or not len(self.places):
+            return None
+        found = self.places.spatial_index().nearest(to_unit_vector(latitude, longitude))
+        place_id, dist = found
+        if chord_to_km(dist ** 0.5) > NEAREST_PLACE_MAX_KM:
+            return None
+        return self.places.places[place_id].timezone or None
+
+    def _add_zone(self, index, rings, border, interior):
+        size = self.cell_size
+        # Пересечения горизонталей через центры ячеек с границей: строка
+        # сетки -> список долгот пересечений (для заполнения внутренних ячеек)
+        crossings = {}
+        for ring in rings:
+            for i in range(len(ring)):
+                x1, y1 = ring[i - 1]
+                x2, y2 = ring[i]
+                # Ячейки, которые задевает ограничивающий прямоугольник отрезка
+                row_lo = int(math.floor(min(y1, y2) / size))
+                row_hi = int(math.floor(max(y1, y2) / size))
+                col_lo = int(math.floor(min(x1, x2) / size))
+                col_hi = int(math.floor(max(x1, x2) / size))
+                for row in range(row_lo, row_hi + 1):
+                    for col in range(col_lo, col_hi + 1):
+                        border.setdefault((row, col), {}).setdefault(index, []).extend((x1, y1, x2, y2))
+                    center_y = (row + 0.5) * size
+                    if (y1 > center_y) != (y2 > center_y):
+                        x = x1 + (center_y - y1) * (x2 - x1) / (y2 - y1)
+                        crossings.setdefault(row, []).append(x)
+        # Центр ячейки внутри пояса, если левее него нечетное число пересечений
+        for row, xs in crossings.items():
+            xs.sort()
+            for start, end in zip(xs[::2], xs[1::2]):
+                col_lo = int(math.ceil(start / size - 0.5))
+                col_hi = int(math.floor(end / size - 0.5))
+                for col in range(col_lo, col_hi + 1):
+                    interior.setdefault((row, col), []).append(index)
+
+
+def _crosses_odd(edges, ax, ay, bx, by):
+    """Пересекает ли отрезок A-B нечетное число отрезков из плоского массива edges."""
+    odd = False
+    for i in range(0, len(edges), 4):
+        x1, y1, x2, y2 = edges[i], edges[i + 1], edges[i + 2], edges[i + 3]
+        d1 = (bx - ax) * (y1 - ay) - (by - ay) * (x1 - ax)
+        d2 = (bx - ax) * (y2 - ay) - (by - ay) * (x2 - ax)
+        if (d1 > 0) == (d2 > 0):
+            continue
+        d3 = (x2 - x1) * (ay - y1) - (y2 - y1) * (ax - x1)
+        d4 = (x2 - x1) * (by - y1) - (y2 - y1) * (bx - x1)
+        if (d3 > 0) != (d4 > 0):
+            odd = not odd
+    return odd
+
+
+def read_boundaries(path):
+    """
+    Читает границы поясов из GeoJSON timezone-boundary-builder (.json или
+    .zip): пары (имя пояса, кольца).
+    """
+    if path.endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            member = next(n for n in archive.namelist() if n.endswith(('.json', '.geojson')))
+            data = json.loads(archive.read(member))
+    else:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    zones = []
+    for feature in data['features']:
+        geometry = feature['geometry']
+        polygons = geometry['coordinates'] if geometry['type'] == 'MultiPolygon' else [geometry['coordinates']]
+        rings = [[(x, y) for x, y, *_ in ring] for polygon in polygons for ring in polygon]
+        zones.append((feature['properties']['tzid'], rings))
+    return zones
+
+
+class ZoneGrid:
+    """
+    Пояса на заранее собранной сетке: ячейки 1°, а у границ поясов - дерево
+    делений ячейки на четыре части до глубины сборки.
+
+    Значение ячейки - номер пояса (0 - вне поясов, то есть море) или номер
+    узла с четырьмя значениями подъячеек (юго-запад, юго-восток, северо-
+    запад, северо-восток). Поиск - индекс в массиве и не больше глубины
+    шагов по узлам.
+    """
+
+    def __init__(self, path=DEFAULT_GRID_PATH):
+        self.path = path
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, self.depth, names_size, node_count = GRID_HEADER.unpack_from(data, 0)
+        if magic != GRID_MAGIC:
+            raise ValueError(f"{path} is not a timezone grid")
+        data = zlib.decompress(data[GRID_HEADER.size:])
+        offset = 0
+        self.names = [None] + data[offset:offset + names_size].decode('utf-8').split('\n')
+        offset = _align(offset + names_size)
+        self._cells = _read_array(data, offset, 180 * 360)
+        self._nodes = _read_array(data, offset + 4 * 180 * 360, 4 * node_count)
+
+    def __len__(self):
+        return len(self.names) - 1
+
+    def timezone_at(self, latitude, longitude):
+        """Имя пояса для точки или None в море."""
+        latitude = min(max(latitude, -90.0), 89.999999)
+        row = math.floor(latitude)
+        col = math.floor(longitude)
+        y = latitude - row
+        x = longitude - col
+        value = self._cells[(row + 90) * 360 + (col + 180) % 360]
+        nodes = self._nodes
+        while value & GRID_NODE:
+            y *= 2
+            x *= 2
+            quadrant = (y >= 1) * 2 + (x >= 1)
+            y -= y >= 1
+            x -= x >= 1
+            value = nodes[(value ^ GRID_NODE) * 4 + quadrant]
+        return self.names[value]
+
+
+def _align(offset):
+    return (offset + 3) & ~3
+
+def _read_array(data, offset, count):
+    values = array('I')
+    values.frombytes(data[offset:offset + 4 * count])
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+def build_grid(zones, depth=GRID_DEPTH):
+    """
+    Собирает сетку из границ поясов: (имена, значения ячеек 1°, узлы).
+
+    Морские пояса Etc/* пропускаются: в море пояс считается по долготе, а
+    граница суши с морем не дробит ячейки. Ячейка с одним поясом и морем
+    целиком относится к этому поясу. Поделенная до конца ячейка на границе
+    поясов получает пояс своего центра.
+    """
+    zones = [(name, rings) for name, rings in zones if not name.startswith('Etc/')]
+    resolver = TimezoneResolver(zones)
+    names = resolver._names
+    cells = array('I', bytes(4 * 180 * 360))
+    nodes = array('I')
+    known = {}
+    for (row, col), entry in resolver._cells.items():
+        if not -90 <= row < 90:
+            continue
+        if isinstance(entry, str):
+            value = names.index(entry) + 1
+        else:
+            entry = [(index + 1, inside, list(edges)) for index, inside, edges in entry]
+            value = _grid_value(entry, col, row, 1.0, depth, nodes, known)
+        cells[(row + 90) * 360 + (col + 180) % 360] = value
+    return names, cells, nodes
+
+def _grid_value(entry, x0, y0, size, depth, nodes, known):
+    # entry - [(номер пояса, центр внутри, отрезки рядом с ячейкой)]
+    ids = [zone for zone, inside, edges in entry if inside or edges]
+    if len(ids) <= 1:
+        return ids[0] if ids else 0
+    if depth == 0:
+        return next((zone for zone, inside, _ in entry if inside), ids[0])
+    half = size / 2
+    center_x, center_y = x0 + half, y0 + half
+    values = []
+    for quadrant in range(4):
+        left = x0 + half * (quadrant & 1)
+        bottom = y0 + half * (quadrant >> 1)
+        right, top = left + half, bottom + half
+        child_x, child_y = left + half / 2, bottom + half / 2
+        child = []
+        for zone, inside, edges in entry:
+            child_edges = []
+            for i in range(0, len(edges), 4):
+                x1, y1, x2, y2 = edges[i:i + 4]
+                if min(x1, x2) <= right and max(x1, x2) >= left and min(y1, y2) <= top and max(y1, y2) >= bottom:
+                    child_edges.extend((x1, y1, x2, y2))
+            # Центр подъячейки внутри пояса, если путь от центра ячейки
+            # пересекает границу четное число раз при центре внутри
+            child_inside = inside != _crosses_odd(edges, center_x, center_y, child_x, child_y)
+            if child_inside or child_edges:
+                child.append((zone, child_inside, child_edges))
+        values.append(_grid_value(child, left, bottom, half, depth - 1, nodes, known))
+    if values.count(values[0]) == 4 and not values[0] & GRID_NODE:
+        return values[0]
+    key = tuple(values)
+    node = known.get(key)
+    if node is None:
+        node = known[key] = len(nodes) // 4
+        nodes.extend(values)
+    return node | GRID_NODE
+
+def write_grid(path, names, cells, nodes, depth=GRID_DEPTH):
+    """Записывает собранную сетку в двоичный файл."""
+    names_bytes = '\n'.join(names).encode('utf-8')
+    payload = [names_bytes, b'\0' * (_align(len(names_bytes)) - len(names_bytes))]
+    for values in (cells, nodes):
+        if sys.byteorder != 'little':
+            values = array('I', values)
+            values.byteswap()
+        payload.append(values.tobytes())
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(GRID_HEADER.pack(GRID_MAGIC, depth, len(names_bytes), len(nodes) // 4))
+        # Номера поясов в соседних ячейках повторяются: сжатый файл в разы меньше
+        f.write(zlib.compress(b''.join(payload), 9))
+    os.replace(tmp_path, path)
+
+
+class ZoneTable:
+    """
+    Смещения пояса от UTC, вычисленные заранее на каждый день диапазона лет.
+
+    Смещение для момента времени - элемент массива по номеру дня плюс
+    проверка перехода, если он приходится на этот день. Вне диапазона
+    используется ZoneInfo.
+    """
+
+    def __init__(self, name, first_year, last_year):
+        self.name = name
+        self.zone = ZoneInfo(name)
+        self.start = int(datetime(first_year, 1, 1, tzinfo=timezone.utc).timestamp())
+        days = (date(last_year + 1, 1, 1) - date(first_year, 1, 1)).days
+        # Смещение на начало каждого дня (UTC) в секундах
+        self.offsets = array('l')
+        # номер дня -> (момент перехода, новое смещение)
+        self.transitions = {}
+        offset = self._zone_offset(self.start)
+        for day in range(days):
+            day_start = self.start + day * 86400
+            self.offsets.append(offset)
+            next_offset = self._zone_offset(day_start + 86400)
+            if next_offset != offset:
+                # Двоичный поиск секунды перехода внутри дня
+                lo, hi = day_start, day_start + 86400
+                while hi - lo > 1:
+                    mid = (lo + hi) // 2
+                    if self._zone_offset(mid) == offset:
+                        lo = mid
+                    else:
+                        hi = mid
+                self.transitions[day] = (hi, next_offset)
+            offset = next_offset
+
+    def utc_offset(self, timestamp):
+        """Смещение от UTC в секундах для Unix-времени."""
+        day = int(timestamp - self.start) // 86400
+        if 0 <= day < len(self.offsets):
+            transition = self.transitions.get(day)
+            if transition is not None and timestamp >= transition[0]:
+                return transition[1]
+            return self.offsets[day]
+        return self._zone_offset(timestamp)
+
+    def local_time(self, timestamp):
+        """(местная дата, минуты от местной полуночи) для Unix-времени."""
+        seconds = int(timestamp) + self.utc_offset(timestamp)
+        return date.fromordinal(_EPOCH_ORDINAL + seconds // 86400), seconds % 86400 // 60
+
+    def _zone_offset(self, timestamp):
+        return int(datetime.fromtimestamp(timestamp, self.zone).utcoffset().total_seconds())
+
+
+@lru_cache(maxsize=None)
+def zone_table(name):
+    """Таблица смещений пояса (строится при первом обращении)."""
+    year = date.today().year
+    return ZoneTable(name, year - TABLE_YEARS_BEFORE, year + TABLE_YEARS_AFTER)
+
+def local_time(name, timestamp=None):
+    """(местная дата, минуты от местной полуночи) в поясе name; по умолчанию - сейчас."""
+    return zone_table(name).local_time(time.time() if timestamp is None else timestamp)
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+def configure(resolver):
+    """Задает определитель поясов процесса (например, с файлом границ)."""
+    global _resolver
+    _resolver = resolver
+
+def default_resolver():
+    """
+    Определитель поясов процесса; по умолчанию - по встроенной сетке поясов.
+
+    Справочник городов сюда не загружается: сетка покрывает всю сушу, а в
+    море морской пояс не хуже пояса ближайшего города.
+    """
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                _resolver = TimezoneResolver(grid=ZoneGrid())
+    return _resolver
+
+def timezone_at(latitude, longitude):
+    """Имя пояса IANA для координат или None."""
+    return default_resolver().timezone_at(latitude, longitude)
+
+def main(argv=None):
+    """Точка входа командной строки для сборки сетки поясов."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Сборка сетки часовых поясов из границ timezone-boundary-builder.')
+    parser.add_argument('boundaries', help='GeoJSON границ поясов (.json или .zip)')
+    parser.add_argument('output', help='путь к файлу сетки')
+    parser.add_argument('--depth', type=int, default=GRID_DEPTH, help='число делений пограничных ячеек 1° пополам')
+    args = parser.parse_args(argv)
+
+    names, cells, nodes = build_grid(read_boundaries(args.boundaries), args.depth)
+    write_grid(args.output, names, cells, nodes, args.depth)
+    print(f"Built {args.output}: {len(names)} zones, {len(nodes) // 4} nodes")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Общий HTTP-клиент для внешнего API времен молитв (aladhan): через него
+ходит server.py, а заглушка benchmarks/aladhan_stub.py - при записи
+ответов. ASGI-сервер берет отсюда только таймауты и User-Agent.
+
+Один urllib3.PoolManager на процесс: соединения к каждому хосту
+переиспользуются (keep-alive), поэтому TCP- и TLS-рукопожатие происходит
+один раз, а не на каждый промах кэша. Ответы запрашиваются сжатыми и
+распаковываются автоматически.
+
+urllib3 импортируется при первом запросе: модуль подключают и функции,
+которые до внешнего API не доходят (локальный расчет, кэш), и им не нужно
+платить за импорт при холодном старте.
+"""
+
+import json
+import os
+import threading
+
+# Таймауты (секунды) и размер пула соединений на хост
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', 3))
+UPSTREAM_READ_TIMEOUT = float(os.environ.get('UPSTREAM_READ_TIMEOUT', 10))
+UPSTREAM_POOL_SIZE = int(os.environ.get('UPSTREAM_POOL_SIZE', 10))
+
+USER_AGENT = 'PrayerTimesApp/1.0'
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Возвращает общий PoolManager, создавая его при первом обращении."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                import urllib3
+
+                headers = urllib3.make_headers(accept_encoding=True, user_agent=USER_AGENT)
+                _pool = urllib3.PoolManager(
+                    num_pools=16,
+                    maxsize=UPSTREAM_POOL_SIZE,
+                    headers=headers,
+                    timeout=urllib3.Timeout(connect=UPSTREAM_CONNECT_TIMEOUT, read=UPSTREAM_READ_TIMEOUT),
+                    retries=False,
+                )
+    return _pool
+
+def make_timeout(timeout=None):
+    """Таймаут urllib3: число - общий лимит на чтение, None - значения по умолчанию."""
+    import urllib3
+
+    if timeout is None:
+        return urllib3.Timeout(connect=UPSTREAM_CONNECT_TIMEOUT, read=UPSTREAM_READ_TIMEOUT)
+    return urllib3.Timeout(connect=min(UPSTREAM_CONNECT_TIMEOUT, timeout), read=timeout)
+
+def get(url, headers=None, timeout=None):
+    """GET-запрос через общий пул. Возвращает (код ответа, тело в байтах)."""
+    pool = get_pool()
+    # Заголовки запроса заменяют заголовки пула целиком, поэтому объединяем их
+    merged_headers = dict(pool.headers, **headers) if headers else None
+    response = pool.request('GET', url, headers=merged_headers, timeout=make_timeout(timeout))
+    return response.status, response.data
+
+def get_json(url, headers=None, timeout=None):
+    """GET-запрос с разбором JSON. Возвращает (код ответа, данные)."""
+    status, body = get(url, headers=headers, timeout=timeout)
+    return status, json.loads(body.decode('utf-8'))
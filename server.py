@@ -4,41 +4,224 @@
 Обрабатывает статические файлы и API запросы.
 """
 
+import html
 import http.server
 import socketserver
 import json
-import urllib.request
 import urllib.parse
 import os
+import signal
 import sys
+import threading
+import types
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 from pathlib import Path
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import re
 import time
 
+from prayer_core import calculation, gazetteer, timezones, upstream
+from prayer_core.cache import ResponseCache, day_end_local_midnight, month_end_local_midnight
+from prayer_core.ipdb import IPDatabase, TrustedProxies, client_ip
+from prayer_core.keys import CoordinateCanonicalizer, normalize_method, normalize_school
+from prayer_core.preferences import PreferencesStore
+from prayer_core.prewarm import PrewarmScheduler, TrafficCounter
+from prayer_core.responses import EncodedJSON, accepts_gzip
+from prayer_core.static import StaticSite, parse_range
+from prayer_core.singleflight import SingleFlight
+
 # Константы
 PORT = int(os.environ.get('PORT', 8000))
-PRAYER_API_BASE_URL = 'https://api.aladhan.com/v1'
+# Базовый URL внешнего API (aladhan); для нагрузочных тестов - локальная
+# заглушка из benchmarks/aladhan_stub.py
+PRAYER_API_BASE_URL = os.environ.get('PRAYER_API_BASE_URL', 'https://api.aladhan.com/v1').rstrip('/')
+# Источник времен молитв: 'api' - aladhan, 'local' - локальный расчет,
+# 'fallback' - aladhan с локальным расчетом при ошибке запроса
+PRAYER_TIMES_SOURCE = os.environ.get('PRAYER_TIMES_SOURCE', 'api')
+# Молитвы дневного ответа в порядке наступления
+PRAYER_NAMES = ('Fajr', 'Sunrise', 'Dhuhr', 'Asr', 'Maghrib', 'Isha')
+# Поле месячного ответа с исходными данными дней, из которых строятся
+# дневные ответы: хранится в кэше, но не отдается клиентам
+MONTHLY_SOURCE_FIELD = '_source'
+# Ограничения кэша ответов API
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 10000))
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# Привязка координат к ячейкам для ключей кэша: 'grid' (шаг в градусах) или 'geohash'
+CACHE_KEY_MODE = os.environ.get('CACHE_KEY_MODE', 'grid')
+CACHE_GRID_PRECISION = float(os.environ.get('CACHE_GRID_PRECISION', 0.01))
+CACHE_GEOHASH_LENGTH = int(os.environ.get('CACHE_GEOHASH_LENGTH', 6))
+# Постоянный кэш на диске (SQLite): путь к файлу базы (пусто - отключен),
+# число записей, загружаемых в память при старте, и период пакетной записи
+CACHE_DB_PATH = os.environ.get('CACHE_DB_PATH', '')
+CACHE_WARM_ENTRIES = int(os.environ.get('CACHE_WARM_ENTRIES', CACHE_MAX_ENTRIES))
+CACHE_FLUSH_INTERVAL = float(os.environ.get('CACHE_FLUSH_INTERVAL', 1.0))
+# Настройки пользователей: файл SQLite (пусто - только в памяти), сколько
+# пользователей держать в памяти, период отложенной записи и срок, после
+# которого запись в памяти перечитывается из базы при нескольких процессах
+PREFERENCES_DB_PATH = os.environ.get('PREFERENCES_DB_PATH', '')
+PREFERENCES_MAX_ENTRIES = int(os.environ.get('PREFERENCES_MAX_ENTRIES', 100000))
+PREFERENCES_FLUSH_INTERVAL = float(os.environ.get('PREFERENCES_FLUSH_INTERVAL', 1.0))
+PREFERENCES_MAX_AGE = float(os.environ.get('PREFERENCES_MAX_AGE', 5))
+# Фоновый прогрев кэша: период (секунды, 0 - отключен), JSON-файл со списком
+# мест (по умолчанию - популярные места), число самых частых мест из трафика
+# и предел одновременных запросов к внешнему API
+PREWARM_INTERVAL = float(os.environ.get('PREWARM_INTERVAL', 900))
+PREWARM_LOCATIONS = os.environ.get('PREWARM_LOCATIONS', '')
+PREWARM_TOP_N = int(os.environ.get('PREWARM_TOP_N', 50))
+PREWARM_CONCURRENCY = int(os.environ.get('PREWARM_CONCURRENCY', 4))
+# Параллельная обработка запросов: потоков на процесс, очередь ожидающих
+# соединений сверх занятых потоков и число процессов на общем сокете
+SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', 32))
+SERVER_MAX_PENDING = int(os.environ.get('SERVER_MAX_PENDING', 128))
+SERVER_PROCESSES = int(os.environ.get('SERVER_PROCESSES', 1))
+# Постоянные соединения HTTP/1.1: простой между запросами (секунды), после
+# которого соединение закрывается, и число запросов на одно соединение
+SERVER_KEEPALIVE_TIMEOUT = float(os.environ.get('SERVER_KEEPALIVE_TIMEOUT', 15))
+SERVER_KEEPALIVE_MAX_REQUESTS = int(os.environ.get('SERVER_KEEPALIVE_MAX_REQUESTS', 100))
+# Время кэширования клиентами неизменных справочных ответов (секунды)
+STATIC_DATA_MAX_AGE = int(os.environ.get('STATIC_DATA_MAX_AGE', 3600))
+# Пакетный запрос времен молитв: предельное число элементов и число
+# одновременных загрузок промахов кэша
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 100))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 8))
+# Потоковый запрос за период: сколько месяцев загружается наперед,
+# общее число потоков загрузки для всех таких запросов процесса и
+# предельная длина периода в днях
+RANGE_CONCURRENCY = int(os.environ.get('RANGE_CONCURRENCY', 4))
+RANGE_WORKERS = int(os.environ.get('RANGE_WORKERS', 8))
+RANGE_MAX_DAYS = int(os.environ.get('RANGE_MAX_DAYS', 3660))
+# Статические файлы сайта (файлы и директории относительно корня проекта)
+# и предельный размер файла, который держится в памяти (байты)
+STATIC_ASSETS = os.environ.get('STATIC_ASSETS', 'index.html,css,js,generated-icon.png')
+STATIC_MEMORY_LIMIT = int(os.environ.get('STATIC_MEMORY_LIMIT', 256 * 1024))
+# Справочник городов для поиска: файл GeoNames (cities500.txt и т.п.) и
+# справочник стран; по умолчанию - встроенный набор из prayer_core/data
+GAZETTEER_PATH = os.environ.get('GAZETTEER_PATH', gazetteer.DEFAULT_CITIES_PATH)
+GAZETTEER_COUNTRIES_PATH = os.environ.get('GAZETTEER_COUNTRIES_PATH', gazetteer.DEFAULT_COUNTRIES_PATH)
+# Дальше этого (км) от ближайшего города место по координатам не называется городом
+GAZETTEER_MAX_DISTANCE_KM = float(os.environ.get('GAZETTEER_MAX_DISTANCE_KM', gazetteer.NEAREST_MAX_KM))
+# База IP-диапазонов для /api/geo/ip-location (собирается python -m prayer_core.ipdb);
+# без файла возвращается местоположение по умолчанию
+IP_DB_PATH = os.environ.get('IP_DB_PATH', os.path.join(gazetteer.DATA_DIR, 'ip-location.bin'))
+# Прокси, которым доверяется X-Forwarded-For (адреса и сети CIDR через
+# запятую); от остальных соединений берется адрес самого соединения
+TRUSTED_PROXIES = os.environ.get('TRUSTED_PROXIES', '127.0.0.1,::1')
+# Границы часовых поясов (GeoJSON timezone-boundary-builder, можно .zip);
+# без файла пояс берется из встроенной сетки поясов
+TIMEZONE_BOUNDARIES_PATH = os.environ.get('TIMEZONE_BOUNDARIES_PATH', '')
+# Сетка поясов (собирается python -m prayer_core.timezones); пустое значение
+# отключает ее, и пояс берется у ближайшего города или по долготе
+TIMEZONE_GRID_PATH = os.environ.get('TIMEZONE_GRID_PATH', timezones.DEFAULT_GRID_PATH)
+# Сколько ячеек помнят пояс, который для них вернул aladhan
+UPSTREAM_TIMEZONES_MAX = int(os.environ.get('UPSTREAM_TIMEZONES_MAX', 65536))
 
-# Хранилище для пользовательских настроек
-user_preferences = {}
+# Хранилище для пользовательских настроек (с базой подключается после fork)
+user_preferences = PreferencesStore(max_entries=PREFERENCES_MAX_ENTRIES)
 # Кэш для результатов API
-api_cache = {}
+api_cache = ResponseCache(max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, view=lambda value: public_response(value))
+# Объединение одновременных промахов кэша по одному ключу
+upstream_flights = SingleFlight()
+# Частота запросов по местам: (ячейка, широта, долгота, метод, мазхаб)
+traffic = TrafficCounter()
+# Канонизация координат для ключей кэша
+coordinate_canonicalizer = CoordinateCanonicalizer(
+    mode=CACHE_KEY_MODE,
+    precision=CACHE_GRID_PRECISION,
+    geohash_length=CACHE_GEOHASH_LENGTH,
+)
+# Доверенные прокси для адреса клиента
+trusted_proxies = TrustedProxies(TRUSTED_PROXIES)
+# Пояса ячеек из ответов aladhan: (широта, долгота центра ячейки) -> имя пояса
+upstream_timezones = {}
+upstream_timezones_lock = threading.Lock()
+# Статические файлы (загружаются в run_server)
+static_site = None
+# Фоновый прогрев кэша (запускается в run_server)
+prewarm_scheduler = PrewarmScheduler(
+    lambda: prewarm_jobs(),
+    interval=PREWARM_INTERVAL,
+    concurrency=PREWARM_CONCURRENCY,
+)
+
+class BadRequest(ValueError):
+    """Ошибка в параметрах или теле запроса: клиент получает 400 с {"error": ...}."""
 
 class PrayerTimesRequestHandler(http.server.SimpleHTTPRequestHandler):
     """Обработчик HTTP-запросов для Prayer Times."""
     
+    # Постоянные соединения: каждый ответ обязан иметь Content-Length
+    protocol_version = 'HTTP/1.1'
+    # Таймаут сокета: простаивающее соединение закрывается и освобождает поток
+    timeout = SERVER_KEEPALIVE_TIMEOUT
+    # Заголовки и тело пишутся отдельно: без TCP_NODELAY тело ждет ACK
+    # заголовков, и каждый ответ в постоянном соединении опаздывает на ~40 мс
+    disable_nagle_algorithm = True
+    
     def __init__(self, *args, **kwargs):
         # Установка корневой директории для статических файлов
         current_dir = Path(os.path.dirname(os.path.realpath(__file__)))
         super().__init__(*args, directory=str(current_dir), **kwargs)
     
+    def setup(self):
+        """Подготовка соединения."""
+        super().setup()
+        self.requests_handled = 0
+    
+    def end_headers(self):
+        """Завершает заголовки ответа, решая, оставить ли соединение открытым."""
+        self.requests_handled += 1
+        if not self.close_connection:
+            # Когда заняты все потоки, закрываем соединение, чтобы поток
+            # достался соединениям из очереди, а не ждал следующего запроса
+            saturated = getattr(self.server, 'saturated', None)
+            if self.requests_handled >= SERVER_KEEPALIVE_MAX_REQUESTS or (saturated and saturated()):
+                self.send_header('Connection', 'close')
+            else:
+                if self.request_version == 'HTTP/1.0':
+                    self.send_header('Connection', 'keep-alive')
+                remaining = SERVER_KEEPALIVE_MAX_REQUESTS - self.requests_handled
+                self.send_header('Keep-Alive', f"timeout={int(self.timeout)}, max={remaining}")
+        super().end_headers()
+    
+    def send_error(self, code, message=None, explain=None):
+        """
+        Ответ с ошибкой.
+        
+        Для GET и HEAD без тела запроса соединение остается открытым; в
+        остальных случаях (ошибка разбора, непрочитанное тело) - закрывается.
+        """
+        if self.command not in ('GET', 'HEAD') or code not in (404, 405, 416):
+            super().send_error(code, message, explain)
+            return
+        short, long = self.responses.get(code, ('???', '???'))
+        message = message or short
+        body = (self.error_message_format % {
+            'code': code,
+            'message': html.escape(message, quote=False),
+            'explain': html.escape(explain or long, quote=False),
+        }).encode('UTF-8', 'replace')
+        self.send_response(code, message)
+        self.send_header('Content-Type', self.error_content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+    
+    def log_error(self, format, *args):
+        """Журнал ошибок без записей о закрытии простаивающих соединений."""
+        if self.requests_handled and format.startswith('Request timed out'):
+            return
+        super().log_error(format, *args)
+    
     def do_OPTIONS(self):
         """Обработка OPTIONS-запросов для CORS."""
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'X-Requested-With, Content-Type')
+        self.send_header('Content-Length', '0')
         self.end_headers()
     
     def add_cors_headers(self):
@@ -47,13 +230,77 @@ class PrayerTimesRequestHandler(http.server.SimpleHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'X-Requested-With, Content-Type')
     
-    def send_json_response(self, data):
-        """Отправка JSON-ответа."""
-        self.send_response(200)
+    def send_json_response(self, data, cache_control=None, status=200):
+        """
+        Отправка JSON-ответа.
+        
+        data - словарь или уже закодированный EncodedJSON. Тело сжимается,
+        если клиент принимает gzip; на совпавший If-None-Match GET-запрос
+        получает 304 без тела.
+        """
+        encoded = data if isinstance(data, EncodedJSON) else EncodedJSON(data)
+        body, content_encoding, etag = encoded.select(self.headers.get('Accept-Encoding'))
+        not_modified = status == 200 and self.command == 'GET' and encoded.matches(self.headers.get('If-None-Match'))
+        
+        self.send_response(304 if not_modified else status)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', cache_control or self.cache_control)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.add_cors_headers()
+        if not_modified:
+            self.end_headers()
+            return
         self.send_header('Content-Type', 'application/json')
+        if content_encoding:
+            self.send_header('Content-Encoding', content_encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def send_chunked_response(self, chunks, content_type):
+        """
+        Потоковая отправка ответа: каждый элемент chunks (байты) уходит клиенту
+        сразу, без сборки всего ответа в памяти.
+        
+        Для HTTP/1.1 используется Transfer-Encoding: chunked, клиентам HTTP/1.0
+        ответ отправляется без длины с закрытием соединения. Если chunks
+        бросает исключение, статус уже отправлен: ошибка уходит последней
+        NDJSON-строкой {"error": ...}, и ответ все равно завершается.
+        """
+        chunked = self.request_version != 'HTTP/1.0'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Cache-Control', 'no-cache')
         self.add_cors_headers()
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.send_header('Connection', 'close')
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode('utf-8'))
+        
+        def write_chunk(chunk):
+            if chunked:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            else:
+                self.wfile.write(chunk)
+        
+        try:
+            try:
+                for chunk in chunks:
+                    if chunk:
+                        write_chunk(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                raise
+            except Exception as e:
+                self.log_error('Streaming response failed: %s', e)
+                write_chunk(ndjson_line({'error': str(e)}))
+            if chunked:
+                self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            # Клиент закрыл соединение - прекращаем загрузку оставшихся месяцев
+            self.close_connection = True
+        finally:
+            chunks.close()
     
     def handle_api_request(self, path, query_params):
         """Обработка API запросов."""
@@ -61,6 +308,8 @@ class PrayerTimesRequestHandler(http.server.SimpleHTTPRequestHandler):
             return self.handle_prayer_times(query_params)
         elif path == '/api/prayer-times/monthly':
             return self.handle_monthly_prayer_times(query_params)
+        elif path == '/api/prayer-times/range':
+            return self.handle_prayer_times_range(query_params)
         elif path == '/api/geo/ip-location':
             return self.handle_ip_location()
         elif path == '/api/geo/coordinates':
@@ -71,16 +320,37 @@ class PrayerTimesRequestHandler(http.server.SimpleHTTPRequestHandler):
             return self.handle_popular_locations()
         elif path == '/api/preferences':
             return self.handle_get_preferences(query_params)
+        elif path == '/api/cache/stats':
+            stats = dict(api_cache.stats(), singleflight=upstream_flights.stats(),
+                         prewarm=prewarm_scheduler.stats(), preferences=user_preferences.stats())
+            if api_cache.store is not None:
+                stats['store'] = api_cache.store.stats()
+            return stats
         else:
             return None
     
     def handle_post_request(self, path):
-        """Обработка POST запросов."""
-        content_length = int(self.headers['Content-Length'])
+        """
+        Обработка POST запросов.
+        
+        Тело, которое не разбирается как JSON, - ошибка BadRequest (ответ 400).
+        """
+        try:
+            content_length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            raise BadRequest('Invalid Content-Length')
         post_data = self.rfile.read(content_length)
-        request_data = json.loads(post_data.decode('utf-8'))
+        try:
+            request_data = json.loads(post_data.decode('utf-8'))
+        except (ValueError, UnicodeDecodeError):
+            raise BadRequest('Request body must be valid JSON')
+        
+        if path.startswith('/api/preferences/') and not isinstance(request_data, dict):
+            raise BadRequest('Request body must be a JSON object')
         
-        if path == '/api/preferences/theme':
+        if path == '/api/prayer-times/batch':
+            return self.handle_batch_prayer_times(request_data)
+        elif path == '/api/preferences/theme':
             return self.handle_theme_preference(request_data)
         elif path == '/api/preferences/language':
             return self.handle_language_preference(request_data)
@@ -98,7 +368,16 @@ class PrayerTimesRequestHandler(http.server.SimpleHTTPRequestHandler):
         
         # Если это API запрос
         if path.startswith('/api/'):
-            response_data = self.handle_api_request(path, query_params)
+            # Обработчики могут разрешить кэширование ответа клиентом
+            self.cache_control = 'no-cache'
+            try:
+                response_data = self.handle_api_request(path, query_params)
+            except BadRequest as e:
+                self.send_json_response({'error': str(e)}, status=400)
+                return
+            if isinstance(response_data, types.GeneratorType):
+                self.send_chunked_response(response_data, 'application/x-ndjson')
+                return
             if response_data:
                 self.send_json_response(response_data)
                 return
@@ -107,15 +386,85 @@ class PrayerTimesRequestHandler(http.server.SimpleHTTPRequestHandler):
                 return
         
         # Иначе обрабатываем как статический файл
-        try:
-            # Если запрос к корню, возвращаем index.html
-            if path == '/':
-                self.path = '/index.html'
-            super().do_GET()
-        except FileNotFoundError:
-            # Если файл не найден, перенаправляем на index.html для SPA
-            self.path = '/index.html'
-            super().do_GET()
+        self.send_static(path)
+    
+    def do_HEAD(self):
+        """Обработка HEAD-запросов к статическим файлам."""
+        path = urllib.parse.urlparse(self.path).path
+        if path.startswith('/api/'):
+            self.send_error(404, "API endpoint not found")
+            return
+        self.send_static(path, head=True)
+    
+    def send_static(self, path, head=False):
+        """
+        Отправка статического файла из таблицы static_site.
+        
+        Поддерживаются условные запросы (304), gzip для текстовых файлов и
+        один диапазон Range; большие файлы отправляются через sendfile.
+        """
+        asset = static_site.lookup(urllib.parse.unquote(path))
+        if asset is None:
+            self.send_error(404, "File not found")
+            return
+        
+        range_header = self.headers.get('Range')
+        # Диапазоны относятся к несжатому представлению
+        use_gzip = (asset.gzip_body is not None and not range_header
+                    and accepts_gzip(self.headers.get('Accept-Encoding')))
+        etag = asset.gzip_etag if use_gzip else asset.etag
+        
+        if asset.not_modified(self.headers.get('If-None-Match'), self.headers.get('If-Modified-Since')):
+            self.send_response(304)
+            self.send_static_headers(asset, etag)
+            self.end_headers()
+            return
+        
+        byte_range = parse_range(range_header, asset.size)
+        if_range = self.headers.get('If-Range')
+        if byte_range is not None and if_range and if_range not in (asset.etag, asset.last_modified):
+            # Файл изменился с момента частичной загрузки - отдаем целиком
+            byte_range = None
+        if byte_range == 'invalid':
+            self.send_response(416)
+            self.send_header('Content-Range', f"bytes */{asset.size}")
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        
+        if byte_range is not None:
+            start, length = byte_range
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{start + length - 1}/{asset.size}")
+        else:
+            start, length = 0, (len(asset.gzip_body) if use_gzip else asset.size)
+            self.send_response(200)
+        self.send_static_headers(asset, etag)
+        self.send_header('Content-Type', asset.content_type)
+        self.send_header('Content-Length', str(length))
+        if use_gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        if head:
+            return
+        
+        if use_gzip:
+            self.wfile.write(asset.gzip_body)
+        elif asset.body is not None:
+            self.wfile.write(memoryview(asset.body)[start:start + length])
+        else:
+            # Большой файл: ядро копирует данные в сокет без чтения в память
+            with open(asset.path, 'rb') as f:
+                self.connection.sendfile(f, start, length)
+    
+    def send_static_headers(self, asset, etag):
+        """Заголовки кэширования статического файла."""
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', asset.last_modified)
+        self.send_header('Cache-Control', asset.cache_control)
+        self.send_header('Accept-Ranges', 'bytes')
+        if asset.gzip_body is not None:
+            self.send_header('Vary', 'Accept-Encoding')
     
     def do_POST(self):
         """Обработка POST-запросов."""
@@ -123,9 +472,13 @@ class PrayerTimesRequestHandler(http.server.SimpleHTTPRequestHandler):
         
         # Если это API запрос
         if path.startswith('/api/'):
-            response_data = self.handle_post_request(path)
+            try:
+                response_data = self.handle_post_request(path)
+            except BadRequest as e:
+                self.send_json_response({'error': str(e)}, cache_control='no-store', status=400)
+                return
             if response_data:
-                self.send_json_response(response_data)
+                self.send_json_response(response_data, cache_control='no-store')
                 return
             else:
                 self.send_error(404, "API endpoint not found")
@@ -140,37 +493,50 @@ class PrayerTimesRequestHandler(http.server.SimpleHTTPRequestHandler):
         latitude = query_params.get('latitude')
         longitude = query_params.get('longitude')
         method = query_params.get('method', '2')
+        school = query_params.get('school', '1')
         
         if not latitude or not longitude:
             return {'error': 'Latitude and longitude are required'}
         
-        # Создаем ключ кэша
-        cache_key = f"prayer-times-{latitude}-{longitude}-{method}-{datetime.now().strftime('%Y-%m-%d')}"
+        # Приводим параметры к каноническому виду: соседние точки попадают в одну ячейку
+        try:
+            cell, latitude, longitude = coordinate_canonicalizer.snap(latitude, longitude)
+            method = normalize_method(method)
+            school = normalize_school(school)
+        except ValueError as e:
+            return {'error': str(e)}
         
-        # Проверяем кэш
-        if cache_key in api_cache:
-            return api_cache[cache_key]
+        traffic.record((cell, latitude, longitude, method, school))
         
-        # Запрос к внешнему API
-        today_timestamp = int(time.time())
-        url = f"{PRAYER_API_BASE_URL}/timings/{today_timestamp}?latitude={latitude}&longitude={longitude}&method={method}&school=1"
+        # Проверяем кэш; "сегодня" - по местному времени места, а не сервера
+        today = location_today(latitude, longitude)
+        cached = api_cache.get(daily_cache_key(cell, method, school, today))
+        if cached is not None:
+            return with_current_prayer(cached)
         
         try:
-            with urllib.request.urlopen(url) as response:
-                data = json.loads(response.read().decode('utf-8'))
-                
-                if data['code'] == 200:
-                    # Обработка данных
-                    result = process_prayer_times_response(data)
-                    
-                    # Сохраняем в кэш
-                    api_cache[cache_key] = result
-                    return result
-                else:
-                    return {'error': 'Failed to fetch prayer times', 'api_response': data}
+            return with_current_prayer(load_prayer_times(cell, latitude, longitude, method, school, today))
         except Exception as e:
             return {'error': str(e)}
     
+    def handle_prayer_times_range(self, query_params):
+        """Обработчик запроса времен молитв за период from-to (поток NDJSON, день на строку)."""
+        try:
+            cell, latitude, longitude, method, school, start, end = parse_range_request(query_params)
+        except ValueError as e:
+            return {'error': str(e)}
+        
+        traffic.record((cell, latitude, longitude, method, school))
+        return stream_prayer_times_range(cell, latitude, longitude, method, school, start, end)
+    
+    def handle_batch_prayer_times(self, data):
+        """Обработчик пакетного запроса времен молитв для многих мест и дат."""
+        try:
+            items = batch_items(data)
+        except ValueError as e:
+            raise BadRequest(str(e))
+        return {'results': batch_prayer_times(items)}
+    
     def handle_monthly_prayer_times(self, query_params):
         """Обработчик запроса месячных времен молитв."""
         latitude = query_params.get('latitude')
@@ -178,130 +544,219 @@ class PrayerTimesRequestHandler(http.server.SimpleHTTPRequestHandler):
         month = query_params.get('month')
         year = query_params.get('year')
         method = query_params.get('method', '2')
+        school = query_params.get('school', '1')
         
         if not all([latitude, longitude, month, year]):
             return {'error': 'Latitude, longitude, month, and year are required'}
         
-        # Создаем ключ кэша
-        cache_key = f"monthly-{latitude}-{longitude}-{month}-{year}-{method}"
+        # Приводим параметры к каноническому виду: соседние точки попадают в одну ячейку
+        try:
+            cell, latitude, longitude = coordinate_canonicalizer.snap(latitude, longitude)
+            method = normalize_method(method)
+            school = normalize_school(school)
+            month = int(month)
+            year = int(year)
+        except ValueError as e:
+            return {'error': str(e)}
         
-        # Проверяем кэш
-        if cache_key in api_cache:
-            return api_cache[cache_key]
+        traffic.record((cell, latitude, longitude, method, school))
         
-        # Запрос к внешнему API
-        url = f"{PRAYER_API_BASE_URL}/calendar/{year}/{month}?latitude={latitude}&longitude={longitude}&method={method}&school=1"
+        # Проверяем кэш: запись хранит готовый JSON
+        cache_key = monthly_cache_key(cell, month, year, method, school)
+        cached = api_cache.get_encoded(cache_key)
+        if cached is not None:
+            self.cache_control = shared_cache_control(api_cache.expires_at(cache_key))
+            return cached
         
         try:
-            with urllib.request.urlopen(url) as response:
-                data = json.loads(response.read().decode('utf-8'))
-                
-                if data['code'] == 200:
-                    # Обработка данных
-                    result = process_monthly_prayer_times_response(data, int(month), int(year))
-                    
-                    # Сохраняем в кэш
-                    api_cache[cache_key] = result
-                    return result
-                else:
-                    return {'error': 'Failed to fetch monthly prayer times', 'api_response': data}
+            result = load_monthly_prayer_times(cell, latitude, longitude, month, year, method, school)
         except Exception as e:
             return {'error': str(e)}
+        if 'error' not in result:
+            self.cache_control = shared_cache_control(api_cache.expires_at(cache_key))
+        return public_response(result)
     
     def handle_ip_location(self):
         """Обработчик запроса геолокации по IP."""
-        # В простой версии возвращаем Мекку как дефолтную локацию
-        return {
-            "name": "Мекка",
-            "country": "Саудовская Аравия",
-            "latitude": 21.4225,
-            "longitude": 39.8262,
-            "value": "mecca-saudi-arabia"
-        }
+        address = client_ip(self.headers.get('X-Forwarded-For'), self.client_address[0], trusted_proxies)
+        return ip_location(address)
     
     def handle_coordinates(self, query_params):
         """Обработчик запроса информации о местоположении по координатам."""
-        # Простая заглушка
-        return {
-            "name": "Определено по координатам",
-            "country": "Неизвестно",
-            "latitude": float(query_params.get('lat', 0)),
-            "longitude": float(query_params.get('lng', 0)),
-            "value": "custom-location"
-        }
+        try:
+            return coordinates_location(query_params.get('lat', 0), query_params.get('lng', 0))
+        except ValueError as e:
+            raise BadRequest(str(e))
     
     def handle_location_search(self, query_params):
         """Обработчик запроса поиска местоположения."""
-        query = query_params.get('q', '')
-        
-        if not query:
-            return []
-        
-        # Простой поиск по популярным местам
-        popular_locations = get_popular_locations()
-        results = []
-        
-        for location in popular_locations:
-            if query.lower() in location['name'].lower() or query.lower() in location['country'].lower():
-                results.append(location)
-        
-        return results[:10]  # Возвращаем первые 10 результатов
+        return search_locations(query_params.get('q', ''))
     
     def handle_popular_locations(self):
         """Обработчик запроса популярных мест."""
-        return get_popular_locations()
+        self.cache_control = f"public, max-age={STATIC_DATA_MAX_AGE}"
+        return encoded_popular_locations()
     
     def handle_get_preferences(self, query_params):
         """Обработчик запроса получения настроек пользователя."""
-        ip = self.client_address[0]
+        preferences = user_preferences.get(self.client_address[0])
+        if preferences is not None:
+            return preferences
         
-        if ip in user_preferences:
-            return user_preferences[ip]
-        else:
-            # Дефолтные настройки
-            return {
-                "theme": "light",
-                "language": "ru",
-                "location": {
-                    "name": "Мекка",
-                    "country": "Саудовская Аравия",
-                    "latitude": 21.4225,
-                    "longitude": 39.8262,
-                    "value": "mecca-saudi-arabia"
-                }
-            }
+        return default_preferences()
+    
+    def update_preference(self, name, value):
+        """Сохраняет одну настройку пользователя и возвращает ее значение."""
+        user_preferences.update(self.client_address[0], name, value)
+        return value
     
     def handle_theme_preference(self, data):
         """Обработчик запроса изменения темы."""
-        ip = self.client_address[0]
-        
-        if ip not in user_preferences:
-            user_preferences[ip] = {}
-        
-        user_preferences[ip]['theme'] = data.get('theme', 'light')
-        return {"success": True, "theme": user_preferences[ip]['theme']}
+        theme = self.update_preference('theme', data.get('theme', 'light'))
+        return {"success": True, "theme": theme}
     
     def handle_language_preference(self, data):
         """Обработчик запроса изменения языка."""
-        ip = self.client_address[0]
-        
-        if ip not in user_preferences:
-            user_preferences[ip] = {}
-        
-        user_preferences[ip]['language'] = data.get('language', 'ru')
-        return {"success": True, "language": user_preferences[ip]['language']}
+        language = self.update_preference('language', data.get('language', 'ru'))
+        return {"success": True, "language": language}
     
     def handle_location_preference(self, data):
         """Обработчик запроса изменения местоположения."""
-        ip = self.client_address[0]
-        
-        if ip not in user_preferences:
-            user_preferences[ip] = {}
-        
-        user_preferences[ip]['location'] = data.get('location', {})
-        return {"success": True, "location": user_preferences[ip]['location']}
+        location = self.update_preference('location', data.get('location', {}))
+        return {"success": True, "location": location}
 
 # === Вспомогательные функции ===
+def default_location():
+    """Местоположение по умолчанию (Мекка)."""
+    return {
+        "name": "Мекка",
+        "country": "Саудовская Аравия",
+        "latitude": 21.4225,
+        "longitude": 39.8262,
+        "value": "mecca-saudi-arabia"
+    }
+
+def ip_location(address):
+    """Местоположение по IP-адресу из локальной базы или местоположение по умолчанию."""
+    database = ip_database()
+    found = database.lookup(address) if database is not None else None
+    if found is None:
+        return default_location()
+    country_code, city, latitude, longitude = found
+    country = location_gazetteer().country_name(country_code)
+    return {
+        "name": city or country,
+        "country": country,
+        "countryCode": country_code,
+        "latitude": latitude,
+        "longitude": longitude,
+        "value": f"{gazetteer.slug(city or country)}-{gazetteer.slug(country)}"
+    }
+
+@lru_cache(maxsize=1)
+def ip_database():
+    """База IP-диапазонов (отображается в память один раз) или None, если файла нет."""
+    if not os.path.exists(IP_DB_PATH):
+        return None
+    return IPDatabase(IP_DB_PATH)
+
+def default_preferences():
+    """Настройки пользователя по умолчанию."""
+    return {
+        "theme": "light",
+        "language": "ru",
+        "location": default_location()
+    }
+
+def coordinates_location(latitude, longitude):
+    """
+    Информация о местоположении по координатам: ближайший город из справочника,
+    если он не дальше GAZETTEER_MAX_DISTANCE_KM, иначе место без названия.
+    
+    Нечисловые координаты или координаты вне диапазона - ValueError.
+    """
+    try:
+        latitude = float(latitude)
+        longitude = float(longitude)
+    except (TypeError, ValueError):
+        latitude = longitude = None
+    if latitude is None or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError('Invalid coordinates. Latitude must be between -90 and 90, longitude between -180 and 180.')
+    place = location_gazetteer().nearest(latitude, longitude, GAZETTEER_MAX_DISTANCE_KM)
+    if place is None:
+        return {
+            "name": "Определено по координатам",
+            "country": "Неизвестно",
+            "latitude": latitude,
+            "longitude": longitude,
+            "value": "custom-location"
+        }
+    # Времена молитв считаются для самих координат, а не для центра города
+    return dict(place, latitude=latitude, longitude=longitude)
+
+def search_locations(query):
+    """Поиск местоположения по названию города или страны."""
+    if not query:
+        return []
+    return location_gazetteer().search(query, limit=10)
+
+def location_gazetteer():
+    """Справочник городов (загружается один раз на процесс)."""
+    return gazetteer.load(GAZETTEER_PATH, GAZETTEER_COUNTRIES_PATH)
+
+def configure_timezones():
+    """Определитель часовых поясов процесса: по границам поясов, если файл задан, и по сетке поясов."""
+    zones = timezones.read_boundaries(TIMEZONE_BOUNDARIES_PATH) if TIMEZONE_BOUNDARIES_PATH else ()
+    grid = timezones.ZoneGrid(TIMEZONE_GRID_PATH) if TIMEZONE_GRID_PATH else None
+    resolver = timezones.TimezoneResolver(zones, places=location_gazetteer(), grid=grid)
+    timezones.configure(resolver)
+    return resolver
+
+def remember_upstream_timezone(latitude, longitude, name):
+    """
+    Запоминает пояс, который aladhan вернул для канонических координат ячейки.
+    
+    Дальше "сегодня" для ячейки считается в этом поясе: так дата ключа кэша
+    совпадает с датой, для которой внешний API строит расписание.
+    """
+    if not name or upstream_timezones.get((latitude, longitude)) == name:
+        return
+    # Неизвестное локальной базе tzdata имя не подходит для местного времени
+    if calculation.resolve_timezone(latitude, longitude, name)[0] != name:
+        return
+    with upstream_timezones_lock:
+        if len(upstream_timezones) >= UPSTREAM_TIMEZONES_MAX:
+            # Вытесняется самая старая запись
+            upstream_timezones.pop(next(iter(upstream_timezones)))
+        upstream_timezones[(latitude, longitude)] = name
+
+def location_timezone(latitude, longitude):
+    """Имя часового пояса для канонических координат: от aladhan, если он уже отвечал для ячейки."""
+    name = upstream_timezones.get((latitude, longitude))
+    if name is not None:
+        return name
+    return local_location_timezone(latitude, longitude)
+
+@lru_cache(maxsize=65536)
+def local_location_timezone(latitude, longitude):
+    """Имя часового пояса для канонических координат по локальному определителю."""
+    return calculation.resolve_timezone(float(latitude), float(longitude))[0]
+
+def location_today(latitude, longitude):
+    """Сегодняшняя дата в часовом поясе места."""
+    return timezones.local_time(location_timezone(latitude, longitude))[0]
+
+@lru_cache(maxsize=1)
+def encoded_popular_locations():
+    """Список популярных мест, закодированный один раз на процесс."""
+    return EncodedJSON(get_popular_locations())
+
+def shared_cache_control(expires_at):
+    """Cache-Control для ответа, который не изменится до expires_at."""
+    if expires_at is None:
+        return 'no-cache'
+    return f"public, max-age={max(0, int(expires_at - time.time()))}"
+
 def get_popular_locations():
     """Возвращает список популярных местоположений."""
     return [
@@ -349,34 +804,454 @@ def get_popular_locations():
         }
     ]
 
+def timings_url(latitude, longitude, method, school, day=None):
+    """URL запроса /timings к внешнему API на текущий момент или на день day."""
+    when = day.strftime('%d-%m-%Y') if day is not None else int(time.time())
+    return f"{PRAYER_API_BASE_URL}/timings/{when}?latitude={latitude}&longitude={longitude}&method={method}&school={school}"
+
+def calendar_url(latitude, longitude, month, year, method, school):
+    """URL запроса /calendar к внешнему API за месяц."""
+    return f"{PRAYER_API_BASE_URL}/calendar/{year}/{month}?latitude={latitude}&longitude={longitude}&method={method}&school={school}"
+
+def fetch_prayer_times_data(latitude, longitude, method, school, day=None):
+    """Возвращает данные о временах молитв на сегодня (или на день day) в формате aladhan /timings."""
+    if PRAYER_TIMES_SOURCE == 'local':
+        return calculation.timings_response(latitude, longitude, day=day, method=method, school=school)
+    
+    url = timings_url(latitude, longitude, method, school, day)
+    try:
+        # Общий пул соединений: keep-alive вместо нового TLS-рукопожатия на каждый запрос
+        return upstream.get_json(url)[1]
+    except Exception:
+        if PRAYER_TIMES_SOURCE == 'fallback':
+            return calculation.timings_response(latitude, longitude, day=day, method=method, school=school)
+        raise
+
+def fetch_monthly_prayer_times_data(latitude, longitude, month, year, method, school):
+    """Возвращает данные о временах молитв за месяц в формате aladhan /calendar."""
+    if PRAYER_TIMES_SOURCE == 'local':
+        return calculation.calendar_response(latitude, longitude, month, year, method=method, school=school)
+    
+    url = calendar_url(latitude, longitude, month, year, method, school)
+    try:
+        # Общий пул соединений: keep-alive вместо нового TLS-рукопожатия на каждый запрос
+        return upstream.get_json(url)[1]
+    except Exception:
+        if PRAYER_TIMES_SOURCE == 'fallback':
+            return calculation.calendar_response(latitude, longitude, month, year, method=method, school=school)
+        raise
+
+def daily_cache_key(cell, method, school, day):
+    """Ключ кэша дневных времен молитв."""
+    return f"prayer-times-{cell}-{method}-{school}-{day.strftime('%Y-%m-%d')}"
+
+def monthly_cache_key(cell, month, year, method, school):
+    """Ключ кэша месячных времен молитв."""
+    return f"monthly-{cell}-{month}-{year}-{method}-{school}"
+
+def load_prayer_times(cell, latitude, longitude, method, school, day):
+    """
+    Загружает времена молитв на день day в кэш и возвращает результат.
+    
+    День берется из месячного календаря того же места: один запрос /calendar
+    покрывает весь месяц дневных запросов. Одновременные промахи по одному
+    ключу ждут один запрос к внешнему API.
+    """
+    cache_key = daily_cache_key(cell, method, school, day)
+    
+    def load():
+        # Предыдущий лидер мог заполнить кэш, пока мы к нему шли
+        cached = api_cache.peek(cache_key)
+        if cached is not None:
+            return cached
+        
+        monthly = load_monthly_prayer_times(cell, latitude, longitude, day.month, day.year, method, school)
+        result = prayer_times_from_monthly(monthly, day) if 'error' not in monthly else None
+        if result is None:
+            # Месяц недоступен - запрашиваем один день
+            data = fetch_prayer_times_data(latitude, longitude, method, school, day)
+            if data['code'] != 200:
+                return {'error': 'Failed to fetch prayer times', 'api_response': data}
+            result = process_prayer_times_response(data)
+            remember_upstream_timezone(latitude, longitude, result['timezone'])
+        
+        # Сохраняем в кэш до полуночи после этого дня по местному времени
+        api_cache.set(cache_key, result, expires_at=day_end_local_midnight(result['timezone'], day))
+        return result
+    
+    return upstream_flights.do(cache_key, load)
+
+def load_monthly_prayer_times(cell, latitude, longitude, month, year, method, school):
+    """Загружает времена молитв за месяц в кэш и возвращает результат."""
+    cache_key = monthly_cache_key(cell, month, year, method, school)
+    
+    def load():
+        # Предыдущий лидер мог заполнить кэш, пока мы к нему шли
+        cached = api_cache.peek(cache_key)
+        if cached is not None:
+            return cached
+        
+        data = fetch_monthly_prayer_times_data(latitude, longitude, month, year, method, school)
+        
+        if data['code'] == 200:
+            # Обработка данных
+            result = process_monthly_prayer_times_response(data, month, year)
+            
+            # Сохраняем в кэш до конца месяца по местному времени
+            timezone = data['data'][0]['meta']['timezone'] if data['data'] else None
+            remember_upstream_timezone(latitude, longitude, timezone)
+            expires_at = month_end_local_midnight(timezone, month, year)
+            api_cache.set(cache_key, result, expires_at=expires_at)
+            return result
+        else:
+            return {'error': 'Failed to fetch monthly prayer times', 'api_response': data}
+    
+    return upstream_flights.do(cache_key, load)
+
+def parse_request_date(value):
+    """Дата из запроса: YYYY-MM-DD или DD-MM-YYYY (как у aladhan), по умолчанию - сегодня."""
+    if value is None or value == '':
+        return date.today()
+    for date_format in ('%Y-%m-%d', '%d-%m-%Y'):
+        try:
+            return datetime.strptime(str(value), date_format).date()
+        except ValueError:
+            pass
+    raise ValueError(f"Invalid date: {value}")
+
+def batch_items(data):
+    """Список элементов пакетного запроса: сам список или поле items."""
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        raise ValueError('Request body must be a list of items or {"items": [...]}')
+    if len(items) > BATCH_MAX_ITEMS:
+        raise ValueError(f"Too many items: {len(items)} (maximum {BATCH_MAX_ITEMS})")
+    return items
+
+def parse_batch_item(item):
+    """Разбирает элемент пакетного запроса в (ячейка, широта, долгота, метод, мазхаб, дата)."""
+    if not isinstance(item, dict):
+        raise ValueError('Item must be an object')
+    if item.get('latitude') is None or item.get('longitude') is None:
+        raise ValueError('Latitude and longitude are required')
+    try:
+        cell, latitude, longitude = coordinate_canonicalizer.snap(item['latitude'], item['longitude'])
+    except TypeError:
+        raise ValueError(f"Invalid coordinates: {item['latitude']}, {item['longitude']}")
+    # Умолчания - как у GET /api/prayer-times
+    method = normalize_method(item.get('method', 2))
+    school = normalize_school(item.get('school', 1))
+    if item.get('date') in (None, ''):
+        day = location_today(latitude, longitude)
+    else:
+        day = parse_request_date(item['date'])
+    return cell, latitude, longitude, method, school, day
+
+_batch_executor = None
+_range_executor = None
+_executor_lock = threading.Lock()
+
+def get_batch_executor():
+    """Пул потоков для загрузок пакетных запросов (создается лениво, после fork)."""
+    global _batch_executor
+    if _batch_executor is None:
+        with _executor_lock:
+            if _batch_executor is None:
+                _batch_executor = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix='batch')
+    return _batch_executor
+
+def get_range_executor():
+    """
+    Пул потоков для загрузок потоковых запросов за период (создается лениво).
+    
+    Отдельный от пакетного: долгие потоки не занимают потоки пакетных
+    запросов, а все потоки вместе ограничены RANGE_WORKERS загрузками.
+    """
+    global _range_executor
+    if _range_executor is None:
+        with _executor_lock:
+            if _range_executor is None:
+                _range_executor = ThreadPoolExecutor(max_workers=RANGE_WORKERS, thread_name_prefix='range')
+    return _range_executor
+
+def batch_prayer_times(items):
+    """
+    Времена молитв для списка элементов {latitude, longitude, method, school, date}.
+    
+    Попадания берутся из кэша, промахи загружаются параллельно (не больше
+    BATCH_CONCURRENCY одновременно), одинаковые ключи - один раз. Результаты
+    идут в порядке элементов; ошибка элемента не влияет на остальные.
+    """
+    results = [None] * len(items)
+    # Для каждого элемента: запрошен ли сегодняшний (по местному времени) день
+    is_today = [False] * len(items)
+    # Ключ кэша -> (аргументы загрузки, индексы элементов)
+    pending = {}
+    
+    for index, item in enumerate(items):
+        try:
+            cell, latitude, longitude, method, school, day = parse_batch_item(item)
+        except ValueError as e:
+            results[index] = {'error': str(e)}
+            continue
+        is_today[index] = day == location_today(latitude, longitude)
+        traffic.record((cell, latitude, longitude, method, school))
+        cache_key = daily_cache_key(cell, method, school, day)
+        cached = api_cache.get(cache_key)
+        if cached is not None:
+            results[index] = cached
+        else:
+            pending.setdefault(cache_key, ((cell, latitude, longitude, method, school, day), []))[1].append(index)
+    
+    executor = get_batch_executor()
+    futures = [(executor.submit(load_prayer_times, *args), indexes) for args, indexes in pending.values()]
+    for future, indexes in futures:
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {'error': str(e)}
+        for index in indexes:
+            results[index] = result
+    
+    # Отметки текущей молитвы имеют смысл только для сегодняшнего дня
+    return [
+        with_current_prayer(result) if is_today[index] and 'error' not in result else result
+        for index, result in enumerate(results)
+    ]
+
+def parse_range_request(query_params):
+    """
+    Разбирает параметры запроса за период.
+    
+    Возвращает (ячейка, широта, долгота, метод, школа, from, to); при ошибке
+    бросает ValueError с текстом для ответа.
+    """
+    latitude = query_params.get('latitude')
+    longitude = query_params.get('longitude')
+    if not all([latitude, longitude, query_params.get('from'), query_params.get('to')]):
+        raise ValueError('Latitude, longitude, from, and to are required')
+    cell, latitude, longitude = coordinate_canonicalizer.snap(latitude, longitude)
+    method = normalize_method(query_params.get('method', '2'))
+    school = normalize_school(query_params.get('school', '1'))
+    start = parse_request_date(query_params['from'])
+    end = parse_request_date(query_params['to'])
+    if end < start:
+        raise ValueError('The "to" date must not be earlier than "from"')
+    if (end - start).days >= RANGE_MAX_DAYS:
+        raise ValueError(f"Range is too long (maximum {RANGE_MAX_DAYS} days)")
+    return cell, latitude, longitude, method, school, start, end
+
+def range_months(start, end):
+    """Месяцы (месяц, год) от месяца даты start до месяца даты end включительно."""
+    month, year = start.month, start.year
+    while (year, month) <= (end.year, end.month):
+        yield month, year
+        month, year = (1, year + 1) if month == 12 else (month + 1, year)
+
+def ndjson_line(data):
+    """Одна NDJSON-строка в байтах."""
+    return (json.dumps(data) + '\n').encode('utf-8')
+
+def range_month_chunk(monthly, month, year, start, end):
+    """
+    NDJSON-строки дней месяца, попадающих в период, одним блоком байтов.
+    
+    Для месяца, который не удалось загрузить или разобрать, - одна строка
+    с ошибкой: остальные месяцы периода отправляются как обычно.
+    """
+    if 'error' not in monthly:
+        try:
+            lines = [
+                json.dumps(dict(result, isoDate=day.isoformat()))
+                for day, result in monthly_day_results(monthly)
+                if start <= day <= end
+            ]
+        except Exception as e:
+            monthly = {'error': f"Invalid monthly data: {e}"}
+        else:
+            return ('\n'.join(lines) + '\n').encode('utf-8') if lines else b''
+    return ndjson_line({'error': monthly['error'], 'month': month, 'year': year})
+
+def stream_prayer_times_range(cell, latitude, longitude, method, school, start, end):
+    """
+    Генератор NDJSON-блоков с днями от start до end, по месяцу на блок.
+    
+    Месяцы загружаются параллельно, но не больше RANGE_CONCURRENCY вперед от
+    отправляемого, поэтому память не зависит от длины периода, а первый блок
+    уходит сразу после загрузки первого месяца.
+    """
+    executor = get_range_executor()
+    window = deque()
+    
+    def next_chunk():
+        month, year, future = window.popleft()
+        try:
+            monthly = future.result()
+        except Exception as e:
+            monthly = {'error': str(e)}
+        return range_month_chunk(monthly, month, year, start, end)
+    
+    try:
+        for month, year in range_months(start, end):
+            future = executor.submit(load_monthly_prayer_times, cell, latitude, longitude, month, year, method, school)
+            window.append((month, year, future))
+            if len(window) >= RANGE_CONCURRENCY:
+                yield next_chunk()
+        while window:
+            yield next_chunk()
+    finally:
+        # Клиент отключился: еще не начатые загрузки не нужны
+        for _, _, future in window:
+            future.cancel()
+
+def prewarm_targets():
+    """Места для прогрева: список из PREWARM_LOCATIONS и самые частые места из трафика."""
+    if PREWARM_LOCATIONS:
+        with open(PREWARM_LOCATIONS, encoding='utf-8') as f:
+            locations = json.load(f)
+    else:
+        locations = get_popular_locations()
+    
+    targets = []
+    for location in locations:
+        try:
+            cell, latitude, longitude = coordinate_canonicalizer.snap(location['latitude'], location['longitude'])
+            # Умолчания - как у обработчиков запросов
+            method = normalize_method(location.get('method', 2))
+            school = normalize_school(location.get('school', 1))
+        except (KeyError, ValueError) as e:
+            print(f"Skipping prewarm location {location!r}: {e}")
+            continue
+        targets.append((cell, latitude, longitude, method, school))
+    targets.extend(traffic.top(PREWARM_TOP_N))
+    # Убираем повторы, сохраняя порядок
+    return list(dict.fromkeys(targets))
+
+def prewarm_load(loader, *args):
+    """Выполняет загрузку для прогрева; ответ с ошибкой считается неудачей."""
+    result = loader(*args)
+    if 'error' in result:
+        raise RuntimeError(result['error'])
+
+def prewarm_jobs():
+    """Задачи прогрева: сегодня и завтра, текущий и следующий месяц для каждого места."""
+    jobs = []
+    for cell, latitude, longitude, method, school in prewarm_targets():
+        # "Сегодня" - по местному времени места
+        today = location_today(latitude, longitude)
+        days = (today, today + timedelta(days=1))
+        next_month = today.replace(day=1) + timedelta(days=32)
+        months = ((today.month, today.year), (next_month.month, next_month.year))
+        for day in days:
+            if api_cache.peek(daily_cache_key(cell, method, school, day)) is None:
+                jobs.append(partial(prewarm_load, load_prayer_times,
+                                    cell, latitude, longitude, method, school, day))
+        for month, year in months:
+            if api_cache.peek(monthly_cache_key(cell, month, year, method, school)) is None:
+                jobs.append(partial(prewarm_load, load_monthly_prayer_times,
+                                    cell, latitude, longitude, month, year, method, school))
+    return jobs
+
+def day_timings(timings):
+    """Времена шести молитв в 24-часовом формате без пометки часового пояса."""
+    # В ответах /calendar время идет с поясом: "05:12 (MSK)"
+    return {name: timings[name][:5] for name in PRAYER_NAMES}
+
+def day_date_info(date):
+    """Поля даты дневного ответа из блока date ответа aladhan."""
+    return {
+        "date": date['readable'],
+        "gregorianDate": f"{date['gregorian']['day']} {date['gregorian']['month']['en']} {date['gregorian']['year']}",
+        "islamicDate": f"{date['hijri']['day']} {date['hijri']['month']['en']} {date['hijri']['year']} Hijri",
+        "dayOfWeek": date['gregorian']['weekday']['en'],
+    }
+
 def process_prayer_times_response(data):
     """Обрабатывает ответ API молитв и возвращает форматированные данные."""
-    timings = data['data']['timings']
-    date = data['data']['date']
     meta = data['data']['meta']
+    return build_prayer_times_result(
+        day_date_info(data['data']['date']),
+        day_timings(data['data']['timings']),
+        meta['timezone'], meta['latitude'], meta['longitude'],
+    )
+
+def prayer_times_from_monthly(monthly, day):
+    """
+    Дневной ответ на день day из кэшированного месячного ответа.
     
-    # Текущее время в минутах от начала дня
-    now = datetime.now()
-    current_minutes = now.hour * 60 + now.minute
+    Возвращает None, если такого дня в месяце нет или запись создана
+    до того, как месячный ответ начал хранить исходные времена.
+    """
+    for entry_day, result in monthly_day_results(monthly):
+        if entry_day == day:
+            return result
+    return None
+
+def monthly_day_results(monthly):
+    """Пары (дата, дневной ответ) для каждого дня месячного ответа."""
+    source = monthly.get(MONTHLY_SOURCE_FIELD)
+    if source is None:
+        return
+    for entry, day_source in zip(monthly['days'], source['days']):
+        day = date(monthly['gregorianYear'], entry['gregorianMonth'], entry['gregorianDay'])
+        yield day, build_prayer_times_result(
+            day_source['dateInfo'], day_source['timings'],
+            source['timezone'], source['latitude'], source['longitude'],
+        )
+
+def public_response(value):
+    """Ответ для клиента из записи кэша: месячный ответ - без исходных данных дней."""
+    if isinstance(value, dict) and MONTHLY_SOURCE_FIELD in value:
+        return {name: field for name, field in value.items() if name != MONTHLY_SOURCE_FIELD}
+    return value
+
+def build_prayer_times_result(date_info, timings, timezone, latitude, longitude):
+    """
+    Дневной ответ из полей даты и времен молитв в 24-часовом формате.
     
-    # Форматирование молитв
+    Содержит только неизменные за день данные и хранится в кэше; текущую и
+    следующую молитву на момент запроса добавляет with_current_prayer.
+    """
     prayer_times = []
-    prayer_names = [
-        {'name': 'Fajr', 'time': timings['Fajr']},
-        {'name': 'Sunrise', 'time': timings['Sunrise']},
-        {'name': 'Dhuhr', 'time': timings['Dhuhr']},
-        {'name': 'Asr', 'time': timings['Asr']},
-        {'name': 'Maghrib', 'time': timings['Maghrib']},
-        {'name': 'Isha', 'time': timings['Isha']}
-    ]
+    for name in PRAYER_NAMES:
+        # Преобразование времени в минуты
+        time_parts = timings[name].split(':')
+        prayer_times.append({
+            'name': name,
+            'time': timings[name],
+            'timeFormatted': convert_to_12_hour_format(timings[name]),
+            'timeInMinutes': int(time_parts[0]) * 60 + int(time_parts[1])
+        })
+    
+    # Форматирование результата
+    return dict(
+        date_info,
+        location=timezone,
+        timezone=timezone,
+        latitude=str(latitude),
+        longitude=str(longitude),
+        times=prayer_times,
+    )
+
+def with_current_prayer(result, now=None):
+    """
+    Копия дневного ответа с отметками текущей и следующей молитвы.
     
-    current_prayer = None
+    Время берется в часовом поясе места, а не сервера. Кэшированный ответ
+    не изменяется.
+    """
+    if 'times' not in result:
+        return result
+    
+    # Текущее время в минутах от начала дня (по заранее вычисленной таблице пояса)
+    zone_name, _ = calculation.resolve_timezone(float(result['latitude']), float(result['longitude']), result['timezone'])
+    _, current_minutes = timezones.local_time(zone_name, now)
+    
+    prayer_times = []
     next_prayer = None
     
-    for prayer in prayer_names:
-        # Преобразование времени в минуты
-        time_parts = prayer['time'].split(':')
-        time_in_minutes = int(time_parts[0]) * 60 + int(time_parts[1])
+    for prayer in result['times']:
+        time_in_minutes = prayer['timeInMinutes']
         
         # Определение текущей и следующей молитвы
         is_current = False
@@ -385,17 +1260,15 @@ def process_prayer_times_response(data):
         if time_in_minutes <= current_minutes:
             # Эта молитва уже прошла или сейчас
             is_current = True
-            current_prayer = prayer['name']
         elif next_prayer is None:
             # Это первая молитва после текущего времени
             is_upcoming = True
             next_prayer = prayer['name']
         
-        # Форматирование времени
         prayer_time = {
             'name': prayer['name'],
             'time': prayer['time'],
-            'timeFormatted': convert_to_12_hour_format(prayer['time']),
+            'timeFormatted': prayer['timeFormatted'],
             'timeInMinutes': time_in_minutes,
             'isCurrent': is_current,
             'isUpcoming': is_upcoming
@@ -411,20 +1284,8 @@ def process_prayer_times_response(data):
     # Если не нашли следующую молитву в текущий день, первая молитва завтрашнего дня
     if next_prayer is None and prayer_times:
         prayer_times[0]['isUpcoming'] = True
-        next_prayer = prayer_times[0]['name']
     
-    # Форматирование результата
-    return {
-        "date": date['readable'],
-        "gregorianDate": f"{date['gregorian']['day']} {date['gregorian']['month']['en']} {date['gregorian']['year']}",
-        "islamicDate": f"{date['hijri']['day']} {date['hijri']['month']['en']} {date['hijri']['year']} Hijri",
-        "dayOfWeek": date['gregorian']['weekday']['en'],
-        "location": meta['timezone'],
-        "timezone": meta['timezone'],
-        "latitude": str(meta['latitude']),
-        "longitude": str(meta['longitude']),
-        "times": prayer_times
-    }
+    return dict(result, times=prayer_times)
 
 def process_monthly_prayer_times_response(data, month, year):
     """Обрабатывает ответ API месячных молитв и возвращает форматированные данные."""
@@ -436,6 +1297,8 @@ def process_monthly_prayer_times_response(data, month, year):
     
     # Форматируем данные
     days = []
+    # Исходные данные дней: из них строятся дневные ответы без запроса /timings
+    source_days = []
     for day_data in data['data']:
         gregorian_date = day_data['date']['gregorian']
         hijri_date = day_data['date']['hijri']
@@ -456,6 +1319,7 @@ def process_monthly_prayer_times_response(data, month, year):
             'isha': convert_to_12_hour_format(timings['Isha'])
         }
         days.append(day)
+        source_days.append({'timings': day_timings(timings), 'dateInfo': day_date_info(day_data['date'])})
     
     # Находим исламский месяц и год из первого дня
     if data['data']:
@@ -465,13 +1329,22 @@ def process_monthly_prayer_times_response(data, month, year):
         islamic_month = "Unknown"
         islamic_year = "Unknown"
     
-    return {
+    result = {
         "gregorianMonth": month_names[month - 1],
         "gregorianYear": year,
         "islamicMonth": islamic_month,
         "islamicYear": islamic_year,
         "days": days
     }
+    if data['data']:
+        meta = data['data'][0]['meta']
+        result[MONTHLY_SOURCE_FIELD] = {
+            'timezone': meta['timezone'],
+            'latitude': meta['latitude'],
+            'longitude': meta['longitude'],
+            'days': source_days,
+        }
+    return result
 
 def convert_to_12_hour_format(time_str):
     """Конвертирует время из 24-часового в 12-часовой формат."""
@@ -489,14 +1362,189 @@ def convert_to_12_hour_format(time_str):
     else:
         return time_str
 
+class PooledHTTPServer(http.server.HTTPServer):
+    """
+    HTTP-сервер с ограниченным пулом потоков.
+    
+    Каждое соединение обрабатывается в потоке из пула, поэтому медленный
+    запрос к внешнему API не блокирует остальных клиентов. Если заняты все
+    потоки и очередь ожидания, цикл приема соединений ждет освобождения слота.
+    """
+    
+    allow_reuse_address = True
+    request_queue_size = 128
+    
+    def __init__(self, server_address, handler_class, max_workers=SERVER_WORKERS, max_pending=SERVER_MAX_PENDING):
+        super().__init__(server_address, handler_class)
+        self.max_workers = max_workers
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._active_lock = threading.Lock()
+        self.active = 0
+    
+    def saturated(self):
+        """Заняты ли все потоки пула."""
+        return self.active >= self.max_workers
+    
+    def process_request(self, request, client_address):
+        """Передает соединение в пул потоков."""
+        # Пул создается лениво, чтобы он появился уже после fork в дочерних процессах
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='http-worker')
+        self._slots.acquire()
+        try:
+            self._executor.submit(self._process_request_worker, request, client_address)
+        except RuntimeError:
+            self._slots.release()
+            self.shutdown_request(request)
+    
+    def _process_request_worker(self, request, client_address):
+        with self._active_lock:
+            self.active += 1
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            with self._active_lock:
+                self.active -= 1
+            self.shutdown_request(request)
+            self._slots.release()
+    
+    def server_close(self):
+        super().server_close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+def open_persistent_cache(cache):
+    """
+    Подключает к кэшу постоянное хранилище из CACHE_DB_PATH.
+    
+    Возвращает хранилище или None, если CACHE_DB_PATH не задан. Вызывается
+    в каждом процессе после fork: соединения SQLite нельзя делить между
+    процессами, сам файл базы - можно.
+    """
+    if not CACHE_DB_PATH:
+        return None
+    from prayer_core.persistence import PersistentStore
+
+    store = PersistentStore(CACHE_DB_PATH, flush_interval=CACHE_FLUSH_INTERVAL)
+    store.purge_expired()
+    loaded = cache.attach_store(store, warm_entries=CACHE_WARM_ENTRIES)
+    print(f"Loaded {loaded} cached responses from {CACHE_DB_PATH}")
+    return store
+
+def open_preferences_store():
+    """
+    Подключает хранилище настроек к PREFERENCES_DB_PATH.
+    
+    Вызывается в каждом процессе после fork, как и open_persistent_cache.
+    Возвращает хранилище или None, если PREFERENCES_DB_PATH не задан.
+    """
+    global user_preferences
+    if not PREFERENCES_DB_PATH:
+        return None
+    # Память процессов своя: при нескольких процессах записи перечитываются
+    max_age = PREFERENCES_MAX_AGE if SERVER_PROCESSES > 1 else None
+    user_preferences = PreferencesStore(
+        PREFERENCES_DB_PATH,
+        max_entries=PREFERENCES_MAX_ENTRIES,
+        flush_interval=PREFERENCES_FLUSH_INTERVAL,
+        max_age=max_age,
+    )
+    return user_preferences
+
+def load_static_site():
+    """Загружает статические файлы сайта в память и строит таблицу маршрутов."""
+    global static_site
+    root = os.path.dirname(os.path.realpath(__file__))
+    entries = [entry.strip() for entry in STATIC_ASSETS.split(',') if entry.strip()]
+    static_site = StaticSite(root, entries, memory_limit=STATIC_MEMORY_LIMIT)
+    return static_site
+
+def fork_workers(count):
+    """
+    Запускает count дочерних процессов, принимающих соединения с того же сокета.
+    
+    Возвращает список PID дочерних процессов (в самих дочерних - None).
+    У каждого процесса свой кэш и свои настройки пользователей в памяти.
+    """
+    children = []
+    if count <= 0 or not hasattr(os, 'fork'):
+        return children
+    for _ in range(count):
+        pid = os.fork()
+        if pid == 0:
+            return None
+        children.append(pid)
+    return children
+
+def stop_workers(children):
+    """Останавливает дочерние процессы сервера."""
+    for pid in children:
+        try:
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+        except OSError:
+            pass
+
+def handle_sigterm(signum, frame):
+    """SIGTERM завершает сервер так же, как Ctrl+C."""
+    raise KeyboardInterrupt
+
 def run_server():
     """Запуск HTTP-сервера."""
-    with socketserver.TCPServer(("", PORT), PrayerTimesRequestHandler) as httpd:
-        print(f"Serving Prayer Times App at http://localhost:{PORT}")
+    # До fork: дочерние процессы разделяют загруженные файлы с родителем
+    load_static_site()
+    location_gazetteer().spatial_index()
+    print(f"Loaded {len(location_gazetteer())} places from {GAZETTEER_PATH}")
+    if ip_database() is not None:
+        print(f"Loaded {len(ip_database())} IP ranges from {IP_DB_PATH}")
+    resolver = configure_timezones()
+    if TIMEZONE_BOUNDARIES_PATH:
+        print(f"Loaded {len(resolver)} timezone boundaries from {TIMEZONE_BOUNDARIES_PATH}")
+    if resolver.grid is not None:
+        print(f"Loaded {len(resolver.grid)}-zone timezone grid from {TIMEZONE_GRID_PATH}")
+    with PooledHTTPServer(("", PORT), PrayerTimesRequestHandler) as httpd:
+        children = fork_workers(SERVER_PROCESSES - 1)
+        store = open_persistent_cache(api_cache)
+        preferences_store = open_preferences_store()
+        signal.signal(signal.SIGTERM, handle_sigterm)
+        # С общим хранилищем (CACHE_DB_PATH) прогревает только родительский
+        # процесс: его записи читают все процессы, а запросы к внешнему API не
+        # умножаются на число процессов. Без хранилища кэш у каждого процесса
+        # свой, и каждый прогревает его по своему трафику
+        if PREWARM_INTERVAL > 0 and (children is not None or store is None):
+            prewarm_scheduler.start()
+        if children is None:
+            # Дочерний процесс: работает, пока его не остановит родитель
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            try:
+                httpd.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                prewarm_scheduler.stop()
+                if store is not None:
+                    store.close()
+                if preferences_store is not None:
+                    preferences_store.close()
+            return
+        
+        print(f"Serving Prayer Times App at http://localhost:{PORT} "
+              f"({SERVER_PROCESSES} process(es) x {SERVER_WORKERS} threads)")
         try:
             httpd.serve_forever()
         except KeyboardInterrupt:
+            # Повторный SIGTERM не должен прерывать остановку
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
             print("\nServer stopped by user")
+            stop_workers(children)
+            prewarm_scheduler.stop()
+            if store is not None:
+                store.close()
+            if preferences_store is not None:
+                preferences_store.close()
             httpd.server_close()
             sys.exit(0)
 
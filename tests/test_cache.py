@@ -0,0 +1,176 @@
+"""
+Кэш ответов prayer_core.cache: вытеснение LRU, лимит объема и истечение
+записей в местную полночь, включая дни перехода на летнее время.
+"""
+
+import os
+import sys
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prayer_core.cache import (
+    ResponseCache, day_end_local_midnight, month_end_local_midnight, next_local_midnight,
+)
+from prayer_core.responses import EncodedJSON
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def local_timestamp(zone, *args):
+    return datetime(*args, tzinfo=ZoneInfo(zone)).timestamp()
+
+
+def test_lru_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2)
+    cache.set('a', {'v': 1})
+    cache.set('b', {'v': 2})
+    # Обращение к 'a' делает вытесняемым 'b'
+    assert cache.get('a') == {'v': 1}
+    cache.set('c', {'v': 3})
+    assert cache.get('b') is None
+    assert cache.get('a') == {'v': 1}
+    assert cache.get('c') == {'v': 3}
+    assert cache.stats()['evictions'] == 1
+
+
+def test_peek_does_not_refresh_lru():
+    cache = ResponseCache(max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.peek('a') == 1
+    cache.set('c', 3)
+    assert cache.get('a') is None
+    assert cache.stats()['hits'] == 0
+
+
+def test_byte_limit_evicts_oldest():
+    value = {'data': 'x' * 100}
+    size = len(EncodedJSON(value))
+    cache = ResponseCache(max_entries=100, max_bytes=size * 3)
+    for key in range(5):
+        cache.set(key, value)
+    stats = cache.stats()
+    assert stats['entries'] == 3
+    assert stats['bytes'] == size * 3
+    assert [cache.get(key) is not None for key in range(5)] == [False, False, True, True, True]
+
+
+def test_oversized_value_is_not_stored():
+    cache = ResponseCache(max_bytes=50)
+    cache.set('small', {'v': 1})
+    encoded = cache.set('big', {'data': 'x' * 100})
+    assert encoded.body.startswith(b'{')
+    assert cache.get('big') is None
+    assert cache.get('small') == {'v': 1}
+
+
+def test_overwrite_updates_size():
+    cache = ResponseCache()
+    cache.set('a', {'data': 'x' * 100})
+    cache.set('a', {'data': 'y'})
+    assert cache.stats()['bytes'] == len(EncodedJSON({'data': 'y'}))
+
+
+def test_entries_expire_at_deadline():
+    clock = FakeClock()
+    cache = ResponseCache(clock=clock)
+    cache.set('a', 1, expires_at=clock.now + 60)
+    cache.set('b', 2)
+    clock.now += 59
+    assert cache.get('a') == 1
+    assert cache.expires_at('a') == 1060
+    clock.now += 1
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+    assert cache.stats()['expirations'] == 1
+
+
+def test_overwrite_replaces_expiry():
+    clock = FakeClock()
+    cache = ResponseCache(clock=clock)
+    cache.set('a', 1, expires_at=clock.now + 10)
+    cache.set('a', 2, expires_at=clock.now + 100)
+    clock.now += 50
+    assert cache.get('a') == 2
+    assert cache.stats()['expirations'] == 0
+
+
+def test_get_encoded_returns_cached_body():
+    cache = ResponseCache()
+    encoded = cache.set('a', {'v': 1})
+    assert cache.get_encoded('a') is encoded
+    assert cache.get_encoded('missing') is None
+
+
+def test_next_local_midnight():
+    now = local_timestamp('Asia/Riyadh', 2024, 6, 21, 23, 30)
+    assert next_local_midnight('Asia/Riyadh', now) == local_timestamp('Asia/Riyadh', 2024, 6, 22)
+    # Неизвестный пояс - полночь по UTC
+    utc_now = datetime(2024, 6, 21, 12).timestamp()
+    assert next_local_midnight('Not/AZone', utc_now) == next_local_midnight('UTC', utc_now)
+
+
+def test_day_end_on_dst_days():
+    # Весной сутки короче на час, осенью длиннее
+    start = local_timestamp('Europe/Berlin', 2024, 3, 31)
+    assert day_end_local_midnight('Europe/Berlin', date(2024, 3, 31), now=start) - start == 23 * 3600
+    start = local_timestamp('Europe/Berlin', 2024, 10, 27)
+    assert day_end_local_midnight('Europe/Berlin', date(2024, 10, 27), now=start) - start == 25 * 3600
+
+
+def test_midnight_skipped_by_dst():
+    # В Сантьяго часы переводятся в полночь: после 23:59 7 сентября идет 01:00
+    now = local_timestamp('America/Santiago', 2024, 9, 7, 22)
+    midnight = next_local_midnight('America/Santiago', now)
+    assert midnight - now == 2 * 3600
+    assert datetime.fromtimestamp(midnight, ZoneInfo('America/Santiago')).date() == date(2024, 9, 8)
+
+
+def test_past_day_lives_until_next_midnight():
+    now = local_timestamp('Europe/Berlin', 2024, 6, 21, 12)
+    expected = local_timestamp('Europe/Berlin', 2024, 6, 22)
+    assert day_end_local_midnight('Europe/Berlin', date(2024, 6, 1), now=now) == expected
+    assert month_end_local_midnight('Europe/Berlin', 5, 2024, now=now) == expected
+
+
+def test_month_end():
+    now = local_timestamp('America/New_York', 2024, 12, 5)
+    assert month_end_local_midnight('America/New_York', 12, 2024, now=now) == \
+        local_timestamp('America/New_York', 2025, 1, 1)
+
+
+class FakeStore:
+    def __init__(self):
+        self.rows = {}
+
+    def put(self, key, value, expires_at=None, encoded=None):
+        self.rows[key] = (value, expires_at, encoded)
+
+    def get(self, key):
+        row = self.rows.get(key)
+        return None if row is None else (row[0], row[1])
+
+
+def test_view_hides_private_fields_from_clients():
+    view = lambda value: {name: field for name, field in value.items() if name != '_source'}
+    cache = ResponseCache(view=view)
+    store = FakeStore()
+    cache.attach_store(store)
+    value = {'days': [1, 2], '_source': {'days': [3, 4]}}
+    encoded = cache.set('a', value)
+    assert encoded.body == EncodedJSON({'days': [1, 2]}).body
+    assert cache.get('a') == value
+    # Хранилище получает значение целиком, без готового JSON для клиента
+    assert store.rows['a'] == (value, None, None)
+
+    # Запись, поднятая из хранилища, тоже отдается через view
+    fresh = ResponseCache(view=view)
+    fresh.attach_store(store)
+    assert fresh.get_encoded('a').body == encoded.body
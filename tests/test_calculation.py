@@ -0,0 +1,78 @@
+"""
+Локальный расчет времен молитв (prayer_core.calculation и timetable).
+
+Эталонные времена для Мекки - расписание Умм аль-Кура на этот день;
+расчет может отличаться от него на минуту из-за округления.
+"""
+
+import os
+import sys
+from datetime import date
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prayer_core import calculation
+
+MECCA = (21.4225, 39.8262)
+TROMSO = (69.6492, 18.9553)
+
+
+def minutes(value):
+    h, m = value.split(':')
+    return int(h) * 60 + int(m)
+
+
+def test_mecca_umm_al_qura():
+    timings = calculation.timings_response(*MECCA, day=date(2024, 6, 21), method=4)['data']['timings']
+    expected = {'Fajr': '04:12', 'Sunrise': '05:39', 'Dhuhr': '12:22', 'Asr': '15:41', 'Maghrib': '19:06'}
+    for name, value in expected.items():
+        assert abs(minutes(timings[name]) - minutes(value)) <= 2, (name, timings[name])
+    # Умм аль-Кура: Иша через 90 минут после Магриба
+    assert minutes(timings['Isha']) - minutes(timings['Maghrib']) == 90
+
+
+def test_umm_al_qura_ramadan_isha():
+    # 2024-03-20 - 10 Рамадана по табличной хиджре
+    timings = calculation.timings_response(*MECCA, day=date(2024, 3, 20), method=4)['data']['timings']
+    assert minutes(timings['Isha']) - minutes(timings['Maghrib']) == 120
+
+
+@pytest.mark.parametrize('day', [date(2024, 6, 21), date(2024, 12, 21)])
+@pytest.mark.parametrize('latitude', [TROMSO[0], 78.2, 89.0, -89.0])
+@pytest.mark.parametrize('school', [0, 1])
+def test_polar_day_and_night_defined(day, latitude, school):
+    timings = calculation.timings_response(latitude, TROMSO[1], day=day, school=school,
+                                           timezone='Europe/Oslo')['data']['timings']
+    undefined = [name for name, value in timings.items() if value == '-----']
+    assert not undefined
+    order = [minutes(timings[name]) for name in ('Sunrise', 'Dhuhr', 'Asr', 'Maghrib')]
+    assert order == sorted(order)
+
+
+def test_polar_day_dhuhr_is_solar_noon():
+    timings = calculation.timings_response(*TROMSO, day=date(2024, 6, 21), timezone='Europe/Oslo')['data']['timings']
+    assert abs(minutes(timings['Dhuhr']) - minutes('12:46')) <= 1
+
+
+def test_no_adjustment_keeps_undefined_times():
+    times = calculation.compute_times(2024, 6, 21, *TROMSO, 2.0, latitude_adjustment='NONE')
+    assert calculation.format_time(times['sunrise']) == '-----'
+
+
+def test_polar_calendar_all_days_defined():
+    data = calculation.calendar_response(*TROMSO, 6, 2024, timezone='Europe/Oslo')['data']
+    assert len(data) == 30
+    assert all('-----' not in day['timings'].values() for day in data)
+
+
+def test_timetable_matches_scalar_engine():
+    timetable = pytest.importorskip('prayer_core.timetable')
+    for latitude, longitude in (MECCA, TROMSO, (-89.0, 18.96)):
+        dates, table = timetable.year_timetable(latitude, longitude, 2024, timezone='Europe/Oslo')
+        formatted = timetable.format_minutes(table).tolist()
+        for i in range(0, len(formatted), 7):
+            day = dates[i].astype(object)
+            timings = calculation.timings_response(latitude, longitude, day=day,
+                                                   timezone='Europe/Oslo')['data']['timings']
+            assert formatted[i] == [timings[name] for name in timetable.PRAYERS], (latitude, day)
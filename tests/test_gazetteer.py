@@ -0,0 +1,137 @@
+"""
+Справочник мест prayer_core.gazetteer: приведение названий, поиск по
+префиксу на любом алфавите, опечатки и порядок по населению.
+"""
+
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prayer_core import gazetteer
+from prayer_core.gazetteer import Gazetteer, Place, fold
+
+
+def place(name, population, *alternate_names, country_code='XX', latitude=0.0, longitude=0.0):
+    return Place(name, [name, *alternate_names], country_code, latitude, longitude, population, 'UTC')
+
+
+def names(results):
+    return [result['name'] for result in results]
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('Москва', 'moskva'),
+    ('MOSCOW', 'moscow'),
+    ('São Paulo', 'sao paulo'),
+    ('Rostov-on-Don', 'rostov on don'),
+    ("Sana'a", 'sanaa'),
+    ('Київ', 'kiyiv'),
+    ('  Нижний   Новгород ', 'nizhniy novgorod'),
+])
+def test_fold(text, expected):
+    assert fold(text) == expected
+
+
+@pytest.mark.parametrize('query', ['moskva', 'москва', 'moscow', 'Moscow', 'МОСК', 'mosc'])
+def test_bundled_moscow(query):
+    assert gazetteer.load().search(query, limit=1)[0]['name'] == 'Moscow'
+
+
+@pytest.fixture
+def small():
+    places = [
+        place('Moscow', 12506468, 'Moskva', 'Москва', country_code='RU', latitude=55.7558, longitude=37.6173),
+        place('Mosul', 1683000, 'الموصل', country_code='IQ', latitude=36.34, longitude=43.13),
+        place('Mostar', 105797, country_code='BA', latitude=43.34, longitude=17.81),
+        place('New York', 8336817, country_code='US', latitude=40.71, longitude=-74.01),
+        place('York', 153717, country_code='GB', latitude=53.96, longitude=-1.08),
+        place('Kazan', 1257391, 'Казань', country_code='RU', latitude=55.80, longitude=49.11),
+    ]
+    countries = {'RU': ('Россия', ('Russia',)), 'GB': ('Великобритания', ('United Kingdom',))}
+    return Gazetteer(places, countries)
+
+
+def test_prefix_search_is_ordered_by_population(small):
+    assert names(small.search('mos')) == ['Moscow', 'Mosul', 'Mostar']
+    assert names(small.search('мос')) == ['Moscow', 'Mosul', 'Mostar']
+    assert names(small.search('mos', limit=2)) == ['Moscow', 'Mosul']
+    # Слово внутри составного названия
+    assert names(small.search('york')) == ['New York', 'York']
+    assert names(small.search('الموصل')) == ['Mosul']
+
+
+def test_country_search(small):
+    assert names(small.search('россия')) == ['Moscow', 'Kazan']
+    assert names(small.search('russia', limit=1)) == ['Moscow']
+
+
+@pytest.mark.parametrize('query', ['moscw', 'mowcow', 'mosocw', 'mosscow', 'масква'])
+def test_one_edit_typo(small, query):
+    assert names(small.search(query)) == ['Moscow']
+
+
+def test_typo_needs_min_length_and_one_edit(small):
+    # Короткие запросы без совпадений не исправляются
+    assert small.search('kzn') == []
+    # Две правки - уже не опечатка
+    assert small.search('mscw') == []
+    # Точные совпадения важнее опечаток: "kazan" не ищет похожие названия
+    assert names(small.search('kazan')) == ['Kazan']
+
+
+def test_empty_query(small):
+    assert small.search('') == []
+    assert small.search(' - ') == []
+
+
+def test_precomputed_top_matches_scan():
+    rng = random.Random(7)
+    places = [place(f"Sa{rng.choice('lmnr')}{i}", rng.randrange(1, 10 ** 6)) for i in range(1000)]
+    places += [place(f"Te{i}", rng.randrange(1, 10 ** 6)) for i in range(50)]
+    index = Gazetteer(places)
+    # Большие группы префиксов ранжированы заранее, маленькие - нет
+    assert 's' in index._top and 'sa' in index._top
+    assert 't' not in index._top
+    for query in ('s', 'sa', 'sal', 't', 'te1'):
+        key = fold(query)
+        expected = sorted((p for p in places if fold(p.name).startswith(key)), key=lambda p: -p.population)
+        found = index.search(query, limit=gazetteer.TOP_SIZE)
+        assert [r['population'] for r in found] == [p.population for p in expected[:gazetteer.TOP_SIZE]]
+    # Лимит больше заранее вычисленного списка считается сканированием
+    assert len(index.search('sa', limit=gazetteer.TOP_SIZE + 5)) == gazetteer.TOP_SIZE + 5
+
+
+def test_nearest(small):
+    found = small.nearest(55.75, 37.62)
+    assert found['name'] == 'Moscow'
+    assert found['distanceKm'] < 1
+    assert found['value'] == 'moscow-rossiya'
+    assert Gazetteer([]).nearest(0, 0) is None
+
+
+def test_nearest_max_distance(small):
+    # Мостар в ~8 км от точки, дальше 5 км городов нет
+    assert small.nearest(43.4, 17.8)['name'] == 'Mostar'
+    assert small.nearest(43.4, 17.8, max_km=5) is None
+    # Посреди океана ближайший город в тысячах километров - не считается
+    assert small.nearest(0, 0) is None
+    assert small.nearest(0, 0, max_km=None)['name'] == 'Mostar'
+
+
+@pytest.mark.parametrize('latitude, longitude, expected', [
+    (37.3891, -5.9845, 'Sevilla'),
+    (39.7684, -86.1581, 'Indianapolis'),
+    (69.6492, 18.9553, 'Tromsø'),
+])
+def test_bundled_nearest(latitude, longitude, expected):
+    found = gazetteer.load().nearest(latitude, longitude)
+    assert found['name'] == expected
+    assert found['distanceKm'] < 5
+
+
+def test_bundled_nearest_far_from_cities():
+    # Точка (0, 0) в Гвинейском заливе: до побережья Ганы ~600 км
+    assert gazetteer.load().nearest(0, 0) is None
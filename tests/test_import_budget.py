@@ -0,0 +1,75 @@
+"""
+Бюджет времени импорта serverless-функций из api/.
+
+Импорт модуля функции - часть холодного старта на Vercel. Каждая функция
+импортируется в отдельном процессе после того, что загружает сама среда
+выполнения (http.server, json), и проверяется, что импорт укладывается в
+бюджет и не тянет тяжелые модули, которые нужны только части запросов.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Бюджет импорта (мс) сверх http.server; с запасом на медленные машины CI
+DEFAULT_BUDGET_MS = 25
+BUDGETS_MS = {
+    'api/prayer-times.py': 15,
+    'api/prayer-times-monthly.py': 15,
+}
+# Модули, которые не должны загружаться при импорте ни одной функции
+FORBIDDEN_MODULES = ('requests', 'urllib3', 'argparse', 'csv', 'gzip', 'zipfile')
+# Локальный расчет подключается только при первом запросе, которому он нужен
+LAZY_CALCULATION = ('api/prayer-times.py', 'api/prayer-times-monthly.py')
+# Лучший из нескольких замеров: шум планировщика только увеличивает время
+RUNS = 3
+
+_MEASURE = """
+import importlib.util, sys, time
+import http.server, json, urllib.parse
+before = set(sys.modules)
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location('endpoint', sys.argv[1])
+spec.loader.exec_module(importlib.util.module_from_spec(spec))
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({'ms': elapsed, 'modules': sorted(set(sys.modules) - before)}))
+"""
+
+
+def endpoints():
+    found = []
+    for directory, _, files in os.walk(os.path.join(ROOT, 'api')):
+        for name in files:
+            if name.endswith('.py'):
+                found.append(os.path.relpath(os.path.join(directory, name), ROOT).replace(os.sep, '/'))
+    return sorted(found)
+
+def measure(endpoint):
+    # Хранилище настроек в тесте - в памяти, а не в /tmp по умолчанию
+    env = dict(os.environ, PREFERENCES_DB_PATH=':memory:')
+    output = subprocess.run(
+        [sys.executable, '-c', _MEASURE, os.path.join(ROOT, endpoint)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output)
+
+
+@pytest.mark.parametrize('endpoint', endpoints())
+def test_import_budget(endpoint):
+    results = [measure(endpoint) for _ in range(RUNS)]
+    modules = results[0]['modules']
+    elapsed = min(result['ms'] for result in results)
+
+    loaded = [name for name in modules if name.split('.')[0] in FORBIDDEN_MODULES]
+    assert not loaded, f"{endpoint} imports {loaded} at load time"
+    if endpoint in LAZY_CALCULATION:
+        assert 'prayer_core.calculation' not in modules
+        assert 'zoneinfo' not in modules
+
+    budget = BUDGETS_MS.get(endpoint, DEFAULT_BUDGET_MS)
+    assert elapsed <= budget, f"{endpoint} imports in {elapsed:.1f} ms (budget {budget} ms)"
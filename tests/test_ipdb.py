@@ -0,0 +1,168 @@
+"""
+Локальная база IP-диапазонов prayer_core.ipdb: сборка из CSV
+(read_ranges -> write_database) и поиск по собранному файлу.
+"""
+
+import gzip
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prayer_core.ipdb import IPDatabase, TrustedProxies, client_ip, read_ranges, write_database
+
+# DB-IP: start,end,continent,country,stateprov,city,latitude,longitude
+DBIP_CSV = """\
+# комментарий
+1.0.0.0,1.0.0.255,OC,AU,Queensland,Brisbane,-27.4679,153.0281
+1.0.1.0,1.0.3.255,AS,CN,Fujian,Fuzhou,26.0614,119.3061
+1.0.4.0,1.0.7.255,AS,CN,Fujian,Fuzhou,26.0614,119.3061
+1.0.16.0,1.0.31.255,AS,JP,Tokyo,Tokyo,35.6895,139.6917
+1.0.32.0,1.0.32.255,ZZ,ZZ,-,-,0,0
+8.8.8.0,8.8.8.255,NA,US,California,Mountain View,37.3861,-122.0839
+::ffff:9.9.9.0,::ffff:9.9.9.255,EU,CH,Zurich,Zurich,47.3769,8.5417
+10.0.0.0,2001:db8::,EU,DE,Berlin,Berlin,52.52,13.405
+2001:4860::,2001:4860:ffff:ffff:ffff:ffff:ffff:ffff,NA,US,California,Mountain View,37.3861,-122.0839
+2a00:1450::,2a00:1450:ffff:ffff:ffff:ffff:ffff:ffff,EU,IE,Leinster,Dublin,53.3498,-6.2603
+"""
+
+# IP2Location LITE: адреса числами, IPv4 в IPv6-файле - как ::ffff:a.b.c.d
+IP2LOCATION_CSV = """\
+"281470698586368","281470698586623","SA","Saudi Arabia","Makkah","Mecca","21.4225","39.8262"
+"42540766411282592856903984951653826560","42540766411283801782723599580828532735","SA","Saudi Arabia","Riyadh","Riyadh","24.7136","46.6753"
+"""
+
+MOUNTAIN_VIEW = ['US', 'Mountain View', 37.3861, -122.0839]
+
+
+def build(tmp_path, text, name='ranges.csv', csv_format='dbip'):
+    source = tmp_path / name
+    if name.endswith('.gz'):
+        with gzip.open(source, 'wt', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        source.write_text(text, encoding='utf-8')
+    ranges4, ranges6, locations = read_ranges([str(source)], csv_format)
+    path = str(tmp_path / 'ip-location.bin')
+    write_database(path, ranges4, ranges6, locations)
+    return IPDatabase(path)
+
+
+@pytest.fixture(params=['ranges.csv', 'ranges.csv.gz'])
+def database(tmp_path, request):
+    db = build(tmp_path, DBIP_CSV, request.param)
+    yield db
+    db.close()
+
+
+def test_read_ranges_merges_and_skips_rows(tmp_path):
+    source = tmp_path / 'ranges.csv'
+    source.write_text(DBIP_CSV, encoding='utf-8')
+    ranges4, ranges6, locations = read_ranges([str(source)])
+    # Соседние диапазоны одного места склеены; ZZ и смешанные версии пропущены
+    assert [(start, end) for start, end, _ in ranges4] == [
+        (0x01000000, 0x010000FF), (0x01000100, 0x010007FF), (0x01001000, 0x01001FFF),
+        (0x08080800, 0x080808FF), (0x09090900, 0x090909FF),
+    ]
+    assert [(start, end) for start, end, _ in ranges6] == [
+        (0x20014860 << 32, (0x20014860 << 32) | 0xFFFFFFFF),
+        (0x2A001450 << 32, (0x2A001450 << 32) | 0xFFFFFFFF),
+    ]
+    assert len(locations) == 6
+    # Место хранится один раз для IPv4 и IPv6
+    assert ranges4[3][2] == ranges6[0][2]
+
+
+def test_ipv4_lookup(database):
+    assert len(database) == 7
+    assert database.lookup('1.0.0.0') == ['AU', 'Brisbane', -27.4679, 153.0281]
+    assert database.lookup('1.0.0.255')[1] == 'Brisbane'
+    assert database.lookup('1.0.1.0')[1] == 'Fuzhou'
+    assert database.lookup('1.0.7.255')[1] == 'Fuzhou'
+    assert database.lookup('1.0.20.1')[1] == 'Tokyo'
+    assert database.lookup('8.8.8.8') == MOUNTAIN_VIEW
+
+
+@pytest.mark.parametrize('address', ['0.0.0.1', '1.0.8.0', '1.0.15.255', '1.0.32.1', '8.8.9.0', '255.255.255.255'])
+def test_ipv4_gaps_miss(database, address):
+    assert database.lookup(address) is None
+
+
+def test_ipv6_lookup(database):
+    assert database.lookup('2001:4860:4860::8888') == MOUNTAIN_VIEW
+    assert database.lookup('[2001:4860:ffff:ffff::1]') == MOUNTAIN_VIEW
+    assert database.lookup('2a00:1450:4001:81c::200e')[1] == 'Dublin'
+
+
+@pytest.mark.parametrize('address', ['::1', '2001:db8::1', '2001:4861::', '2a00:1451::1', 'ffff::1'])
+def test_ipv6_gaps_miss(database, address):
+    assert database.lookup(address) is None
+
+
+def test_ipv4_mapped_addresses(database):
+    # Адрес ::ffff:a.b.c.d ищется среди диапазонов IPv4, и в запросе, и в CSV
+    assert database.lookup('::ffff:8.8.8.8') == MOUNTAIN_VIEW
+    assert database.lookup('::ffff:9.9.9.9')[1] == 'Zurich'
+    assert database.lookup('9.9.9.9')[1] == 'Zurich'
+    assert database.lookup('::ffff:1.0.8.1') is None
+
+
+@pytest.mark.parametrize('address', ['', 'localhost', '1.2.3', '1.2.3.256', '2001:::1'])
+def test_invalid_addresses_miss(database, address):
+    assert database.lookup(address) is None
+
+
+def test_ip2location_numeric_ranges(tmp_path):
+    db = build(tmp_path, IP2LOCATION_CSV, csv_format='ip2location')
+    try:
+        assert db.lookup('1.1.1.1') == ['SA', 'Mecca', 21.4225, 39.8262]
+        assert db.lookup('::ffff:1.1.1.1')[1] == 'Mecca'
+        assert db.lookup('1.1.2.1') is None
+        assert db.lookup('2001:db8::1')[1] == 'Riyadh'
+    finally:
+        db.close()
+
+
+def test_rejects_foreign_file(tmp_path):
+    path = tmp_path / 'other.bin'
+    path.write_bytes(b'\0' * 64)
+    with pytest.raises(ValueError):
+        IPDatabase(str(path))
+
+
+def test_client_ip_ignores_forwarded_for_without_trusted_proxy():
+    # Без доверенных прокси заголовок может подделать любой клиент
+    assert client_ip('203.0.113.7', '198.51.100.1') == '198.51.100.1'
+    assert client_ip('203.0.113.7', '198.51.100.1', TrustedProxies('127.0.0.1')) == '198.51.100.1'
+    assert client_ip('', '127.0.0.1', TrustedProxies('127.0.0.1')) == '127.0.0.1'
+
+
+def test_client_ip_takes_rightmost_untrusted_hop():
+    trusted = TrustedProxies('127.0.0.1, 10.0.0.0/8, ::1')
+    # Левый адрес прислал сам клиент - им он может назваться кем угодно
+    assert client_ip('1.2.3.4, 203.0.113.7, 10.0.0.1', '127.0.0.1', trusted) == '203.0.113.7'
+    assert client_ip('203.0.113.7', '::1', trusted) == '203.0.113.7'
+    assert client_ip('203.0.113.7', '::ffff:127.0.0.1', trusted) == '203.0.113.7'
+    # Вся цепочка из доверенных адресов - берется самый левый
+    assert client_ip('10.1.2.3, 10.0.0.1', '127.0.0.1', trusted) == '10.1.2.3'
+    # Мусор в цепочке останавливает разбор на последнем доверенном адресе
+    assert client_ip('203.0.113.7, unknown, 10.0.0.1', '127.0.0.1', trusted) == '10.0.0.1'
+    assert client_ip('garbage', '127.0.0.1', trusted) == '127.0.0.1'
+
+
+def test_trusted_proxies():
+    trusted = TrustedProxies('192.168.0.0/16, 2001:db8::/32')
+    assert '192.168.4.5' in trusted and '::ffff:192.168.4.5' in trusted
+    assert '2001:db8::1' in trusted and '[2001:db8::1]' in trusted
+    assert '192.169.0.1' not in trusted and '2001:db9::1' not in trusted and 'garbage' not in trusted
+    assert '203.0.113.7' in TrustedProxies('*')
+    assert '127.0.0.1' not in TrustedProxies('')
+    # Vercel перезаписывает заголовок сам, поэтому доверяется любому соединению
+    assert client_ip('1.2.3.4, 203.0.113.7', '10.9.8.7', TrustedProxies('*')) == '1.2.3.4'
+
+
+@pytest.mark.parametrize('spec', ['localhost', '10.0.0.0/33', '10.0.0.0/x', '::1/129'])
+def test_trusted_proxies_rejects_invalid(spec):
+    with pytest.raises(ValueError):
+        TrustedProxies(spec)
@@ -0,0 +1,99 @@
+"""
+Ключи кэша prayer_core.keys: привязка координат к ячейкам сетки и
+геохэша, проверка координат и нормализация метода и мазхаба.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prayer_core.keys import (
+    CoordinateCanonicalizer, geohash_center, geohash_encode, normalize_method, normalize_school, parse_coordinates,
+)
+
+
+def test_equal_numbers_share_a_cell():
+    grid = CoordinateCanonicalizer(precision=0.01)
+    cells = {grid.snap(lat, lng) for lat, lng in [
+        ('55.7558', '37.6173'), ('55.75580', '37.61730'), (55.7558, 37.6173), (' 55.7558', '37.6173 '), ('55.7601', '37.6198'),
+    ]}
+    assert cells == {('55.76,37.62', 55.76, 37.62)}
+
+
+@pytest.mark.parametrize('precision, expected', [(0.1, '55.8,37.6'), (0.05, '55.75,37.60'), (1, '56,38')])
+def test_grid_precision(precision, expected):
+    assert CoordinateCanonicalizer(precision=precision).snap(55.7558, 37.6173)[0] == expected
+
+
+@pytest.mark.parametrize('latitude, longitude, expected', [
+    # -0.0 и 0.0 - один ключ
+    (-0.0, -0.0, '0.00,0.00'),
+    (-0.001, -0.004, '0.00,0.00'),
+    # Долгота приводится к [-180, 180): 180 и -180 - одна ячейка
+    (10, 180, '10.00,-180.00'),
+    (10, -180, '10.00,-180.00'),
+    (10, 179.996, '10.00,-180.00'),
+    (10, 540, '10.00,-180.00'),
+    (10, 190, '10.00,-170.00'),
+    (10, -190.5, '10.00,169.50'),
+    (90, 0, '90.00,0.00'),
+])
+def test_grid_edges(latitude, longitude, expected):
+    cell, lat, lng = CoordinateCanonicalizer().snap(latitude, longitude)
+    assert cell == expected
+    assert f"{lat:.2f},{lng:.2f}" == cell
+
+
+@pytest.mark.parametrize('latitude, longitude', [
+    ('nan', 0), (0, 'nan'), (90.01, 0), (-91, 0), ('inf', 0), (0, 'inf'), (0, '-inf'), ('north', 0), ('', 0),
+])
+def test_invalid_coordinates(latitude, longitude):
+    with pytest.raises(ValueError):
+        parse_coordinates(latitude, longitude)
+    with pytest.raises(ValueError):
+        CoordinateCanonicalizer().snap(latitude, longitude)
+
+
+def test_geohash():
+    assert geohash_encode(57.64911, 10.40744, 11) == 'u4pruydqqvj'
+    assert geohash_encode(55.7558, 37.6173, 6) == 'ucfv0n'
+    lat, lng = geohash_center('ucfv0n')
+    # Центр ячейки лежит в ней же и близок к исходной точке (ячейка ~1.2 × 0.6 км)
+    assert geohash_encode(lat, lng, 6) == 'ucfv0n'
+    assert abs(lat - 55.7558) < 0.003 and abs(lng - 37.6173) < 0.006
+
+
+def test_geohash_mode():
+    geohash = CoordinateCanonicalizer(mode='geohash', geohash_length=6)
+    cell, lat, lng = geohash.snap('55.7558', '37.6173')
+    assert cell == 'ucfv0n'
+    assert (lat, lng) == tuple(round(value, 6) for value in geohash_center(cell))
+    assert geohash.snap(55.75580, 37.61730) == (cell, lat, lng)
+    # Долгота приводится до кодирования
+    assert geohash.snap(0, 180)[0] == geohash.snap(0, -180)[0]
+    with pytest.raises(ValueError):
+        CoordinateCanonicalizer(mode='h3')
+
+
+@pytest.mark.parametrize('value, expected', [(None, 2), ('', 2), (' ', 2), ('02', 2), (' 4 ', 4), (3, 3), ('0', 0)])
+def test_normalize_method(value, expected):
+    assert normalize_method(value) == expected
+
+
+@pytest.mark.parametrize('value', ['-1', 'isna', '2.5', -3])
+def test_normalize_method_rejects(value):
+    with pytest.raises(ValueError, match='Invalid calculation method'):
+        normalize_method(value)
+
+
+@pytest.mark.parametrize('value, expected', [(None, 0), ('', 0), ('1', 1), (' 0 ', 0), (1, 1), ('01', 1)])
+def test_normalize_school(value, expected):
+    assert normalize_school(value) == expected
+
+
+@pytest.mark.parametrize('value', ['2', '-1', 'hanafi', '0.5'])
+def test_normalize_school_rejects(value):
+    with pytest.raises(ValueError, match='Invalid school'):
+        normalize_school(value)
@@ -0,0 +1,60 @@
+"""
+Хранилище настроек prayer_core.preferences: LRU по сегментам, счетчики
+под блокировками сегментов и отложенная запись в SQLite.
+"""
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prayer_core.preferences import PreferencesStore
+
+
+def test_counters_are_exact_under_concurrency():
+    store = PreferencesStore(max_entries=64, shards=4)
+    threads, calls = 8, 2000
+
+    def worker(n):
+        for i in range(calls):
+            store.get(f"user-{(n * calls + i) % 200}")
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    stats = store.stats()
+    assert stats['hits'] + stats['misses'] == threads * calls
+    assert stats['entries'] <= 64
+
+
+def test_update_keeps_other_settings():
+    store = PreferencesStore(max_entries=1, shards=1)
+    store.update('a', 'theme', 'dark')
+    store.update('a', 'language', 'ar')
+    assert store.get('a') == {'theme': 'dark', 'language': 'ar'}
+    # Без базы вытесненный пользователь теряется
+    store.update('b', 'theme', 'light')
+    assert store.get('a') is None
+
+
+def test_evicted_user_is_read_back_from_database(tmp_path):
+    path = str(tmp_path / 'preferences.sqlite3')
+    store = PreferencesStore(path, max_entries=1, shards=1)
+    store.update('a', 'theme', 'dark')
+    store.update('b', 'theme', 'light')
+    store.flush()
+    assert store.get('a') == {'theme': 'dark'}
+    store.update('a', 'language', 'ar')
+    store.close()
+
+    reopened = PreferencesStore(path)
+    try:
+        assert reopened.get('a') == {'theme': 'dark', 'language': 'ar'}
+        assert reopened.get('missing') is None
+        assert reopened.stats()['misses'] == 2
+        assert reopened.get('missing') is None
+        assert reopened.stats()['hits'] == 1
+    finally:
+        reopened.close()
@@ -0,0 +1,76 @@
+"""
+Заранее закодированные ответы prayer_core.responses: выбор gzip по
+Accept-Encoding и сравнение If-None-Match с ETag обоих представлений.
+"""
+
+import gzip
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prayer_core.responses import GZIP_MIN_SIZE, EncodedJSON, accepts_gzip
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, False),
+    ('', False),
+    ('gzip', True),
+    ('GZIP', True),
+    ('deflate, gzip, br', True),
+    ('gzip;q=0.5', True),
+    ('gzip; q=1.0', True),
+    ('x-gzip', True),
+    ('gzip;q=0', False),
+    ('gzip;q=0.000', False),
+    ('gzip;q=abc', False),
+    ('br, deflate', False),
+    ('identity', False),
+    ('*', True),
+    ('*;q=0', False),
+    # Явная запись gzip важнее '*' в любом порядке
+    ('gzip;q=0, *', False),
+    ('*, gzip;q=0', False),
+    ('*;q=0, gzip', True),
+    ('gzip;level=1;q=0', False),
+])
+def test_accepts_gzip(header, expected):
+    assert accepts_gzip(header) is expected
+
+
+LARGE = {'items': [{'name': f"place {i}", 'latitude': i / 7} for i in range(100)]}
+
+
+def test_select():
+    encoded = EncodedJSON(LARGE)
+    assert json.loads(encoded.body) == LARGE
+    body, content_encoding, etag = encoded.select('gzip, br')
+    assert content_encoding == 'gzip' and etag == encoded.gzip_etag
+    assert gzip.decompress(body) == encoded.body
+    assert encoded.select('br') == (encoded.body, None, encoded.etag)
+    assert encoded.gzip_etag != encoded.etag and encoded.gzip_etag.endswith('-gzip"')
+    # Маленький ответ не сжимается
+    small = EncodedJSON({'ok': True})
+    assert len(small) < GZIP_MIN_SIZE
+    assert small.select('gzip') == (small.body, None, small.etag)
+
+
+def test_etag_depends_on_body_only():
+    assert EncodedJSON({'a': 1}).etag == EncodedJSON(body=b'{"a": 1}').etag
+    assert EncodedJSON({'a': 1}).etag != EncodedJSON({'a': 2}).etag
+
+
+def test_matches():
+    encoded = EncodedJSON(LARGE)
+    assert encoded.matches(encoded.etag)
+    assert encoded.matches(encoded.gzip_etag)
+    assert encoded.matches('W/' + encoded.etag)
+    assert encoded.matches('"other", W/' + encoded.gzip_etag)
+    assert encoded.matches(' * ')
+    assert not encoded.matches(None)
+    assert not encoded.matches('')
+    assert not encoded.matches('"other"')
+    assert not encoded.matches(encoded.etag[1:-1])
+    assert not encoded.matches(EncodedJSON({'a': 1}).etag)
@@ -0,0 +1,387 @@
+"""
+HTTP-обработчики server.py поверх локальной заглушки aladhan
+(benchmarks/aladhan_stub.py): пакетный запрос времен молитв, настройки,
+потоковый запрос за период, место по координатам и статические файлы.
+"""
+
+import gzip
+import http.client
+import json
+import os
+import socket
+import sys
+import threading
+from datetime import date, timedelta
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import server
+from benchmarks.aladhan_stub import StubState, serve
+from prayer_core.cache import ResponseCache
+from prayer_core.static import StaticSite
+
+MECCA = {'latitude': 21.4225, 'longitude': 39.8262}
+
+
+def start(httpd):
+    thread = threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    return httpd
+
+
+@pytest.fixture
+def stub():
+    state = StubState(seed=1)
+    httpd = start(serve(state))
+    yield state, f"http://127.0.0.1:{httpd.server_port}/v1"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def port(stub, monkeypatch):
+    """Порт server.py, который ходит в заглушку; кэш - свой на каждый тест."""
+    monkeypatch.setattr(server, 'PRAYER_API_BASE_URL', stub[1])
+    monkeypatch.setattr(server, 'PRAYER_TIMES_SOURCE', 'api')
+    monkeypatch.setattr(server, 'api_cache', ResponseCache(view=server.public_response))
+    monkeypatch.setattr(server.PrayerTimesRequestHandler, 'log_message', lambda *args: None)
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), server.PrayerTimesRequestHandler)
+    httpd.daemon_threads = True
+    start(httpd)
+    yield httpd.server_port
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def request(port, method, path, body=None, headers=None):
+    """Запрос к серверу: (ответ, тело в байтах)."""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        return response, response.read()
+    finally:
+        conn.close()
+
+
+def post_batch(port, body):
+    if not isinstance(body, bytes):
+        body = json.dumps(body).encode('utf-8')
+    response, data = request(port, 'POST', '/api/prayer-times/batch', body)
+    return response.status, json.loads(data)
+
+
+def test_batch_results_in_order_with_item_errors(stub, port):
+    day = dict(MECCA, date='2024-06-21')
+    items = [day, {'longitude': 39.8}, 'Mecca', {'latitude': 'north', 'longitude': 1},
+             dict(MECCA, date='21/06/2024'), dict(day, method=4), day]
+    status, data = post_batch(port, {'items': items})
+    assert status == 200
+    results = data['results']
+    assert len(results) == len(items)
+    assert [('error' in result) for result in results] == [False, True, True, True, True, False, False]
+    assert results[0]['gregorianDate'] == results[6]['gregorianDate']
+    assert results[0] == results[6]
+    # Одинаковые ключи - один запрос календаря, другой метод - еще один
+    assert stub[0].stats()['requests'] == {'calendar': 2}
+
+
+def test_batch_upstream_failure_is_per_item(stub, port):
+    stub[0].error_rate = 1.0
+    status, data = post_batch(port, [dict(MECCA, date='2024-06-21'), {'latitude': 1}])
+    assert status == 200
+    assert [('error' in result) for result in data['results']] == [True, True]
+
+
+def test_batch_item_limit(port, monkeypatch):
+    monkeypatch.setattr(server, 'BATCH_MAX_ITEMS', 2)
+    items = [dict(MECCA, date='2024-06-21')] * 3
+    status, data = post_batch(port, items[:2])
+    assert status == 200 and len(data['results']) == 2
+    status, data = post_batch(port, items)
+    assert status == 400
+    assert 'Too many items' in data['error']
+
+
+@pytest.mark.parametrize('body', [b'{"items": [', b'\xff\xfe', b'', b'{"items": {"latitude": 1}}', b'"items"'])
+def test_batch_rejects_malformed_body(port, body):
+    status, data = post_batch(port, body)
+    assert status == 400
+    assert 'error' in data
+
+
+@pytest.mark.parametrize('name', ['theme', 'language', 'location'])
+@pytest.mark.parametrize('body', [b'[1]', b'"dark"', b'null', b'{"theme": '])
+def test_preferences_reject_non_object_body(port, monkeypatch, name, body):
+    monkeypatch.setattr(server, 'user_preferences', server.PreferencesStore())
+    response, data = request(port, 'POST', f"/api/preferences/{name}", body)
+    assert response.status == 400
+    assert 'error' in json.loads(data)
+    # Ошибка не обрывает обработку: правильное тело по-прежнему принимается
+    response, data = request(port, 'POST', f"/api/preferences/{name}", json.dumps({name: 'dark'}).encode('utf-8'))
+    assert response.status == 200
+    assert json.loads(data) == {'success': True, name: 'dark'}
+
+
+def get_range(port, **params):
+    query = '&'.join(f"{name}={value}" for name, value in dict(MECCA, **params).items())
+    return request(port, 'GET', f"/api/prayer-times/range?{query}")
+
+
+def ndjson(body):
+    assert body.endswith(b'\n')
+    return [json.loads(line) for line in body.decode('utf-8').splitlines()]
+
+
+def test_range_streams_one_line_per_day(stub, port):
+    response, body = get_range(port, **{'from': '2024-01-30', 'to': '2024-03-02'})
+    assert response.status == 200
+    assert response.getheader('Content-Type') == 'application/x-ndjson'
+    assert response.getheader('Transfer-Encoding') == 'chunked'
+    days = ndjson(body)
+    expected = [date(2024, 1, 30) + timedelta(days=i) for i in range(33)]
+    assert [day['isoDate'] for day in days] == [day.isoformat() for day in expected]
+    assert all('times' in day for day in days)
+    assert stub[0].stats()['requests'] == {'calendar': 3}
+
+
+def test_range_chunked_body_is_terminated(port):
+    with socket.create_connection(('127.0.0.1', port), timeout=30) as sock:
+        sock.sendall(b'GET /api/prayer-times/range?latitude=21.4&longitude=39.8&from=2024-01-01&to=2024-02-29 '
+                     b'HTTP/1.1\r\nHost: test\r\nConnection: close\r\n\r\n')
+        raw = b''
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            raw += data
+    head, _, body = raw.partition(b'\r\n\r\n')
+    assert b'Transfer-Encoding: chunked' in head
+    assert body.endswith(b'\r\n0\r\n\r\n')
+
+
+def test_range_failed_month_becomes_error_line(stub, port, monkeypatch):
+    load = server.load_monthly_prayer_times
+
+    def flaky(cell, latitude, longitude, month, year, method, school):
+        if month == 2:
+            raise OSError('upstream unavailable')
+        return load(cell, latitude, longitude, month, year, method, school)
+
+    monkeypatch.setattr(server, 'load_monthly_prayer_times', flaky)
+    response, body = get_range(port, **{'from': '2024-01-31', 'to': '2024-03-01'})
+    lines = ndjson(body)
+    assert lines[1] == {'error': 'upstream unavailable', 'month': 2, 'year': 2024}
+    assert [line.get('isoDate') for line in lines] == ['2024-01-31', None, '2024-03-01']
+
+
+def test_range_upstream_errors_keep_stream_complete(stub, port):
+    stub[0].error_rate = 1.0
+    response, body = get_range(port, **{'from': '2024-01-01', 'to': '2024-03-31'})
+    lines = ndjson(body)
+    assert [(line['month'], line['year']) for line in lines] == [(1, 2024), (2, 2024), (3, 2024)]
+    assert all('error' in line for line in lines)
+
+
+def test_range_failure_mid_stream_ends_with_error_line(port, monkeypatch):
+    def months(start, end):
+        yield 1, 2024
+        raise RuntimeError('month iteration failed')
+
+    monkeypatch.setattr(server, 'range_months', months)
+    monkeypatch.setattr(server, 'RANGE_CONCURRENCY', 1)
+    response, body = get_range(port, **{'from': '2024-01-30', 'to': '2024-02-02'})
+    lines = ndjson(body)
+    assert [line.get('isoDate') for line in lines[:-1]] == ['2024-01-30', '2024-01-31']
+    assert lines[-1] == {'error': 'month iteration failed'}
+
+
+@pytest.mark.parametrize('params, message', [
+    ({'from': '2024-01-01'}, 'required'),
+    ({'from': '2024-02-01', 'to': '2024-01-01'}, 'earlier'),
+    ({'from': '2024-01-01', 'to': '2024-13-01'}, 'Invalid date'),
+    ({'from': '2024-01-01', 'to': '2024-01-31', 'latitude': 'north'}, ''),
+    ({'from': '2024-01-01', 'to': '2024-01-31', 'method': 'unknown'}, ''),
+    ({'from': '2024-01-01', 'to': '2024-01-11'}, 'too long'),
+])
+def test_range_validation(stub, port, monkeypatch, params, message):
+    monkeypatch.setattr(server, 'RANGE_MAX_DAYS', 10)
+    response, body = get_range(port, **params)
+    assert response.getheader('Content-Type') == 'application/json'
+    assert message in json.loads(body)['error']
+    assert stub[0].stats()['requests'] == {}
+
+
+def test_coordinates_nearest_place(port):
+    response, body = request(port, 'GET', '/api/geo/coordinates?lat=21.42&lng=39.83')
+    assert response.status == 200
+    assert json.loads(body)['latitude'] == 21.42
+
+
+def test_coordinates_far_from_cities(port):
+    response, body = request(port, 'GET', '/api/geo/coordinates?lat=0&lng=0')
+    assert response.status == 200
+    assert json.loads(body) == {
+        'name': 'Определено по координатам', 'country': 'Неизвестно',
+        'latitude': 0.0, 'longitude': 0.0, 'value': 'custom-location',
+    }
+
+
+@pytest.mark.parametrize('query', ['lat=north&lng=39.8', 'lat=21.4&lng=1e999', 'lat=91&lng=0', 'lat=0&lng=181', 'lat=nan&lng=0'])
+def test_coordinates_rejects_invalid(port, query):
+    response, body = request(port, 'GET', f"/api/geo/coordinates?{query}")
+    assert response.status == 400
+    assert 'Invalid coordinates' in json.loads(body)['error']
+
+
+INDEX_HTML = ('<!doctype html><html>' + 'x' * 2000 + '</html>').encode('utf-8')
+LARGE_FILE = bytes(range(256)) * 64
+
+
+@pytest.fixture
+def static(tmp_path, monkeypatch):
+    """Таблица статических файлов из временного каталога вместо файлов сайта."""
+    (tmp_path / 'index.html').write_bytes(INDEX_HTML)
+    (tmp_path / 'large.bin').write_bytes(LARGE_FILE)
+    (tmp_path / '.git').mkdir()
+    (tmp_path / '.git' / 'HEAD').write_text('ref: refs/heads/main\n', encoding='utf-8')
+    site = StaticSite(str(tmp_path), ['index.html', 'large.bin'], memory_limit=4096)
+    monkeypatch.setattr(server, 'static_site', site)
+    return site
+
+
+def test_static_gzip(port, static):
+    response, body = request(port, 'GET', '/', headers={'Accept-Encoding': 'gzip'})
+    assert response.status == 200
+    assert response.getheader('Content-Encoding') == 'gzip'
+    assert response.getheader('Vary') == 'Accept-Encoding'
+    assert int(response.getheader('Content-Length')) == len(body) < len(INDEX_HTML)
+    assert gzip.decompress(body) == INDEX_HTML
+    assert response.getheader('ETag') == static.index.gzip_etag
+    response, body = request(port, 'GET', '/', headers={'Accept-Encoding': 'gzip;q=0'})
+    assert response.getheader('Content-Encoding') is None
+    assert body == INDEX_HTML
+
+
+@pytest.mark.parametrize('path, content', [('/index.html', INDEX_HTML), ('/large.bin', LARGE_FILE)])
+def test_static_range(port, static, path, content):
+    # large.bin больше memory_limit и отправляется через sendfile
+    size = len(content)
+    for header, start, end in [('bytes=0-9', 0, 9), ('bytes=100-', 100, size - 1), ('bytes=-16', size - 16, size - 1)]:
+        response, body = request(port, 'GET', path, headers={'Range': header, 'Accept-Encoding': 'gzip'})
+        assert response.status == 206
+        assert response.getheader('Content-Range') == f"bytes {start}-{end}/{size}"
+        assert response.getheader('Content-Encoding') is None
+        assert body == content[start:end + 1]
+        assert int(response.getheader('Content-Length')) == len(body)
+
+
+def test_static_unsatisfiable_range(port, static):
+    response, body = request(port, 'GET', '/large.bin', headers={'Range': f"bytes={len(LARGE_FILE)}-"})
+    assert response.status == 416
+    assert response.getheader('Content-Range') == f"bytes */{len(LARGE_FILE)}"
+    assert body == b''
+
+
+def test_static_if_range(port, static):
+    asset = static.lookup('/large.bin')
+    for validator in (asset.etag, asset.last_modified):
+        response, body = request(port, 'GET', '/large.bin', headers={'Range': 'bytes=0-9', 'If-Range': validator})
+        assert response.status == 206 and body == LARGE_FILE[:10]
+    # Файл изменился с момента частичной загрузки - отдается целиком
+    response, body = request(port, 'GET', '/large.bin', headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert response.status == 200
+    assert response.getheader('Content-Range') is None
+    assert body == LARGE_FILE
+
+
+def test_static_not_modified(port, static):
+    asset = static.lookup('/index.html')
+    for headers in ({'If-None-Match': asset.etag},
+                    {'If-None-Match': 'W/' + asset.gzip_etag, 'Accept-Encoding': 'gzip'},
+                    {'If-Modified-Since': asset.last_modified}):
+        response, body = request(port, 'GET', '/index.html', headers=headers)
+        assert response.status == 304
+        assert body == b''
+        assert response.getheader('Last-Modified') == asset.last_modified
+    response, body = request(port, 'GET', '/index.html', headers={'If-None-Match': '"other"'})
+    assert response.status == 200 and body == INDEX_HTML
+
+
+def test_static_head(port, static):
+    response, body = request(port, 'HEAD', '/large.bin')
+    assert response.status == 200
+    assert int(response.getheader('Content-Length')) == len(LARGE_FILE)
+    assert body == b''
+
+
+@pytest.mark.parametrize('path', ['/settings', '/city/mecca', '/index.html'])
+def test_static_spa_route(port, static, path):
+    response, body = request(port, 'GET', path)
+    assert response.status == 200
+    assert body == INDEX_HTML
+
+
+@pytest.mark.parametrize('path', ['/missing.js', '/css/missing.css', '/.git/HEAD', '/%2egit/HEAD', '/.env'])
+def test_static_missing_file(port, static, path):
+    response, body = request(port, 'GET', path)
+    assert response.status == 404
+    assert b'refs/heads' not in body
+
+
+def test_json_gzip_content_length(port):
+    response, body = request(port, 'GET', '/api/locations/popular', headers={'Accept-Encoding': 'gzip'})
+    assert response.status == 200
+    assert response.getheader('Content-Encoding') == 'gzip'
+    assert response.getheader('Vary') == 'Accept-Encoding'
+    assert int(response.getheader('Content-Length')) == len(body)
+    locations = json.loads(gzip.decompress(body))
+    response, plain = request(port, 'GET', '/api/locations/popular', headers={'Accept-Encoding': 'gzip;q=0'})
+    assert response.getheader('Content-Encoding') is None
+    assert int(response.getheader('Content-Length')) == len(plain) > len(body)
+    assert json.loads(plain) == locations
+
+
+def test_json_not_modified(stub, port):
+    path = '/api/prayer-times?latitude=21.42&longitude=39.83&date=2024-06-21'
+    for accept_encoding in ('identity', 'gzip'):
+        response, body = request(port, 'GET', path, headers={'Accept-Encoding': accept_encoding})
+        assert response.status == 200
+        etag = response.getheader('ETag')
+        for if_none_match in (etag, 'W/' + etag, f'"other", {etag}', '*'):
+            response, body = request(port, 'GET', path, headers={'If-None-Match': if_none_match, 'Accept-Encoding': accept_encoding})
+            assert response.status == 304
+            assert body == b''
+            assert response.getheader('ETag') == etag
+            assert response.getheader('Content-Length') is None
+    response, body = request(port, 'GET', path, headers={'If-None-Match': '"other"'})
+    assert response.status == 200 and json.loads(body)['times']
+    # Ошибки не отвечают 304, даже если ETag совпал
+    response, body = request(port, 'GET', '/api/geo/coordinates?lat=91&lng=0')
+    response, _ = request(port, 'GET', '/api/geo/coordinates?lat=91&lng=0', headers={'If-None-Match': response.getheader('ETag')})
+    assert response.status == 400
+
+
+def test_upstream_timezone_wins_for_cell(monkeypatch):
+    monkeypatch.setattr(server, 'api_cache', ResponseCache(view=server.public_response))
+    monkeypatch.setattr(server, 'upstream_timezones', {})
+    zone = {}
+
+    def fetch(latitude, longitude, month, year, method, school):
+        data = server.calculation.calendar_response(latitude, longitude, month, year, method, school)
+        for day in data['data']:
+            day['meta']['timezone'] = zone['name']
+        return data
+
+    monkeypatch.setattr(server, 'fetch_monthly_prayer_times_data', fetch)
+    assert server.location_timezone(37.39, -5.98) == 'Europe/Madrid'
+    # Пояс из ответа aladhan важнее локального определителя
+    zone['name'] = 'Africa/Ceuta'
+    server.load_monthly_prayer_times('37.39,-5.98', 37.39, -5.98, 6, 2024, 2, 0)
+    assert server.location_timezone(37.39, -5.98) == 'Africa/Ceuta'
+    # Имя, которого нет в tzdata, не запоминается
+    zone['name'] = 'Mars/Olympus_Mons'
+    server.load_monthly_prayer_times('41.39,2.17', 41.39, 2.17, 6, 2024, 2, 0)
+    assert server.location_timezone(41.39, 2.17) == 'Europe/Madrid'
@@ -0,0 +1,167 @@
+"""
+Объединение одновременных загрузок (prayer_core.singleflight): один вызов
+на ключ, общие результат и ошибка, отмена лидера в асинхронной версии.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prayer_core.singleflight import AsyncSingleFlight, SingleFlight
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def run_concurrently(flight, key, fn, count):
+    """Запускает count потоков с flight.do(key, fn): (результаты, ошибки)."""
+    results, errors = [], []
+
+    def worker():
+        try:
+            results.append(flight.do(key, fn))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def test_threads_share_one_call():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        release.wait()
+        return {'value': 42}
+
+    threads, results, errors = run_concurrently(flight, 'k', load, 5)
+    wait_for(lambda: flight.stats()['coalesced'] == 4)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+    assert not errors
+    assert len(results) == 5 and all(result is results[0] for result in results)
+    assert flight.stats() == {'leaders': 1, 'coalesced': 4, 'inFlight': 0}
+
+
+def test_threads_share_the_error():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def load():
+        release.wait()
+        raise OSError('upstream unavailable')
+
+    threads, results, errors = run_concurrently(flight, 'k', load, 3)
+    wait_for(lambda: flight.stats()['coalesced'] == 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert not results
+    assert [str(e) for e in errors] == ['upstream unavailable'] * 3
+    # После завершения ключ свободен: следующий вызов загружает заново
+    assert flight.do('k', lambda: 'fresh') == 'fresh'
+
+
+def test_threads_different_keys_do_not_wait():
+    flight = SingleFlight()
+    assert flight.do('a', lambda: 1) == 1
+    assert flight.do('b', lambda: 2) == 2
+    assert flight.stats()['leaders'] == 2
+
+
+def test_async_shares_one_call():
+    async def main():
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def load():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {'value': 42}
+
+        results = await asyncio.gather(*(flight.do('k', load) for _ in range(5)))
+        assert calls == [1]
+        assert all(result is results[0] for result in results)
+        assert flight.stats() == {'leaders': 1, 'coalesced': 4, 'inFlight': 0}
+
+    asyncio.run(main())
+
+
+def test_async_shares_the_error():
+    async def main():
+        flight = AsyncSingleFlight()
+
+        async def load():
+            await asyncio.sleep(0.01)
+            raise OSError('upstream unavailable')
+
+        results = await asyncio.gather(*(flight.do('k', load) for _ in range(3)), return_exceptions=True)
+        assert [str(e) for e in results] == ['upstream unavailable'] * 3
+        assert flight.stats()['inFlight'] == 0
+
+    asyncio.run(main())
+
+
+def test_async_leader_cancellation_does_not_cancel_waiters():
+    async def main():
+        flight = AsyncSingleFlight()
+        release = asyncio.Event()
+        calls = []
+
+        async def load():
+            calls.append(1)
+            await release.wait()
+            return 'month'
+
+        leader = asyncio.ensure_future(flight.do('k', load))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(flight.do('k', load))
+        await asyncio.sleep(0)
+        # Клиент лидера отключился (например, потоковый ответ за период)
+        leader.cancel()
+        await asyncio.sleep(0)
+        assert leader.cancelled()
+        release.set()
+        assert await waiter == 'month'
+        assert calls == [1]
+
+    asyncio.run(main())
+
+
+def test_async_load_finishes_when_every_caller_cancelled():
+    async def main():
+        flight = AsyncSingleFlight()
+        done = asyncio.Event()
+
+        async def load():
+            await asyncio.sleep(0.01)
+            done.set()
+            return 'month'
+
+        caller = asyncio.ensure_future(flight.do('k', load))
+        await asyncio.sleep(0)
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        # Загрузка доводится до конца (и заполняет кэш) без ожидающих
+        await asyncio.wait_for(done.wait(), 1)
+        await asyncio.sleep(0)
+        assert flight.stats()['inFlight'] == 0
+
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+"""
+Статические файлы prayer_core.static: разбор Range, условные запросы
+и таблица маршрутов с откатом на index.html.
+"""
+
+import os
+import sys
+from email.utils import formatdate
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prayer_core.static import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, StaticSite, parse_range
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes=0-99', (0, 100)),
+    ('bytes=10-', (10, 990)),
+    ('bytes=-100', (900, 100)),
+    ('bytes=-5000', (0, 1000)),
+    ('bytes=900-5000', (900, 100)),
+    ('bytes=999-999', (999, 1)),
+    ('bytes=1000-', 'invalid'),
+    ('bytes=5-4', 'invalid'),
+    ('bytes=-0', 'invalid'),
+    # Игнорируются: нет заголовка, другие единицы, несколько диапазонов, мусор
+    (None, None),
+    ('items=0-1', None),
+    ('bytes=0-1,5-6', None),
+    ('bytes=a-b', None),
+    ('bytes=10', None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.fixture
+def site(tmp_path):
+    (tmp_path / 'index.html').write_text('<html>' + 'x' * 500 + '</html>', encoding='utf-8')
+    (tmp_path / 'assets').mkdir()
+    (tmp_path / 'assets' / 'index-CfF1guBF.js').write_text('console.log(1);' * 100, encoding='utf-8')
+    (tmp_path / 'large.bin').write_bytes(os.urandom(4096))
+    # Не публикуются: каталог вне списка и скрытые файлы внутри разрешенного
+    (tmp_path / '.git').mkdir()
+    (tmp_path / '.git' / 'HEAD').write_text('ref: refs/heads/main\n', encoding='utf-8')
+    (tmp_path / 'assets' / '.cache').mkdir()
+    (tmp_path / 'assets' / '.cache' / 'build.json').write_text('{}', encoding='utf-8')
+    (tmp_path / 'assets' / '.env').write_text('SECRET=1', encoding='utf-8')
+    return StaticSite(str(tmp_path), ['index.html', 'assets', 'large.bin'], memory_limit=1024)
+
+
+def test_assets(site):
+    index = site.lookup('/index.html')
+    assert site.lookup('/') is index
+    assert index.content_type == 'text/html; charset=utf-8'
+    assert index.cache_control == REVALIDATE_CACHE_CONTROL
+    assert index.gzip_body is not None
+    script = site.lookup('/assets/index-CfF1guBF.js')
+    assert script.cache_control == IMMUTABLE_CACHE_CONTROL
+    # Большой файл не держится в памяти, ETag - по размеру и времени изменения
+    large = site.lookup('/large.bin')
+    assert large.body is None
+    assert large.etag == f'"{large.size:x}-{large.mtime:x}"'
+    assert site.stats()['files'] == 3
+
+
+@pytest.mark.parametrize('path', ['/about', '/settings/location', '/missing-route'])
+def test_lookup_spa_route(site, path):
+    assert site.lookup(path) is site.lookup('/index.html')
+
+
+@pytest.mark.parametrize('path', ['/missing.js', '/assets/other.css', '/.git/HEAD', '/.git', '/assets/.env', '/assets/.cache/build.json'])
+def test_lookup_missing_file(site, path):
+    assert site.lookup(path) is None
+
+
+def test_not_modified(site):
+    asset = site.lookup('/index.html')
+    assert asset.not_modified(asset.etag, None)
+    assert asset.not_modified(asset.gzip_etag, None)
+    assert asset.not_modified('"other", W/' + asset.etag, None)
+    assert asset.not_modified('*', None)
+    assert not asset.not_modified('"other"', None)
+    assert asset.not_modified(None, asset.last_modified)
+    assert asset.not_modified(None, formatdate(asset.mtime + 60, usegmt=True))
+    assert not asset.not_modified(None, formatdate(asset.mtime - 60, usegmt=True))
+    assert not asset.not_modified(None, 'yesterday')
+    # If-None-Match важнее If-Modified-Since
+    assert not asset.not_modified('"other"', asset.last_modified)
@@ -0,0 +1,220 @@
+"""
+Определение часового пояса по координатам (prayer_core.timezones):
+встроенная сетка поясов, границы поясов из файла, город из справочника
+рядом с точкой и морской пояс вдали от суши.
+"""
+
+import json
+import os
+import sys
+import zipfile
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prayer_core import calculation, gazetteer, timezones
+
+PHOENIX = (33.4484, -112.0740)
+SALT_LAKE_CITY = (40.7608, -111.8910)
+SEVILLE = (37.3891, -5.9845)
+
+# Точки и их пояса по timezone-boundary-builder
+CITIES = [
+    (*SEVILLE, 'Europe/Madrid'),
+    (39.7684, -86.1581, 'America/Indiana/Indianapolis'),
+    (39.7392, -104.9903, 'America/Denver'),
+    (38.5816, -121.4944, 'America/Los_Angeles'),
+    (*PHOENIX, 'America/Phoenix'),
+    (*SALT_LAKE_CITY, 'America/Denver'),
+    (49.8397, 24.0297, 'Europe/Kyiv'),
+    (69.6492, 18.9553, 'Europe/Oslo'),
+    (21.4225, 39.8262, 'Asia/Riyadh'),
+    (-33.87, 151.21, 'Australia/Sydney'),
+    (55.7558, 37.6173, 'Europe/Moscow'),
+    (41.0082, 28.9784, 'Europe/Istanbul'),
+    # Города у границ поясов
+    (31.7619, -106.4850, 'America/Denver'),
+    (31.6904, -106.4245, 'America/Ciudad_Juarez'),
+    (37.9716, -87.5711, 'America/Chicago'),
+    (42.3314, -83.0458, 'America/Detroit'),
+    (43.5460, -96.7313, 'America/Chicago'),
+    (46.8083, -100.7837, 'America/Chicago'),
+    (52.2297, 21.0122, 'Europe/Warsaw'),
+    (47.0105, 28.8638, 'Europe/Chisinau'),
+    (67.8558, 20.2253, 'Europe/Stockholm'),
+    (-54.8019, -68.3030, 'America/Argentina/Ushuaia'),
+]
+
+
+@pytest.fixture
+def default_resolver():
+    """Определитель процесса по умолчанию (встроенная сетка поясов)."""
+    previous = timezones._resolver
+    timezones.configure(None)
+    yield timezones.default_resolver()
+    timezones.configure(previous)
+
+
+@pytest.fixture
+def places_resolver():
+    """Определитель без сетки и файла границ - только встроенный справочник."""
+    resolver = timezones.TimezoneResolver(places=gazetteer.load())
+    previous = timezones._resolver
+    timezones.configure(resolver)
+    yield resolver
+    timezones.configure(previous)
+
+
+@pytest.mark.parametrize('latitude, longitude, expected', CITIES)
+def test_default_resolver_zone(default_resolver, latitude, longitude, expected):
+    name, zone = calculation.resolve_timezone(latitude, longitude)
+    assert name == expected
+    assert zone.key == expected
+
+
+def test_default_resolver_keeps_dst(default_resolver):
+    # 1 июля 23:30 UTC - в Севилье уже 2 июля (CEST, UTC+2)
+    moment = datetime(2024, 7, 1, 23, 30, tzinfo=timezone.utc).timestamp()
+    name, _ = calculation.resolve_timezone(*SEVILLE)
+    day, minutes = timezones.local_time(name, moment)
+    assert (day.isoformat(), minutes) == ('2024-07-02', 90)
+    # Денвер летом UTC-6, Финикс без летнего времени - UTC-7
+    assert timezones.zone_table(calculation.resolve_timezone(39.7392, -104.9903)[0]).utc_offset(moment) == -6 * 3600
+    assert timezones.zone_table(calculation.resolve_timezone(*PHOENIX)[0]).utc_offset(moment) == -7 * 3600
+
+
+@pytest.mark.parametrize('latitude, longitude, expected', [
+    # Вдали от суши - морской пояс по долготе
+    (0.0, 0.0, 'UTC'),
+    (-40.0, -120.0, 'Etc/GMT+8'),
+    (30.0, 170.0, 'Etc/GMT-11'),
+    (-60.0, 100.0, 'Etc/GMT-7'),
+])
+def test_open_sea_uses_nautical_zone(default_resolver, latitude, longitude, expected):
+    assert default_resolver.timezone_at(latitude, longitude) is None
+    assert calculation.resolve_timezone(latitude, longitude)[0] == expected
+
+
+@pytest.mark.parametrize('latitude, longitude, expected', [
+    # Прибрежные воды у суши получают пояс берега
+    (36.40, -6.40, 'Europe/Madrid'),
+    (59.90, 29.70, 'Europe/Moscow'),
+])
+def test_coastal_water_uses_land_zone(default_resolver, latitude, longitude, expected):
+    assert default_resolver.timezone_at(latitude, longitude) == expected
+
+
+@pytest.mark.parametrize('latitude, longitude', [(90, 0), (-90, 0), (0, 180), (0, -180), (89.9999999, 179.9999999)])
+def test_grid_edges_do_not_fail(default_resolver, latitude, longitude):
+    default_resolver.timezone_at(latitude, longitude)
+
+
+@pytest.mark.parametrize('latitude, longitude, expected', [
+    (21.4225, 39.8262, 'Asia/Riyadh'),
+    # ~30 км от центра Берлина
+    (52.52, 13.85, 'Europe/Berlin'),
+    (*SEVILLE, 'Europe/Madrid'),
+    (39.7684, -86.1581, 'America/Indiana/Indianapolis'),
+    (69.6492, 18.9553, 'Europe/Oslo'),
+])
+def test_nearby_city_zone(places_resolver, latitude, longitude, expected):
+    assert calculation.resolve_timezone(latitude, longitude)[0] == expected
+
+
+def test_far_from_places_uses_nautical_zone(places_resolver):
+    assert places_resolver.timezone_at(0.0, -150.0) is None
+    assert calculation.resolve_timezone(0.0, -150.0)[0] == 'Etc/GMT+10'
+
+
+def test_explicit_timezone_wins(places_resolver):
+    assert calculation.resolve_timezone(*PHOENIX, timezone='America/Phoenix')[0] == 'America/Phoenix'
+    # Неизвестное имя - как если бы пояс не был передан
+    assert calculation.resolve_timezone(0.0, -150.0, timezone='Not/AZone')[0] == 'Etc/GMT+10'
+
+
+def rectangle(west, south, east, north):
+    return [[west, south], [east, south], [east, north], [west, north], [west, south]]
+
+
+BOUNDARIES = {
+    'type': 'FeatureCollection',
+    'features': [
+        {'type': 'Feature', 'properties': {'tzid': 'America/Phoenix'},
+         'geometry': {'type': 'Polygon', 'coordinates': [rectangle(-114.8, 31.3, -109.05, 37.0)]}},
+        {'type': 'Feature', 'properties': {'tzid': 'America/Denver'},
+         'geometry': {'type': 'MultiPolygon', 'coordinates': [
+             [rectangle(-114.05, 37.0, -109.05, 42.0)],
+             [rectangle(-109.05, 37.0, -102.05, 41.0)],
+         ]}},
+    ],
+}
+
+
+@pytest.mark.parametrize('suffix', ['.json', '.zip'])
+def test_boundaries(tmp_path, suffix):
+    path = tmp_path / ('timezones' + suffix)
+    if suffix == '.zip':
+        with zipfile.ZipFile(path, 'w') as archive:
+            archive.writestr('combined.json', json.dumps(BOUNDARIES))
+    else:
+        path.write_text(json.dumps(BOUNDARIES), encoding='utf-8')
+    resolver = timezones.TimezoneResolver(timezones.read_boundaries(str(path)), places=gazetteer.load())
+    assert len(resolver) == 2
+    assert resolver.timezone_at(*PHOENIX) == 'America/Phoenix'
+    assert resolver.timezone_at(*SALT_LAKE_CITY) == 'America/Denver'
+    assert resolver.timezone_at(39.74, -104.99) == 'America/Denver'
+    # Точки у границы штатов по обе стороны от 37° с.ш.
+    assert resolver.timezone_at(36.99, -111.5) == 'America/Phoenix'
+    assert resolver.timezone_at(37.01, -111.5) == 'America/Denver'
+    # Вне границ - город из справочника рядом или ничего
+    assert resolver.timezone_at(21.4225, 39.8262) == 'Asia/Riyadh'
+    assert resolver.timezone_at(0.0, -150.0) is None
+
+
+def test_grid_round_trip(tmp_path):
+    path = tmp_path / 'timezones.json'
+    path.write_text(json.dumps(BOUNDARIES), encoding='utf-8')
+    zones = timezones.read_boundaries(str(path))
+    # Морской пояс в границах не попадает в сетку
+    zones.append(('Etc/GMT+8', [rectangle(-127.5, 20.0, -112.5, 30.0)]))
+    names, cells, nodes = timezones.build_grid(zones, depth=6)
+    assert names == ['America/Phoenix', 'America/Denver']
+    grid_path = str(tmp_path / 'timezones.grid')
+    timezones.write_grid(grid_path, names, cells, nodes, depth=6)
+    grid = timezones.ZoneGrid(grid_path)
+    assert len(grid) == 2 and grid.depth == 6
+    assert grid.timezone_at(*PHOENIX) == 'America/Phoenix'
+    assert grid.timezone_at(*SALT_LAKE_CITY) == 'America/Denver'
+    assert grid.timezone_at(39.74, -104.99) == 'America/Denver'
+    # Граница на 37° с.ш. совпадает с делением ячеек: точно по обе стороны
+    assert grid.timezone_at(37.0 - 1e-6, -111.5) == 'America/Phoenix'
+    assert grid.timezone_at(37.0, -111.5) == 'America/Denver'
+    assert grid.timezone_at(25.0, -120.0) is None
+    # Ячейка с одним поясом и морем целиком относится к поясу
+    assert grid.timezone_at(31.05, -114.5) == 'America/Phoenix'
+    # Границы из файла важнее сетки, сетка - справочника
+    resolver = timezones.TimezoneResolver(
+        [('America/Denver', [rectangle(-112.7, 33.1, -111.3, 33.9)])], places=gazetteer.load(), grid=grid,
+    )
+    assert resolver.timezone_at(*PHOENIX) == 'America/Denver'
+    assert resolver.timezone_at(32.5, -111.5) == 'America/Phoenix'
+    assert resolver.timezone_at(21.4225, 39.8262) == 'Asia/Riyadh'
+
+
+def test_grid_rejects_foreign_file(tmp_path):
+    path = tmp_path / 'other.grid'
+    path.write_bytes(b'\0' * 64)
+    with pytest.raises(ValueError):
+        timezones.ZoneGrid(str(path))
+
+
+def test_zone_table_matches_zoneinfo():
+    table = timezones.ZoneTable('Europe/Berlin', 2024, 2024)
+    zone = ZoneInfo('Europe/Berlin')
+    # Переход на летнее время 31 марта 2024 в 01:00 UTC
+    transition = datetime(2024, 3, 31, 1, tzinfo=timezone.utc).timestamp()
+    for timestamp in (transition - 1, transition, transition + 3600, datetime(2024, 12, 31, 23, tzinfo=timezone.utc).timestamp()):
+        local = datetime.fromtimestamp(timestamp, zone)
+        assert table.local_time(timestamp) == (local.date(), local.hour * 60 + local.minute)